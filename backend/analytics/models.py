@@ -0,0 +1,76 @@
+from django.db import models
+from decimal import Decimal
+
+
+class SalesRollup(models.Model):
+    """
+    Sales totals for one product in one hour or day (UTC).
+    Rows are incremented as orders are paid, fulfilled and refunded, so
+    reports never have to scan the order history.
+    """
+    GRANULARITY_CHOICES = (
+        ('HOUR', 'Hour'),
+        ('DAY', 'Day'),
+    )
+    
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    product = models.ForeignKey(
+        'products.Product',
+        on_delete=models.CASCADE,
+        related_name='sales_rollups'
+    )
+    # Denormalized from the product so platform reports need no join
+    platform = models.ForeignKey(
+        'products.Platform',
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='sales_rollups'
+    )
+    
+    # Counted when orders are paid. Revenue and refunds are the amounts
+    # charged, after cashback, shared across an order's items
+    order_lines = models.PositiveIntegerField(default=0)
+    units_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    
+    # Counted when orders are fulfilled
+    units_fulfilled = models.PositiveIntegerField(default=0)
+    cashback_earned = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    
+    # Counted when orders are refunded
+    units_refunded = models.PositiveIntegerField(default=0)
+    refunds = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    
+    class Meta:
+        unique_together = ('granularity', 'bucket', 'product')
+        indexes = [
+            models.Index(fields=['granularity', 'platform', 'bucket']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} {self.granularity} {self.bucket:%Y-%m-%d %H:00}"
+
+
+class SalesEvent(models.Model):
+    """
+    Ledger of order status changes already counted in the rollups,
+    so reprocessing an order never counts it twice.
+    """
+    EVENT_CHOICES = (
+        ('PAID', 'Paid'),
+        ('FULFILLED', 'Fulfilled'),
+        ('REFUNDED', 'Refunded'),
+    )
+    
+    # Not a foreign key, so the ledger outlives orders moved to the archive
+    order_id = models.UUIDField()
+    event = models.CharField(max_length=10, choices=EVENT_CHOICES)
+    occurred_at = models.DateTimeField()
+    processed_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ('order_id', 'event')
+    
+    def __str__(self):
+        return f"{self.order_id} - {self.event}"
@@ -0,0 +1,237 @@
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Q, Sum
+from products.models import Product
+from .models import SalesRollup, SalesEvent
+
+
+ROLLUP_FIELDS = (
+    'order_lines', 'units_sold', 'revenue',
+    'units_fulfilled', 'cashback_earned',
+    'units_refunded', 'refunds',
+)
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+
+def order_events(order):
+    """Return the (event, occurred_at) status changes an order has gone through."""
+    events = []
+    if order.paid_at:
+        events.append(('PAID', order.paid_at))
+    if order.fulfilled_at:
+        events.append(('FULFILLED', order.fulfilled_at))
+    if order.status == 'REFUNDED':
+        events.append(('REFUNDED', order.refunded_at or order.updated_at))
+    return events
+
+
+def floor_hour(moment):
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(moment):
+    return floor_hour(moment).replace(hour=0)
+
+
+def _allocate(amount, weights):
+    """Split amount across weights to the cent, giving the remainder to the last share."""
+    total = sum(weights)
+    if not amount or not total:
+        return [Decimal('0.00')] * len(weights)
+
+    shares = [(amount * weight / total).quantize(Decimal('0.01')) for weight in weights]
+    shares[-1] += amount - sum(shares)
+    return shares
+
+
+def _item_changes(order, event, items):
+    """Yield (item, {field: delta}) for an order event."""
+    totals = [item.price * item.quantity for item in items]
+
+    if event == 'PAID':
+        # Revenue is what was charged: the order total after cashback,
+        # shared out by item total
+        revenue = _allocate(Decimal(order.total), totals)
+        for item, share in zip(items, revenue):
+            yield item, {'order_lines': 1, 'units_sold': item.quantity, 'revenue': share}
+
+    elif event == 'FULFILLED':
+        # Cashback is earned per order, so it is shared out by item total
+        cashback = _allocate(Decimal(order.cashback_earned), totals)
+        for item, share in zip(items, cashback):
+            yield item, {'units_fulfilled': item.quantity, 'cashback_earned': share}
+
+    elif event == 'REFUNDED':
+        refunds = _allocate(Decimal(order.total), totals)
+        for item, share in zip(items, refunds):
+            yield item, {'units_refunded': item.quantity, 'refunds': share}
+
+
+def apply_order_events(orders):
+    """
+    Count the events of `orders` (with items prefetched) that are not in the
+    ledger yet, adding them to the hourly and daily rollups in one transaction.
+    Raises IntegrityError if another process counted one of them first.
+    Returns the number of events counted.
+    """
+    orders = list(orders)
+    counted = set(
+        SalesEvent.objects.filter(order_id__in=[order.id for order in orders]).values_list('order_id', 'event')
+    )
+
+    events = []
+    deltas = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+    for order in orders:
+        items = list(order.items.all())
+        for event, occurred_at in order_events(order):
+            if (order.id, event) in counted:
+                continue
+
+            events.append(SalesEvent(order_id=order.id, event=event, occurred_at=occurred_at))
+            hour = floor_hour(occurred_at)
+            for item, changes in _item_changes(order, event, items):
+                for key in (('HOUR', hour, item.product_id), ('DAY', floor_day(hour), item.product_id)):
+                    row = deltas[key]
+                    for field, value in changes.items():
+                        row[field] += value
+
+    if not events:
+        return 0
+
+    with transaction.atomic():
+        # The ledger's unique constraint stops a concurrent run double counting
+        SalesEvent.objects.bulk_create(events)
+        _add_to_rollups(deltas)
+
+    return len(events)
+
+
+def _add_to_rollups(deltas):
+    """Add {(granularity, bucket, product_id): {field: delta}} to the rollup rows."""
+    product_ids = {product_id for _, _, product_id in deltas}
+    buckets = {bucket for _, bucket, _ in deltas}
+
+    existing = {
+        (row.granularity, row.bucket, row.product_id): row
+        for row in SalesRollup.objects.select_for_update().filter(
+            product_id__in=product_ids, bucket__in=buckets
+        ).order_by('id')
+    }
+    platforms = dict(
+        Product.objects.filter(id__in=product_ids).values_list('id', 'platform_id')
+    )
+
+    to_update = []
+    to_create = []
+    for key, changes in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            granularity, bucket, product_id = key
+            to_create.append(SalesRollup(
+                granularity=granularity,
+                bucket=bucket,
+                product_id=product_id,
+                platform_id=platforms.get(product_id),
+                **changes
+            ))
+        else:
+            for field, value in changes.items():
+                setattr(row, field, getattr(row, field) + value)
+            to_update.append(row)
+
+    SalesRollup.objects.bulk_update(to_update, ROLLUP_FIELDS, batch_size=1000)
+    SalesRollup.objects.bulk_create(to_create, batch_size=1000)
+
+
+def covering_filter(start, end):
+    """
+    Select the rollup rows covering [start, end), widened to whole hours:
+    daily rows for the whole days inside the range and hourly rows for
+    the partial days at either end.
+    """
+    start = floor_hour(start)
+    end = floor_hour(end) + HOUR if floor_hour(end) != end else end
+
+    first_day = floor_day(start) if floor_day(start) == start else floor_day(start) + DAY
+    last_day = floor_day(end)
+    if first_day >= last_day:
+        return Q(granularity='HOUR', bucket__gte=start, bucket__lt=end)
+
+    return (
+        Q(granularity='DAY', bucket__gte=first_day, bucket__lt=last_day)
+        | Q(granularity='HOUR', bucket__gte=start, bucket__lt=first_day)
+        | Q(granularity='HOUR', bucket__gte=last_day, bucket__lt=end)
+    )
+
+
+def _sums():
+    # Prefixed because annotations may not shadow model fields
+    return {f'sum_{field}': Sum(field) for field in ROLLUP_FIELDS}
+
+
+def _unprefix(row):
+    values = {key: value for key, value in row.items() if not key.startswith('sum_')}
+    for field in ROLLUP_FIELDS:
+        values[field] = row[f'sum_{field}'] or 0
+    return values
+
+
+GROUPINGS = {
+    'product': ('product_id', 'product__name'),
+    'platform': ('platform_id', 'platform__name'),
+}
+
+
+def sales_summary(start, end, group_by=None, product=None, platform=None):
+    """
+    Totals for [start, end), plus a breakdown by product or platform.
+    Returns (totals, rows).
+    """
+    rollups = SalesRollup.objects.filter(covering_filter(start, end))
+    if product is not None:
+        rollups = rollups.filter(product_id=product)
+    if platform is not None:
+        rollups = rollups.filter(platform_id=platform)
+
+    totals = _unprefix(rollups.aggregate(**_sums()))
+    if group_by is None:
+        return totals, []
+
+    rows = (
+        rollups.values(*GROUPINGS[group_by])
+        .annotate(**_sums())
+        .order_by('-sum_revenue')
+    )
+    return totals, [_unprefix(row) for row in rows]
+
+
+def sales_timeseries(start, end, granularity='DAY', product=None, platform=None):
+    """
+    Totals per hour or day in [start, end), including empty buckets.
+    """
+    step = HOUR if granularity == 'HOUR' else DAY
+    floor = floor_hour if granularity == 'HOUR' else floor_day
+    start = floor(start)
+    end = floor(end) + step if floor(end) != end else end
+
+    rollups = SalesRollup.objects.filter(granularity=granularity, bucket__gte=start, bucket__lt=end)
+    if product is not None:
+        rollups = rollups.filter(product_id=product)
+    if platform is not None:
+        rollups = rollups.filter(platform_id=platform)
+
+    found = {
+        row['bucket']: _unprefix(row)
+        for row in rollups.values('bucket').annotate(**_sums()).order_by('bucket')
+    }
+
+    series = []
+    bucket = start
+    while bucket < end:
+        series.append(found.get(bucket) or {'bucket': bucket, **dict.fromkeys(ROLLUP_FIELDS, 0)})
+        bucket += step
+    return series
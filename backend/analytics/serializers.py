@@ -0,0 +1,56 @@
+from datetime import timedelta
+from rest_framework import serializers
+
+
+class SalesQuerySerializer(serializers.Serializer):
+    """Query parameters of the sales reports."""
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+    product = serializers.IntegerField(required=False)
+    platform = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if data['end'] <= data['start']:
+            raise serializers.ValidationError("end must be after start.")
+        return data
+
+
+class SalesSummaryQuerySerializer(SalesQuerySerializer):
+    group_by = serializers.ChoiceField(choices=['product', 'platform'], required=False)
+
+
+class SalesTimeseriesQuerySerializer(SalesQuerySerializer):
+    interval = serializers.ChoiceField(choices=['hour', 'day'], default='day')
+
+    # Keeps hourly series to a size a dashboard can plot
+    max_hourly_range = timedelta(days=31)
+
+    def validate(self, data):
+        data = super().validate(data)
+        if data['interval'] == 'hour' and data['end'] - data['start'] > self.max_hourly_range:
+            raise serializers.ValidationError("Hourly series are limited to 31 days.")
+        return data
+
+
+class SalesTotalsSerializer(serializers.Serializer):
+    order_lines = serializers.IntegerField()
+    units_sold = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    units_fulfilled = serializers.IntegerField()
+    cashback_earned = serializers.DecimalField(max_digits=14, decimal_places=2)
+    units_refunded = serializers.IntegerField()
+    refunds = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class ProductSalesSerializer(SalesTotalsSerializer):
+    product_id = serializers.IntegerField()
+    product_name = serializers.CharField(source='product__name')
+
+
+class PlatformSalesSerializer(SalesTotalsSerializer):
+    platform_id = serializers.IntegerField(allow_null=True)
+    platform_name = serializers.CharField(source='platform__name', allow_null=True)
+
+
+class SalesBucketSerializer(SalesTotalsSerializer):
+    bucket = serializers.DateTimeField()
@@ -0,0 +1,18 @@
+from celery import shared_task
+from django.db import IntegrityError
+from orders.models import ArchivedOrder, Order
+from .rollups import apply_order_events
+
+
+@shared_task(autoretry_for=(IntegrityError,), retry_backoff=True, max_retries=5)
+def update_sales_rollups(order_id):
+    """
+    Add an order's new status changes to the sales rollups.
+    Safe to run more than once; already counted changes are skipped.
+    """
+    orders = Order.objects.filter(id=order_id).prefetch_related('items')
+    if not orders:
+        # Refunded after it was archived
+        orders = ArchivedOrder.objects.filter(id=order_id).prefetch_related('items')
+    counted = apply_order_events(orders)
+    return f"Counted {counted} sales events for order {order_id}"
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from orders.archive import archive_orders
+from orders.benchmarks import create_order, create_user
+from orders.models import Order
+from products.benchmarks import create_catalog
+from .models import SalesEvent, SalesRollup
+from .rollups import apply_order_events, covering_filter, sales_summary
+
+
+PAID_AT = datetime(2024, 3, 4, 10, 30, tzinfo=dt_timezone.utc)
+
+
+class SalesRollupTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.products = create_catalog(2, keys_per_product=0)
+
+    def paid_order(self, paid_at=PAID_AT, cashback_used=Decimal('0.00'), **fields):
+        order = create_order(self.user, self.products)
+        Order.objects.filter(pk=order.pk).update(
+            paid_at=paid_at, cashback_used=cashback_used, total=order.subtotal - cashback_used, **fields
+        )
+        return Order.objects.get(pk=order.pk)
+
+    def count(self, *orders):
+        return apply_order_events(Order.objects.filter(pk__in=[order.pk for order in orders]).prefetch_related('items'))
+
+    def rollups(self):
+        return {
+            (row.granularity, row.bucket, row.product_id): (row.order_lines, row.units_sold, row.revenue, row.units_refunded, row.refunds)
+            for row in SalesRollup.objects.all()
+        }
+
+    def test_events_are_added_to_hourly_and_daily_rows(self):
+        first = self.paid_order()
+        self.assertEqual(self.count(first), 1)
+        self.count(self.paid_order(paid_at=PAID_AT + timedelta(minutes=10)))
+
+        hour, day = PAID_AT.replace(minute=0), PAID_AT.replace(hour=0, minute=0)
+        product = self.products[0]
+        # Two orders of 19.99 in the same hour
+        expected = (2, 2, Decimal('39.98'), 0, Decimal('0.00'))
+        self.assertEqual(self.rollups()[('HOUR', hour, product.id)], expected)
+        self.assertEqual(self.rollups()[('DAY', day, product.id)], expected)
+        self.assertEqual(SalesRollup.objects.get(granularity='DAY', product=product).platform_id, product.platform_id)
+
+    def test_revenue_is_what_was_charged(self):
+        order = self.paid_order(cashback_used=Decimal('5.01'), status='REFUNDED', refunded_at=PAID_AT + timedelta(days=1))
+
+        self.assertEqual(self.count(order), 2)
+
+        totals, _ = sales_summary(PAID_AT - timedelta(days=1), PAID_AT + timedelta(days=2))
+        self.assertEqual(totals['revenue'], Decimal('34.97'))
+        self.assertEqual(totals['refunds'], Decimal('34.97'))
+        self.assertEqual(totals['units_refunded'], 2)
+
+    def test_events_are_counted_once(self):
+        order = self.paid_order()
+        self.count(order)
+        before = self.rollups()
+
+        self.assertEqual(self.count(order), 0)
+
+        Order.objects.filter(pk=order.pk).update(status='FULFILLED', fulfilled_at=PAID_AT + timedelta(hours=1))
+        self.assertEqual(self.count(order), 1)
+        self.assertEqual(
+            {key: value for key, value in self.rollups().items() if key in before},
+            before,
+        )
+
+    def test_covering_filter_counts_every_hour_once(self):
+        # One order in each partial day at the ends and one in the middle
+        moments = [
+            datetime(2024, 3, 4, 22, 15, tzinfo=dt_timezone.utc),
+            datetime(2024, 3, 5, 12, 0, tzinfo=dt_timezone.utc),
+            datetime(2024, 3, 6, 1, 59, tzinfo=dt_timezone.utc),
+        ]
+        self.count(*[self.paid_order(paid_at=moment) for moment in moments])
+        # Just outside the range
+        self.count(self.paid_order(paid_at=datetime(2024, 3, 4, 21, 59, tzinfo=dt_timezone.utc)))
+
+        start = datetime(2024, 3, 4, 22, 0, tzinfo=dt_timezone.utc)
+        end = datetime(2024, 3, 6, 1, 30, tzinfo=dt_timezone.utc)
+        rows = SalesRollup.objects.filter(covering_filter(start, end))
+
+        self.assertEqual(sum(row.units_sold for row in rows), 6)
+        self.assertEqual(
+            {(row.granularity, row.bucket) for row in rows},
+            {('HOUR', moments[0].replace(minute=0)), ('DAY', moments[1].replace(hour=0)), ('HOUR', moments[2].replace(minute=0))},
+        )
+
+        # A range inside one day reads hourly rows only
+        same_day = SalesRollup.objects.filter(covering_filter(moments[1] - timedelta(hours=2), moments[1] + timedelta(minutes=1)))
+        self.assertEqual({row.granularity for row in same_day}, {'HOUR'})
+
+    def test_backfill_is_idempotent(self):
+        orders = [self.paid_order(paid_at=PAID_AT - timedelta(days=days)) for days in (40, 1)]
+        self.paid_order(status='REFUNDED', refunded_at=PAID_AT)
+        # One order was counted as it was paid, one is archived
+        self.count(orders[1])
+        Order.objects.filter(pk=orders[0].pk).update(status='FULFILLED', fulfilled_at=PAID_AT - timedelta(days=40))
+        archive_orders([orders[0].id])
+
+        call_command('backfill_sales_rollups', stdout=StringIO())
+        counted = self.rollups()
+        self.assertEqual(SalesEvent.objects.count(), 5)
+
+        call_command('backfill_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), counted)
+
+        call_command('backfill_sales_rollups', rebuild=True, stdout=StringIO())
+        self.assertEqual(self.rollups(), counted)
@@ -0,0 +1,66 @@
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from .rollups import sales_summary, sales_timeseries
+from .serializers import (
+    SalesSummaryQuerySerializer, SalesTimeseriesQuerySerializer,
+    SalesTotalsSerializer, ProductSalesSerializer,
+    PlatformSalesSerializer, SalesBucketSerializer,
+)
+
+
+class SalesAnalyticsViewSet(viewsets.ViewSet):
+    """
+    API endpoint for sales reports, served from the hourly/daily rollups.
+    Only accessible by admin users.
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """
+        Sales totals for a date range, optionally broken down
+        by product or platform (?group_by=product|platform).
+        """
+        query = SalesSummaryQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        
+        totals, rows = sales_summary(
+            params['start'],
+            params['end'],
+            group_by=params.get('group_by'),
+            product=params.get('product'),
+            platform=params.get('platform'),
+        )
+        
+        row_serializer = PlatformSalesSerializer if params.get('group_by') == 'platform' else ProductSalesSerializer
+        return Response({
+            'start': params['start'],
+            'end': params['end'],
+            'totals': SalesTotalsSerializer(totals).data,
+            'results': row_serializer(rows, many=True).data,
+        })
+    
+    @action(detail=False, methods=['get'])
+    def timeseries(self, request):
+        """
+        Sales totals per hour or day (?interval=hour|day) for a date range.
+        """
+        query = SalesTimeseriesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        
+        series = sales_timeseries(
+            params['start'],
+            params['end'],
+            granularity=params['interval'].upper(),
+            product=params.get('product'),
+            platform=params.get('platform'),
+        )
+        
+        return Response({
+            'interval': params['interval'],
+            'results': SalesBucketSerializer(series, many=True).data,
+        })
@@ -0,0 +1,53 @@
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.request import Request
+from .renderers import ORJSONRenderer
+
+
+class AsyncAPIView(View):
+    """
+    Base class for async read endpoints served under ASGI.
+
+    Responses are rendered with the same JSON renderer as the API and API
+    exceptions are turned into the same error bodies DRF produces, so async
+    endpoints keep the JSON contract of the synchronous viewsets they mirror.
+    """
+    renderer = ORJSONRenderer()
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        raise exceptions.MethodNotAllowed(request.method)
+
+    def render(self, data, status=200, headers=None):
+        response = HttpResponse(
+            self.renderer.render(data),
+            content_type=self.renderer.media_type,
+            status=status,
+        )
+        # Same headers DRF adds when finalizing a response
+        response['Allow'] = ', '.join(self._allowed_methods())
+        response['Vary'] = 'Accept'
+        for name, value in (headers or {}).items():
+            response[name] = value
+        return response
+
+    def handle_exception(self, exc):
+        headers = {}
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            headers['WWW-Authenticate'] = 'Bearer realm="api"'
+
+        if isinstance(exc.detail, (list, dict)):
+            data = exc.detail
+        else:
+            data = {'detail': exc.detail}
+        return self.render(data, status=exc.status_code, headers=headers)
+
+    def drf_request(self, request):
+        """Wrap the request so DRF filter backends and serializers can use it."""
+        return Request(request)
@@ -0,0 +1,100 @@
+import platform
+import statistics
+import sys
+import time
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+
+# Benchmarks by name, filled from each app's benchmarks.py
+BENCHMARKS = {}
+
+
+class Rollback(Exception):
+    pass
+
+
+def benchmark(name):
+    """
+    Register a benchmark. The decorated function takes the number of runs
+    and yields one zero-argument callable per run; only the callables are
+    timed, so fixtures can be built before each one. Everything runs in a
+    transaction that is rolled back afterwards.
+
+        @benchmark('products.detail_serializer')
+        def detail_serializer(runs):
+            product = ...
+            for _ in range(runs):
+                yield lambda: ProductDetailSerializer(product).data
+    """
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def load_benchmarks():
+    autodiscover_modules('benchmarks')
+    return BENCHMARKS
+
+
+def run_benchmark(func, rounds, warmup=2):
+    """
+    Time `rounds` runs of a benchmark after `warmup` untimed ones. The
+    query count comes from the last warmup run, since capturing queries
+    slows down the timed ones.
+    """
+    timings = []
+    queries = 0
+    try:
+        with transaction.atomic():
+            for index, run in enumerate(func(warmup + rounds)):
+                if index < warmup:
+                    with CaptureQueriesContext(connection) as captured:
+                        run()
+                    queries = len(captured)
+                    continue
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            raise Rollback
+    except Rollback:
+        pass
+
+    return {
+        'rounds': len(timings),
+        'queries': queries,
+        'min_ms': round(min(timings), 4),
+        'median_ms': round(statistics.median(timings), 4),
+        'mean_ms': round(statistics.mean(timings), 4),
+        'max_ms': round(max(timings), 4),
+        'stdev_ms': round(statistics.stdev(timings), 4) if len(timings) > 1 else 0.0,
+    }
+
+
+def environment():
+    """Where the results were measured, stored with every result file."""
+    return {
+        'created_at': timezone.now().isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'database': connection.vendor,
+    }
+
+
+def compare_results(baseline, current, threshold):
+    """
+    Compare two result files. A benchmark regresses when its median time
+    grows by more than `threshold` percent or it makes more queries.
+    Returns [(name, baseline_result, current_result, change_percent, regressed)].
+    """
+    rows = []
+    for name in sorted(set(baseline['results']) & set(current['results'])):
+        old = baseline['results'][name]
+        new = current['results'][name]
+        change = (new['median_ms'] - old['median_ms']) / old['median_ms'] * 100 if old['median_ms'] else 0.0
+        regressed = change > threshold or new['queries'] > old['queries']
+        rows.append((name, old, new, change, regressed))
+    return rows
@@ -0,0 +1,67 @@
+import os
+import time
+from celery.signals import (
+    before_task_publish, task_prerun, task_postrun, worker_init, worker_process_shutdown,
+)
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from prometheus_client import multiprocess, start_http_server
+from .metrics import TASK_WAIT, TASK_RUNTIME, TASKS, clear_multiprocess_dir, get_registry
+
+
+# Start times of the tasks running in this process, by task id
+_started = {}
+
+
+def _queue(task):
+    return (task.request.delivery_info or {}).get('routing_key') or 'default'
+
+
+@before_task_publish.connect
+def stamp_enqueue_time(headers=None, **kwargs):
+    # Read back by workers as task.request.enqueued_at
+    if headers is not None:
+        headers['enqueued_at'] = time.time()
+
+
+@task_prerun.connect
+def record_task_start(task_id=None, task=None, **kwargs):
+    now = time.time()
+    _started[task_id] = time.perf_counter()
+
+    enqueued_at = getattr(task.request, 'enqueued_at', None)
+    if enqueued_at is None:
+        # Eager tasks and messages from older publishers carry no stamp
+        return
+    # A countdown or ETA is intended delay, not time spent waiting for a worker
+    eta = task.request.eta
+    if eta:
+        eta = parse_datetime(eta) if isinstance(eta, str) else eta
+        enqueued_at = max(enqueued_at, eta.timestamp())
+    TASK_WAIT.labels(task.name, _queue(task)).observe(max(now - enqueued_at, 0))
+
+
+@task_postrun.connect
+def record_task_end(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    queue = _queue(task)
+    if started is not None:
+        TASK_RUNTIME.labels(task.name, queue).observe(time.perf_counter() - started)
+    TASKS.labels(task.name, queue, (state or 'unknown').lower()).inc()
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    """
+    Runs in the worker's main process before the pool starts, so stale
+    metric files can be cleared and the children's files are all served.
+    """
+    clear_multiprocess_dir()
+    if settings.CELERY_METRICS_PORT:
+        start_http_server(settings.CELERY_METRICS_PORT, registry=get_registry())
+
+
+@worker_process_shutdown.connect
+def mark_worker_process_dead(pid=None, **kwargs):
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -0,0 +1,257 @@
+import functools
+import hashlib
+import json
+import secrets
+import threading
+import time
+import zlib
+from collections import namedtuple
+from datetime import timedelta
+import redis
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+# A response stored for a key; body is zlib compressed
+StoredResponse = namedtuple('StoredResponse', 'fingerprint status_code content_type body')
+
+# The first request with a key is still running
+Locked = namedtuple('Locked', 'fingerprint')
+
+
+def digest(value):
+    return hashlib.blake2b(value.encode('utf-8'), digest_size=16).hexdigest()
+
+
+# Deletes the lock in KEYS[1] only if it still holds ARGV[1], so a request
+# whose lock expired cannot drop the lock of the request that took over
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Stores the response ARGV[2] for ARGV[3] seconds only if KEYS[1] still
+# holds the lock ARGV[1], so a request whose lock expired cannot overwrite
+# the entry of the request that took over
+FINISH_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+class RedisIdempotencyStore:
+    """
+    One string per key: b'L' + fingerprint + token while the first request
+    runs, then b'R' + fingerprint + status + content type + body. Both
+    expire on their own.
+    """
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+        self.release_script = self.client.register_script(RELEASE_SCRIPT)
+        self.finish_script = self.client.register_script(FINISH_SCRIPT)
+
+    def _key(self, key):
+        return f'idempotency:{key}'
+
+    def begin(self, key, fingerprint, token):
+        """Take the lock and return None, or return the current entry."""
+        lock = f'L{fingerprint}{token}'.encode()
+        timeout = settings.IDEMPOTENCY_LOCK_TIMEOUT
+        if self.client.set(self._key(key), lock, nx=True, ex=timeout):
+            return None
+
+        value = self.client.get(self._key(key))
+        if value is None:
+            # Expired since the SET; the caller tries again
+            return Locked(fingerprint)
+        if value[:1] == b'L':
+            return Locked(value[1:33].decode())
+        header, body = value[1:].split(b'\n', 1)
+        fingerprint, status_code, content_type = header.decode().split(' ', 2)
+        return StoredResponse(fingerprint, int(status_code), content_type, body)
+
+    def finish(self, key, fingerprint, token, stored):
+        value = f'R{stored.fingerprint} {stored.status_code} {stored.content_type}\n'.encode() + stored.body
+        self.finish_script(
+            keys=[self._key(key)],
+            args=[f'L{fingerprint}{token}', value, settings.IDEMPOTENCY_KEY_TTL],
+        )
+
+    def abort(self, key, fingerprint, token):
+        self.release_script(keys=[self._key(key)], args=[f'L{fingerprint}{token}'])
+
+
+class DatabaseIdempotencyStore:
+    """Keys as IdempotencyKey rows, for when Redis is not available."""
+
+    def begin(self, key, fingerprint, token):
+        now = timezone.now()
+        values = {
+            'fingerprint': fingerprint,
+            'lock_token': token,
+            'locked_until': now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT),
+            'expires_at': now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+        }
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(key=key, **values)
+            return None
+        except IntegrityError:
+            pass
+
+        # Take over an expired key, or a lock left behind by a request that died
+        taken = IdempotencyKey.objects.filter(
+            Q(expires_at__lte=now) | Q(status_code__isnull=True, locked_until__lte=now),
+            key=key,
+        ).update(status_code=None, content_type='', body=b'', **values)
+        if taken:
+            return None
+
+        entry = IdempotencyKey.objects.filter(key=key).first()
+        if entry is None:
+            # Deleted since the insert; the caller tries again
+            return Locked(fingerprint)
+        if entry.status_code is None:
+            return Locked(entry.fingerprint)
+        return StoredResponse(entry.fingerprint, entry.status_code, entry.content_type, bytes(entry.body))
+
+    def finish(self, key, fingerprint, token, stored):
+        IdempotencyKey.objects.filter(key=key, lock_token=token).update(
+            status_code=stored.status_code,
+            content_type=stored.content_type,
+            body=stored.body,
+            lock_token='',
+            locked_until=None,
+        )
+
+    def abort(self, key, fingerprint, token):
+        IdempotencyKey.objects.filter(key=key, lock_token=token, status_code__isnull=True).delete()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if settings.IDEMPOTENCY_BACKEND == 'database':
+                    _store = DatabaseIdempotencyStore()
+                else:
+                    _store = RedisIdempotencyStore(settings.IDEMPOTENCY_REDIS_URL)
+    return _store
+
+
+def begin(key, fingerprint, token):
+    """Return (store, entry) from Redis, or from the database if Redis is down."""
+    store = get_store()
+    try:
+        return store, store.begin(key, fingerprint, token)
+    except redis.RedisError:
+        store = DatabaseIdempotencyStore()
+        return store, store.begin(key, fingerprint, token)
+
+
+def release(store, key, fingerprint, token):
+    try:
+        store.abort(key, fingerprint, token)
+    except redis.RedisError:
+        # The lock expires after IDEMPOTENCY_LOCK_TIMEOUT anyway
+        pass
+
+
+def replay(stored):
+    response = HttpResponse(
+        zlib.decompress(stored.body), status=stored.status_code, content_type=stored.content_type
+    )
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """
+    Make a view method safe to retry with an Idempotency-Key header.
+
+    The response to the first request with a key is stored for
+    IDEMPOTENCY_KEY_TTL seconds and sent again, byte for byte, for every
+    retry with the same key from the same user to the same path. A retry
+    arriving while the first request still runs waits up to
+    IDEMPOTENCY_LOCK_WAIT seconds for its response. Keys reused with a
+    different body are rejected. Exceptions and 5xx responses are not
+    stored, so those requests can be retried.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        header = request.META.get(IDEMPOTENCY_HEADER)
+        if header is None:
+            return view_method(self, request, *args, **kwargs)
+        if not 0 < len(header) <= 255:
+            return Response(
+                {"error": "Idempotency-Key must be 1 to 255 characters long."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        user = request.user.pk if request.user and request.user.is_authenticated else ''
+        key = digest(f'{user}:{request.method}:{request.path}:{header}')
+        fingerprint = digest(json.dumps(request.data, sort_keys=True, default=str))
+        token = secrets.token_hex(16)
+
+        store, entry = begin(key, fingerprint, token)
+        deadline = time.monotonic() + settings.IDEMPOTENCY_LOCK_WAIT
+        while isinstance(entry, Locked) and entry.fingerprint == fingerprint and time.monotonic() < deadline:
+            time.sleep(0.05)
+            store, entry = begin(key, fingerprint, token)
+
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                return Response(
+                    {"error": "This Idempotency-Key was already used for a different request."},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if isinstance(entry, Locked):
+                return Response(
+                    {"error": "A request with this Idempotency-Key is still being processed."},
+                    status=status.HTTP_409_CONFLICT
+                )
+            return replay(entry)
+
+        try:
+            # Rendered here, so the stored bytes are the ones sent
+            response = self.finalize_response(request, view_method(self, request, *args, **kwargs), *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        except BaseException:
+            release(store, key, fingerprint, token)
+            raise
+
+        if response.status_code >= 500 or getattr(response, 'streaming', False):
+            release(store, key, fingerprint, token)
+            return response
+
+        stored = StoredResponse(
+            fingerprint, response.status_code, response['Content-Type'], zlib.compress(response.content)
+        )
+        try:
+            store.finish(key, fingerprint, token, stored)
+        except redis.RedisError:
+            # The response is still good; only a retry will run again
+            pass
+        return response
+
+    return wrapper
@@ -0,0 +1,47 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from api.benchmarking import environment, load_benchmarks, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the benchmarks registered in each app's benchmarks.py, recording time and "
+        "query counts. Fixtures are created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help="Run only benchmarks whose name contains one of these.")
+        parser.add_argument('--rounds', type=int, default=20, help="Timed runs per benchmark.")
+        parser.add_argument('--warmup', type=int, default=2, help="Untimed runs before timing.")
+        parser.add_argument('--output', help="Write the results to this JSON file, e.g. as a baseline.")
+        parser.add_argument('--list', action='store_true', help="List the benchmarks and exit.")
+
+    def handle(self, *args, **options):
+        benchmarks = load_benchmarks()
+        selected = sorted(
+            name for name in benchmarks
+            if not options['names'] or any(part in name for part in options['names'])
+        )
+        if options['list']:
+            for name in selected:
+                self.stdout.write(name)
+            return
+        if not selected:
+            raise CommandError("No benchmarks match.")
+        if options['rounds'] < 1 or options['warmup'] < 1:
+            raise CommandError("--rounds and --warmup must be at least 1.")
+
+        results = {}
+        for name in selected:
+            result = run_benchmark(benchmarks[name], options['rounds'], options['warmup'])
+            results[name] = result
+            self.stdout.write(
+                f"{name:<45} median {result['median_ms']:>9.3f} ms  "
+                f"min {result['min_ms']:>9.3f} ms  max {result['max_ms']:>9.3f} ms  "
+                f"{result['queries']:>4} queries"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({**environment(), 'results': results}, f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
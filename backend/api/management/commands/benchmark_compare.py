@@ -0,0 +1,48 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from api.benchmarking import compare_results
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare two benchmark result files. Fails if any benchmark's median time grew "
+        "by more than the threshold or it makes more queries than the baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('baseline', help="Results file to compare against.")
+        parser.add_argument('current', help="Results file of the change being checked.")
+        parser.add_argument('--threshold', type=float, default=10.0, help="Allowed slowdown in percent (default 10).")
+
+    def load(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+
+    def handle(self, *args, **options):
+        baseline = self.load(options['baseline'])
+        current = self.load(options['current'])
+        if baseline.get('database') != current.get('database'):
+            self.stderr.write(self.style.WARNING(
+                f"Results come from different databases ({baseline.get('database')} and "
+                f"{current.get('database')}); timings are not comparable."
+            ))
+
+        rows = compare_results(baseline, current, options['threshold'])
+        for name, old, new, change, regressed in rows:
+            line = (
+                f"{name:<45} {old['median_ms']:>9.3f} -> {new['median_ms']:>9.3f} ms ({change:+6.1f}%)  "
+                f"queries {old['queries']} -> {new['queries']}"
+            )
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+
+        for name in sorted(set(baseline['results']) ^ set(current['results'])):
+            where = 'baseline' if name in baseline['results'] else 'current results'
+            self.stdout.write(f"{name:<45} only in the {where}")
+
+        regressions = [row[0] for row in rows if row[4]]
+        if regressions:
+            raise CommandError(f"{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS(f"No regressions in {len(rows)} benchmarks"))
@@ -0,0 +1,55 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve
+from api.middleware import RequestMetricsMiddleware
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the time RequestMetricsMiddleware adds to a request, against a "
+        "view that returns a prepared response."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/products/', help="URL to resolve the route from.")
+        parser.add_argument('--iterations', type=int, default=100000)
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--budget-us', type=float, default=50.0, help="Allowed overhead per request in microseconds.")
+
+    def _time(self, handler, request, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            handler(request)
+        return (time.perf_counter() - started) / iterations
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get(options['path'])
+        request.resolver_match = resolve(options['path'])
+        response = HttpResponse(b'x' * 2048, content_type='application/json')
+
+        def view(request):
+            return response
+
+        middleware = RequestMetricsMiddleware(view)
+        iterations = options['iterations']
+        self._time(middleware, request, 1000)
+
+        # Alternate the runs so drift in machine load affects both alike
+        overheads = []
+        for _ in range(options['rounds']):
+            bare = self._time(view, request, iterations)
+            wrapped = self._time(middleware, request, iterations)
+            overheads.append((wrapped - bare) * 1e6)
+
+        overhead = statistics.median(overheads)
+        summary = (
+            f"Route {request.resolver_match.view_name}: {overhead:.2f}µs per request "
+            f"(median of {options['rounds']} rounds of {iterations}, budget {options['budget_us']:.0f}µs)"
+        )
+        if overhead <= options['budget_us']:
+            self.stdout.write(self.style.SUCCESS(summary))
+        else:
+            self.stdout.write(self.style.ERROR(summary))
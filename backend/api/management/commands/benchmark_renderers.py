@@ -0,0 +1,83 @@
+import statistics
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from api.middleware import brotli
+from api.renderers import ORJSONRenderer, orjson
+from orders.benchmarks import create_order, create_user
+from orders.models import Order
+from orders.serializers import OrderSerializer
+from products.benchmarks import create_list_page
+from products.serializers import product_list_values, serialize_product_list
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare encoding list endpoint payloads with DRF's JSONRenderer and "
+        "ORJSONRenderer, and the bytes sent uncompressed, gzipped and with brotli. "
+        "Data is created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[20, 100, 500], help="Page sizes to encode.")
+        parser.add_argument('--rounds', type=int, default=20)
+
+    def _time(self, func, rounds):
+        func()
+        timings = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            result = func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), result
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError("orjson is not installed.")
+        if options['rounds'] < 1 or min(options['sizes']) < 1:
+            raise CommandError("--rounds and --sizes must be at least 1.")
+        try:
+            with transaction.atomic():
+                for name, data in self.payloads(options['sizes']):
+                    self.report(name, data, options['rounds'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def payloads(self, sizes):
+        page, request = create_list_page(max(sizes))
+        for size in sizes:
+            yield f'products page {size}', serialize_product_list(product_list_values(page.all()[:size]), request)
+
+        user = create_user()
+        products = list(page[:3])
+        for _ in range(max(sizes)):
+            create_order(user, products)
+        orders = Order.objects.filter(user=user).prefetch_related('items__product')
+        for size in sizes:
+            yield f'orders page {size}', OrderSerializer(orders[:size], many=True).data
+
+    def report(self, name, data, rounds):
+        json_ms, body = self._time(lambda: JSONRenderer().render(data), rounds)
+        orjson_ms, orjson_body = self._time(lambda: ORJSONRenderer().render(data), rounds)
+        if body != orjson_body:
+            self.stdout.write(self.style.WARNING(f"{name}: renderers produced different output"))
+
+        line = (
+            f"{name:<20} json {json_ms:>8.2f} ms  orjson {orjson_ms:>8.2f} ms "
+            f"({json_ms / orjson_ms:>4.1f}x)  {len(body):>8} bytes"
+        )
+        gzip_ms, gzipped = self._time(lambda: compress_string(body), rounds)
+        line += f"  gzip {len(gzipped):>7} ({gzip_ms:.2f} ms)"
+        if brotli is not None:
+            quality = settings.COMPRESSION_BROTLI_QUALITY
+            brotli_ms, compressed = self._time(lambda: brotli.compress(body, quality=quality), rounds)
+            line += f"  br {len(compressed):>7} ({brotli_ms:.2f} ms)"
+        self.stdout.write(line)
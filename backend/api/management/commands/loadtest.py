@@ -0,0 +1,145 @@
+import http.client
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+
+
+def process_tree_rss(pid):
+    """Resident memory in bytes of a process and all of its children."""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The parent pid is the second field after the command name
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/statm') as f:
+                total += int(f.read().split()[1]) * page_size
+        except OSError:
+            continue
+        pending.extend(children.get(current, []))
+    return total
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test an API endpoint with concurrent keep-alive connections and report "
+        "requests/sec, latency and server memory per connection. Run it once against "
+        "the WSGI server (gunicorn gamekeys.wsgi:application) and once against the ASGI "
+        "server (gunicorn gamekeys.asgi:application -k uvicorn.workers.UvicornWorker) "
+        "with the same worker count to compare them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--duration', type=float, default=30.0, help="Seconds to run for.")
+        parser.add_argument('--server-pid', type=int, help="Server master pid, to measure memory.")
+        parser.add_argument('--header', action='append', default=[], help="Extra 'Name: value' request header.")
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme not in ('http', 'https'):
+            raise CommandError("URL must be http or https.")
+
+        connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        path = url.path + (f'?{url.query}' if url.query else '')
+        headers = dict(header.split(':', 1) for header in options['header'])
+        headers = {name.strip(): value.strip() for name, value in headers.items()}
+
+        server_pid = options['server_pid']
+        idle_rss = process_tree_rss(server_pid) if server_pid else None
+        peak_rss = [idle_rss or 0]
+
+        deadline = time.monotonic() + options['duration']
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        done = threading.Event()
+
+        def worker():
+            connection = connection_class(url.hostname, url.port, timeout=30)
+            local_latencies = []
+            local_errors = 0
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status >= 400:
+                        local_errors += 1
+                except (OSError, http.client.HTTPException):
+                    local_errors += 1
+                    connection.close()
+                    connection = connection_class(url.hostname, url.port, timeout=30)
+                    continue
+                local_latencies.append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                latencies.extend(local_latencies)
+                errors[0] += local_errors
+
+        def sample_memory():
+            while not done.wait(0.5):
+                peak_rss[0] = max(peak_rss[0], process_tree_rss(server_pid))
+
+        if server_pid:
+            sampler = threading.Thread(target=sample_memory, daemon=True)
+            sampler.start()
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=worker) for _ in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        done.set()
+
+        if not latencies:
+            raise CommandError(f"No successful requests ({errors[0]} errors).")
+
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        results = {
+            'url': options['url'],
+            'concurrency': options['concurrency'],
+            'requests': len(latencies),
+            'errors': errors[0],
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            'latency_ms': {
+                'p50': round(percentile(0.50), 2),
+                'p95': round(percentile(0.95), 2),
+                'p99': round(percentile(0.99), 2),
+            },
+        }
+        if server_pid:
+            results['server_rss_idle_mb'] = round(idle_rss / 2 ** 20, 1)
+            results['server_rss_peak_mb'] = round(peak_rss[0] / 2 ** 20, 1)
+            results['memory_per_connection_kb'] = round(
+                (peak_rss[0] - idle_rss) / 1024 / options['concurrency'], 1
+            )
+
+        self.stdout.write(json.dumps(results, indent=2))
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from api.profiling import MODES, issue_token
+
+
+class Command(BaseCommand):
+    help = "Issue a token that lets a staff user profile individual API requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help="Email of the staff user the token is issued to.")
+        parser.add_argument('--mode', choices=MODES, default='sample', help="Stack sampling or cProfile (default: sample).")
+
+    def handle(self, *args, **options):
+        if not settings.REQUEST_PROFILE_DIR:
+            raise CommandError("Request profiling is disabled; set REQUEST_PROFILE_DIR first.")
+
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['email']} does not exist.")
+        if not user.is_staff or not user.is_active:
+            raise CommandError(f"User {options['email']} is not an active staff user.")
+
+        token = issue_token(user, options['mode'])
+        hours = settings.REQUEST_PROFILE_TOKEN_MAX_AGE / 3600
+        self.stdout.write(token)
+        self.stderr.write(
+            f"Valid for {hours:g}h. Send it as the X-Profile header or the _profile query "
+            f"parameter; results go to {settings.REQUEST_PROFILE_DIR}."
+        )
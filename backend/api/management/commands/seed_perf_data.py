@@ -0,0 +1,380 @@
+import functools
+import io
+import itertools
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_date
+from orders.models import Order, OrderItem
+from products.models import Category, DigitalKey, Platform, Product, SoldKey
+from users.models import CashbackTransaction
+
+
+# Rows created at --scale 1; everything grows linearly with the scale
+BASE_USERS = 10_000
+BASE_PRODUCTS = 2_000
+BASE_KEYS = 1_000_000
+BASE_ORDERS = 100_000
+CATEGORIES = 12
+PLATFORMS = 6
+
+# Generated history ends here unless --end says otherwise, so that
+# timestamps do not depend on when the command runs
+DEFAULT_END = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+PRICES = [Decimal(p) for p in ('4.99', '9.99', '14.99', '19.99', '29.99', '39.99', '59.99', '69.99')]
+REGIONS = [code for code, _ in Product.REGION_CHOICES]
+STATUSES = ['FULFILLED', 'PAID', 'PENDING', 'FAILED', 'REFUNDED']
+STATUS_WEIGHTS = list(itertools.accumulate([85, 2, 5, 5, 3]))
+ITEM_COUNTS = [1, 1, 1, 1, 2, 2, 2, 3, 4, 5]
+
+
+def key_code(rng):
+    code = '%020X' % rng.getrandbits(80)
+    return f'{code[:5]}-{code[5:10]}-{code[10:15]}-{code[15:]}'
+
+
+@functools.lru_cache(maxsize=4096)
+def copy_datetime(value):
+    return value.isoformat()
+
+
+def copy_value(value):
+    if value is None:
+        return r'\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return copy_datetime(value)
+    if isinstance(value, dict):
+        return json.dumps(value)
+    return str(value)
+
+
+class RowWriter:
+    """
+    Writes rows for a model in batches: COPY on PostgreSQL, multi-row
+    INSERTs elsewhere. Values go in as given, so timestamps are not
+    replaced by auto_now/auto_now_add.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.counts = {}
+
+    def write(self, model, columns, rows):
+        fields = [model._meta.get_field(name) for name in columns]
+        table = connection.ops.quote_name(model._meta.db_table)
+        names = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        rows = iter(rows)
+        with connection.cursor() as cursor:
+            while True:
+                batch = list(itertools.islice(rows, self.batch_size))
+                if not batch:
+                    break
+                if connection.vendor == 'postgresql':
+                    buffer = io.StringIO()
+                    for row in batch:
+                        buffer.write('\t'.join(map(copy_value, row)))
+                        buffer.write('\n')
+                    buffer.seek(0)
+                    cursor.copy_expert(f'COPY {table} ({names}) FROM STDIN', buffer)
+                else:
+                    placeholders = ', '.join(['%s'] * len(fields))
+                    cursor.executemany(
+                        f'INSERT INTO {table} ({names}) VALUES ({placeholders})',
+                        [
+                            [field.get_db_prep_save(value, connection) for field, value in zip(fields, row)]
+                            for row in batch
+                        ],
+                    )
+                self.counts[model] = self.counts.get(model, 0) + len(batch)
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a deterministic, production-sized dataset for "
+        "performance work: users, catalog, millions of keys, orders with items, "
+        "sold keys and cashback, counted into the sales rollups. The same --seed, "
+        "--scale, --days and --end always produce the same values; ids continue "
+        "from the existing rows, so they match too when seeding an empty database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', type=float, default=1.0,
+            help=f"Size multiplier. 1 is {BASE_USERS:,} users, {BASE_PRODUCTS:,} products, "
+                 f"{BASE_KEYS:,} available keys and {BASE_ORDERS:,} orders.",
+        )
+        parser.add_argument('--seed', type=int, default=1, help="Random seed; also tags the generated rows.")
+        parser.add_argument('--days', type=int, default=365, help="Spread orders over this many days before --end.")
+        parser.add_argument(
+            '--end', default=DEFAULT_END.date().isoformat(),
+            help="Date (UTC) the generated history ends at, as YYYY-MM-DD.",
+        )
+        parser.add_argument('--batch-size', type=int, default=50_000, help="Rows per COPY or INSERT.")
+
+    def handle(self, *args, **options):
+        if options['scale'] <= 0 or options['days'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--scale, --days and --batch-size must be positive.")
+        self.seed = options['seed']
+        self.tag = f'perf{self.seed}'
+        if get_user_model().objects.filter(username__startswith=f'{self.tag}-').exists():
+            raise CommandError(f"Data for seed {self.seed} already exists; use another --seed.")
+
+        try:
+            end = parse_date(options['end'])
+        except ValueError:
+            end = None
+        if end is None:
+            raise CommandError(f"Invalid --end date: {options['end']}")
+
+        self.rng = random.Random(self.seed)
+        self.writer = RowWriter(options['batch_size'])
+        self.now = datetime(end.year, end.month, end.day, tzinfo=dt_timezone.utc)
+        self.start = self.now - timedelta(days=options['days'])
+        scale = options['scale']
+
+        started = time.monotonic()
+        with transaction.atomic():
+            self.seed_users(max(1, int(BASE_USERS * scale)))
+            self.seed_catalog(max(1, int(BASE_PRODUCTS * scale)))
+            self.seed_keys(int(BASE_KEYS * scale))
+            self.seed_orders(int(BASE_ORDERS * scale))
+            self.reset_sequences()
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for model in self.writer.counts:
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+        # Rows were written directly, so no task counted the orders' sales.
+        # Orders already counted in this window are skipped by the ledger.
+        call_command(
+            'backfill_sales_rollups', since=self.start.isoformat(), until=self.now.isoformat(),
+            chunk_size=10_000, stdout=self.stdout,
+        )
+
+        elapsed = time.monotonic() - started
+        for model, count in self.writer.counts.items():
+            self.stdout.write(f"{model._meta.label:<28} {count:>12,}")
+        total = sum(self.writer.counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)"
+        ))
+
+    def next_id(self, model):
+        return (model.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+    def reset_sequences(self):
+        # Ids were given explicitly, so move the sequences past them
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [get_user_model(), Category, Platform, Product]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def timestamp(self):
+        return self.start + (self.now - self.start) * self.rng.random()
+
+    def seed_users(self, count):
+        # Hashing is deliberately slow, so every user shares one password,
+        # salted with the tag so the hash is the same on every run
+        password = make_password(self.tag, salt=f'{self.tag}salt')
+        self.first_user_id = self.next_id(get_user_model())
+        self.user_count = count
+        self.balances = [Decimal('0.00')] * count
+        self.writer.write(
+            get_user_model(),
+            ['id', 'password', 'last_login', 'is_superuser', 'username', 'first_name', 'last_name',
+             'email', 'is_staff', 'is_active', 'date_joined', 'cashback_balance'],
+            (
+                [self.first_user_id + n, password, None, False, f'{self.tag}-user{n}', '', '',
+                 self.user_email(n), False, True, self.timestamp(), Decimal('0.00')]
+                for n in range(count)
+            ),
+        )
+
+    def user_email(self, n):
+        return f'{self.tag}-user{n}@example.com'
+
+    def seed_catalog(self, count):
+        rng = self.rng
+        category_id = self.next_id(Category)
+        platform_id = self.next_id(Platform)
+        self.writer.write(
+            Category,
+            ['id', 'name', 'slug', 'description', 'image', 'image_variants'],
+            ([category_id + n, f'Perf {self.seed} category {n}', f'{self.tag}-category-{n}', '', '', {}]
+             for n in range(CATEGORIES)),
+        )
+        self.writer.write(
+            Platform,
+            ['id', 'name', 'slug', 'description', 'image', 'image_variants'],
+            ([platform_id + n, f'Perf {self.seed} platform {n}', f'{self.tag}-platform-{n}', '', '', {}]
+             for n in range(PLATFORMS)),
+        )
+
+        self.first_product_id = self.next_id(Product)
+        self.product_count = count
+        self.product_prices = []
+        rows = []
+        for n in range(count):
+            price = rng.choice(PRICES)
+            sale_price = (price * Decimal('0.75')).quantize(Decimal('0.01')) if rng.random() < 0.2 else None
+            self.product_prices.append(sale_price or price)
+            created = self.start - timedelta(days=rng.randrange(365))
+            rows.append([
+                self.first_product_id + n, f'Perf {self.seed} product {n}', f'{self.tag}-product-{n}',
+                f'Generated product {n}.', 'Generated for performance testing. ' * 10,
+                category_id + rng.randrange(CATEGORIES), platform_id + rng.randrange(PLATFORMS),
+                price, sale_price, '', {}, True, rng.random() < 0.05, False, 0, '',
+                rng.choice(REGIONS), created, created,
+            ])
+        self.writer.write(
+            Product,
+            ['id', 'name', 'slug', 'short_description', 'description', 'category', 'platform',
+             'price', 'sale_price', 'image', 'image_variants', 'is_active', 'is_featured',
+             'is_external', 'key_buffer_size', 'feed_hash', 'region', 'created_at', 'updated_at'],
+            rows,
+        )
+
+        # A few products sell (and stock) far more than the rest
+        self.popularity = list(itertools.accumulate(1 / (rank + 1) ** 0.8 for rank in range(count)))
+
+    def seed_keys(self, count):
+        rng = self.rng
+        total_weight = self.popularity[-1]
+        previous = 0.0
+        per_product = []
+        for weight in self.popularity:
+            per_product.append(round(count * (weight - previous) / total_weight))
+            previous = weight
+
+        def rows():
+            for n, keys in enumerate(per_product):
+                product_id = self.first_product_id + n
+                for index in range(keys):
+                    # Keys arrive from suppliers in restocks of a few hundred
+                    if index % 500 == 0:
+                        restocked = self.timestamp()
+                    yield [product_id, key_code(rng), restocked]
+
+        self.writer.write(DigitalKey, ['product', 'key_code', 'created_at'], rows())
+
+    def seed_orders(self, count):
+        rng = self.rng
+        rate = Decimal(str(settings.CASHBACK_RATE))
+        span = (self.now - self.start) / max(1, count)
+        products = range(self.product_count)
+        orders, items, sold_keys, transactions = [], [], [], []
+
+        def flush():
+            self.writer.write(
+                Order,
+                ['id', 'email', 'is_guest', 'status', 'payment_method', 'stripe_payment_intent_id',
+                 'paypal_transaction_id', 'subtotal', 'cashback_used', 'total', 'cashback_earned',
+                 'created_at', 'updated_at', 'paid_at', 'fulfilled_at', 'refunded_at', 'ip_address', 'user'],
+                orders,
+            )
+            self.writer.write(OrderItem, ['order', 'product', 'price', 'quantity'], items)
+            self.writer.write(SoldKey, ['product', 'key_code', 'order', 'sold_at', 'created_at'], sold_keys)
+            self.writer.write(
+                CashbackTransaction, ['user', 'timestamp', 'amount', 'transaction_type', 'description'], transactions
+            )
+            for rows in (orders, items, sold_keys, transactions):
+                rows.clear()
+
+        for n in range(count):
+            # Orders are generated oldest first so cashback balances add up
+            created = self.start + span * (n + rng.random())
+            order_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+            status = rng.choices(STATUSES, cum_weights=STATUS_WEIGHTS)[0]
+            paid = status in ('PAID', 'FULFILLED', 'REFUNDED')
+            user = rng.randrange(self.user_count) if rng.random() < 0.8 else None
+
+            subtotal = Decimal('0.00')
+            chosen = dict.fromkeys(rng.choices(products, cum_weights=self.popularity, k=rng.choice(ITEM_COUNTS)))
+            for product in chosen:
+                price = self.product_prices[product]
+                quantity = 1 if rng.random() < 0.9 else rng.randint(2, 3)
+                subtotal += price * quantity
+                items.append([order_id, self.first_product_id + product, price, quantity])
+                if status == 'FULFILLED':
+                    for _ in range(quantity):
+                        sold_keys.append([
+                            self.first_product_id + product, key_code(rng), order_id,
+                            created, created - timedelta(days=rng.randrange(1, 90)),
+                        ])
+
+            cashback_used = Decimal('0.00')
+            cashback_earned = Decimal('0.00')
+            if user is not None:
+                cashback_earned = round(subtotal * rate, 2)
+                balance = self.balances[user]
+                if status in ('PAID', 'FULFILLED') and balance > 0 and rng.random() < 0.3:
+                    cashback_used = min(balance, subtotal)
+                    balance -= cashback_used
+                    transactions.append([
+                        self.first_user_id + user, created, cashback_used, 'DEBIT', 'Cashback used on order'
+                    ])
+                if status == 'FULFILLED' and cashback_earned > 0:
+                    balance += cashback_earned
+                    transactions.append([
+                        self.first_user_id + user, created, cashback_earned, 'CREDIT', 'Cashback earned from order'
+                    ])
+                self.balances[user] = balance
+
+            total = subtotal - cashback_used
+            if not total:
+                method = 'CASHBACK'
+            else:
+                method = 'STRIPE' if rng.random() < 0.9 else 'PAYPAL'
+            paid_at = created + timedelta(seconds=rng.randint(5, 300)) if paid else None
+            fulfilled_at = paid_at + timedelta(seconds=rng.randint(1, 60)) if status == 'FULFILLED' else None
+            refunded_at = paid_at + timedelta(days=rng.randint(1, 14)) if status == 'REFUNDED' else None
+            orders.append([
+                order_id,
+                self.user_email(user) if user is not None else f'{self.tag}-guest{n}@example.com',
+                user is None,
+                status,
+                method,
+                f'pi_{order_id.hex[:24]}' if method == 'STRIPE' and status != 'PENDING' else None,
+                f'PAYPAL-{order_id.hex[:17].upper()}' if method == 'PAYPAL' and paid else None,
+                subtotal,
+                cashback_used,
+                total,
+                cashback_earned,
+                created,
+                refunded_at or fulfilled_at or paid_at or created,
+                paid_at,
+                fulfilled_at,
+                refunded_at,
+                f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+                self.first_user_id + user if user is not None else None,
+            ])
+            if len(orders) >= self.writer.batch_size:
+                flush()
+        flush()
+
+        User = get_user_model()
+        User.objects.bulk_update(
+            [
+                User(id=self.first_user_id + n, cashback_balance=balance)
+                for n, balance in enumerate(self.balances) if balance
+            ],
+            ['cashback_balance'],
+            batch_size=1000,
+        )
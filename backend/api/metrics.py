@@ -0,0 +1,96 @@
+import hmac
+import os
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+
+
+# Metrics are shared between processes (gunicorn and Celery prefork workers)
+# through files in PROMETHEUS_MULTIPROC_DIR. The variable has to be set in
+# the environment before the process starts; without it every process
+# only reports its own values, which is fine for runserver.
+if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+TASK_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+HTTP_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    "Time spent handling a request, by route.",
+    ['route', 'method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 10),
+)
+HTTP_RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes',
+    "Size of response bodies, by route. Streamed responses are not counted.",
+    ['route', 'method', 'status'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+
+TASK_WAIT = Histogram(
+    'celery_task_wait_seconds',
+    "Time between a task being queued and a worker starting it.",
+    ['task', 'queue'],
+    buckets=TASK_LATENCY_BUCKETS,
+)
+TASK_RUNTIME = Histogram(
+    'celery_task_runtime_seconds',
+    "Time a worker spent running a task.",
+    ['task', 'queue'],
+    buckets=TASK_LATENCY_BUCKETS,
+)
+TASKS = Counter(
+    'celery_tasks',
+    "Tasks run, by outcome (success, failure or retry).",
+    ['task', 'queue', 'outcome'],
+)
+DB_QUERIES = Counter(
+    'db_queries',
+    "Queries run, by database alias, so replica reads can be compared with the primary.",
+    ['alias'],
+)
+QUEUE_DEPTH = Gauge(
+    'celery_queue_depth',
+    "Messages waiting in a broker queue, as last sampled.",
+    ['queue'],
+    multiprocess_mode='mostrecent',
+)
+
+
+def get_registry():
+    """The registry to export: every process's values in multiprocess mode."""
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def clear_multiprocess_dir():
+    """
+    Remove the metric files of a previous run. Call only from a parent
+    process before it starts any children.
+    """
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not path:
+        return
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith('.db'):
+            os.remove(os.path.join(path, name))
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Requires `Authorization: Bearer <METRICS_TOKEN>`
+    and is disabled while no token is configured.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        raise Http404
+    if not hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
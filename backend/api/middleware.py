@@ -0,0 +1,163 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from .metrics import HTTP_LATENCY, HTTP_RESPONSE_SIZE
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Any other method is recorded as "OTHER", so clients cannot add label values
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+# Content types worth compressing; images and archives already are
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+COMPRESSIBLE_SUFFIXES = ('+json', '+xml')
+
+
+class RequestMetricsMiddleware:
+    """
+    Records latency, response size and status class of every request per
+    route. Routes are URL pattern names, which for the API are the router
+    basename and action (e.g. "product-list", "order-my-orders"), so label
+    values stay bounded whatever the URLs contain.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Labelled children by (route, method, status class); resolving
+        # labels is the costliest part of an observation
+        self._children = {}
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, time.perf_counter() - started)
+        return response
+
+    def _record(self, request, response, duration):
+        match = request.resolver_match
+        route = (match.view_name or match.route) if match else 'unmatched'
+        method = request.method if request.method in METHODS else 'OTHER'
+        key = (route, method, response.status_code // 100)
+
+        children = self._children.get(key)
+        if children is None:
+            labels = (route, method, f'{key[2]}xx')
+            children = self._children[key] = (
+                HTTP_LATENCY.labels(*labels), HTTP_RESPONSE_SIZE.labels(*labels)
+            )
+
+        children[0].observe(duration)
+        if not response.streaming:
+            children[1].observe(len(response.content))
+
+
+def accepted_encodings(header):
+    """Parse Accept-Encoding into {coding: qvalue}."""
+    encodings = {}
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[coding] = quality
+    return encodings
+
+
+def negotiate_encoding(header, gzip_only=False):
+    """
+    The coding to compress with for an Accept-Encoding header, 'br' or
+    'gzip', or None. Brotli wins ties unless `gzip_only`.
+    """
+    encodings = accepted_encodings(header)
+    candidates = ['gzip'] if gzip_only or brotli is None else ['br', 'gzip']
+    best, best_quality = None, 0.0
+    for coding in candidates:
+        quality = encodings.get(coding, encodings.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def is_public_request(request):
+    """Whether a request is a read made without credentials."""
+    return (
+        request.method in ('GET', 'HEAD')
+        and 'HTTP_AUTHORIZATION' not in request.META
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+    )
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compresses text responses of at least COMPRESSION_MIN_SIZE bytes with
+    brotli or gzip, whichever the client prefers. Brotli needs the
+    optional brotli package; without it this behaves like GZipMiddleware
+    with a size threshold. Place it before any middleware that reads or
+    changes the response body.
+
+    Brotli is only used for public reads. Other responses may carry
+    tokens or key codes next to text the client sent, and their size
+    would then leak the secret (BREACH). GZipMiddleware pads its output
+    with random bytes against this; brotli output cannot be padded, so
+    those responses get gzip.
+    """
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        if response.has_header('Content-Encoding') or not self.compressible(response.get('Content-Type', '')):
+            return response
+
+        encoding = negotiate_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''),
+            # Streaming responses are not compressed with brotli either
+            gzip_only=response.streaming or not is_public_request(request),
+        )
+        if encoding == 'gzip':
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if encoding != 'br':
+            return response
+
+        compressed = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        # Same ETag handling as GZipMiddleware
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+    def compressible(self, content_type):
+        content_type = content_type.split(';', 1)[0].strip().lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES) or content_type.endswith(COMPRESSIBLE_SUFFIXES)
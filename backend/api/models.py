@@ -0,0 +1,27 @@
+from django.db import models
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response stored for a request made with an Idempotency-Key header,
+    used when Redis is unavailable (see api.idempotency). Expired rows
+    are ignored and removed by purge_idempotency_keys.
+    """
+    # Digest of the key and the user, method and path it was sent with
+    key = models.CharField(max_length=32, primary_key=True)
+    # Digest of the request body, so a key cannot be reused for another request
+    fingerprint = models.CharField(max_length=32)
+
+    # Held by the first request until its response is stored
+    lock_token = models.CharField(max_length=32, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    # zlib compressed response body
+    body = models.BinaryField(blank=True)
+
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,267 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+
+# Requests opt in with a token from `manage.py profile_token`
+HEADER = 'HTTP_X_PROFILE'
+QUERY_PARAM = '_profile'
+TOKEN_SALT = 'api.profiling'
+
+MODES = ('sample', 'cprofile')
+
+
+def issue_token(user, mode='sample'):
+    return signing.dumps({'user': user.pk, 'mode': mode}, salt=TOKEN_SALT, compress=True)
+
+
+def check_token(token):
+    """
+    Return the profiling mode for a valid token of an active staff user,
+    or None.
+    """
+    try:
+        payload = signing.loads(token, salt=TOKEN_SALT, max_age=settings.REQUEST_PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if payload.get('mode') not in MODES:
+        return None
+    if not get_user_model().objects.filter(pk=payload.get('user'), is_active=True, is_staff=True).exists():
+        return None
+    return payload['mode']
+
+
+# The switch interval is process-wide, so samplers of overlapping
+# requests share one change: the first lowers it, the last restores it
+_switch_interval_lock = threading.Lock()
+_switch_interval_users = 0
+_saved_switch_interval = None
+
+
+def _lower_switch_interval(interval):
+    global _switch_interval_users, _saved_switch_interval
+    with _switch_interval_lock:
+        if _switch_interval_users == 0:
+            _saved_switch_interval = sys.getswitchinterval()
+        _switch_interval_users += 1
+        sys.setswitchinterval(min(sys.getswitchinterval(), interval))
+
+
+def _restore_switch_interval():
+    global _switch_interval_users
+    with _switch_interval_lock:
+        _switch_interval_users -= 1
+        if _switch_interval_users == 0:
+            sys.setswitchinterval(_saved_switch_interval)
+
+
+def _frame_label(code):
+    filename = code.co_filename
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix + os.sep):
+            filename = filename[len(prefix) + 1:]
+            break
+    # ';' separates frames in the collapsed format
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ',')
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack at a fixed interval from a helper
+    thread and counts identical stacks, for flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        # The request thread only hands over the GIL every switch interval
+        # (5ms by default), which would cap the sampling rate
+        _lower_switch_interval(self.interval / 2)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        _restore_switch_interval()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def collapsed(self):
+        labels = {}
+        lines = []
+        for stack, count in self.stacks.most_common():
+            names = [labels.get(code) or labels.setdefault(code, _frame_label(code)) for code in stack]
+            lines.append(f"{';'.join(names)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+class SQLRecorder:
+    """Database execute wrapper that times every query of the request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = defaultdict(lambda: [0, 0.0])
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            entry = self.statements[(context['connection'].alias, sql)]
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def summary(self, limit=50):
+        statements = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            'queries': self.count,
+            'sql_ms': round(self.duration * 1000, 3),
+            'statements': [
+                {'database': alias, 'sql': sql, 'count': count, 'ms': round(elapsed * 1000, 3)}
+                for (alias, sql), (count, elapsed) in statements[:limit]
+            ],
+        }
+
+
+class RequestProfile:
+    """Profiler, SQL timings and output files for one request."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.recorder = SQLRecorder()
+        self._stack = ExitStack()
+
+    def start(self):
+        # Connections are per thread, so for async views this only sees
+        # queries made on the event loop's thread
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self.recorder))
+
+        if self.mode == 'cprofile':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            self._stack.callback(self.profiler.disable)
+        else:
+            self.profiler = StackSampler(threading.get_ident(), settings.REQUEST_PROFILE_SAMPLE_INTERVAL)
+            self.profiler.start()
+            self._stack.callback(self.profiler.stop)
+        self.started = time.perf_counter()
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+        self._stack.close()
+
+    def save(self, request, response):
+        """Write the profile files and return their shared name."""
+        match = request.resolver_match
+        route = (match.view_name if match else None) or 'unmatched'
+        profile_id = f"{timezone.now():%Y%m%d-%H%M%S}-{route.replace(':', '.')}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(settings.REQUEST_PROFILE_DIR, exist_ok=True)
+        base = os.path.join(settings.REQUEST_PROFILE_DIR, profile_id)
+
+        if self.mode == 'cprofile':
+            self.profiler.dump_stats(base + '.pstats')
+        else:
+            with open(base + '.collapsed', 'w') as f:
+                f.write(self.profiler.collapsed())
+
+        with open(base + '.sql.json', 'w') as f:
+            json.dump({
+                'method': request.method,
+                'path': request.path,
+                'route': route,
+                'status': response.status_code,
+                'mode': self.mode,
+                'total_ms': round(self.duration * 1000, 3),
+                **self.recorder.summary(),
+            }, f, indent=2)
+        return profile_id
+
+
+class RequestProfilerMiddleware:
+    """
+    Profiles single requests that carry a staff user's profiling token in
+    the X-Profile header or the _profile query parameter.
+
+    "sample" mode writes a collapsed-stack file, "cprofile" mode a pstats
+    dump. Either way a .sql.json file next to it breaks out the SQL time.
+    Requests without a token only pay for a header and query string check,
+    and the middleware removes itself while REQUEST_PROFILE_DIR is unset.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILE_DIR:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _token(self, request):
+        token = request.META.get(HEADER)
+        if token is None and QUERY_PARAM in request.META.get('QUERY_STRING', ''):
+            token = request.GET.get(QUERY_PARAM)
+        return token
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = self._token(request)
+        mode = token and check_token(token)
+        if not mode:
+            return self.get_response(request)
+
+        profile = RequestProfile(mode)
+        profile.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.stop()
+        response['X-Profile-Id'] = profile.save(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = self._token(request)
+        mode = token and await sync_to_async(check_token)(token)
+        if not mode:
+            return await self.get_response(request)
+
+        profile = RequestProfile(mode)
+        profile.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile.stop()
+        response['X-Profile-Id'] = profile.save(request, response)
+        return response
@@ -0,0 +1,47 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed, producing
+    the same bytes as the stdlib renderer except for floats. Datetimes and
+    anything orjson cannot encode natively go through DRF's
+    JSONEncoder.default, so Decimal, UUID, datetime and lazy strings come
+    out as they did before. Data orjson rejects, such as integers wider
+    than 64 bits, and indented output (the browsable API, "; indent=4")
+    and non-default UNICODE_JSON/COMPACT_JSON settings use the stdlib
+    renderer.
+
+    Floats are written in the shortest form that reads back as the same
+    value, with exponents as JavaScript writes them ("1e-7", "1e16" rather
+    than "1e-07", "1e+16"), and NaN and infinities as null where the
+    stdlib renderer raises. Prices are Decimals, rendered as strings, so
+    only a few plain values such as payment amounts are floats.
+    """
+    default = encoders.JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer, keeping the output a JavaScript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -0,0 +1,126 @@
+from rest_framework import serializers
+
+
+def parse_fields(value):
+    """
+    Parse a sparse fieldset such as 'id,name,items.price' into
+    {'id': None, 'name': None, 'items': {'price': None}}, where None
+    selects the whole field. Returns None for an empty value.
+    """
+    spec = {}
+    for path in (value or '').split(','):
+        parts = [part.strip() for part in path.split('.')]
+        if not all(parts):
+            continue
+        level = spec
+        for part in parts[:-1]:
+            if part in level and level[part] is None:
+                # The whole field is already selected
+                break
+            level = level.setdefault(part, {})
+        else:
+            level[parts[-1]] = None
+    return spec or None
+
+
+def _query_spec(request, param):
+    if request is None:
+        return None
+    params = getattr(request, 'query_params', request.GET)
+    return parse_fields(params.get(param))
+
+
+def requested_spec(request):
+    """The parsed `fields` query parameter of a request, or None."""
+    return _query_spec(request, SparseFieldsetMixin.fields_param)
+
+
+def omitted_spec(request):
+    """The parsed `omit` query parameter of a request, or None."""
+    return _query_spec(request, SparseFieldsetMixin.omit_param)
+
+
+def select_fields(fields, spec, omit):
+    """
+    {name: nested spec or None} for the names in `fields` (a serializer's
+    fields) that `spec` keeps and `omit` does not drop. Fields with parts
+    omitted get a nested spec of what remains of them.
+    """
+    selected = {}
+    for name, field in fields.items():
+        if spec is not None and name not in spec:
+            continue
+        nested_spec = spec[name] if spec is not None else None
+        nested_omit = omit.get(name, {}) if omit is not None else {}
+        if nested_omit is None:
+            continue
+        if nested_omit:
+            nested = getattr(field, 'child', field)
+            if isinstance(nested, SparseFieldsetMixin):
+                nested_spec = select_fields(nested.fields, nested_spec, nested_omit)
+        selected[name] = nested_spec
+    return selected
+
+
+class SparseFieldsetMixin:
+    """
+    Lets clients pick the fields of a read-only serializer with the
+    `fields` query parameter, e.g. `?fields=id,name,items.price`, or drop
+    some with `omit`, e.g. `?omit=description,items.platform`; omit
+    applies after fields. Nested serializers using the mixin take dotted
+    names. Fields that were not requested are dropped before serializing,
+    so their sources are never read; unknown names are ignored. Parsed
+    specs can also be passed as `fields=` and `omit=` when there is no
+    request in the context. Views call requested_fields() to skip loading
+    the related rows of dropped fields.
+    """
+    fields_param = 'fields'
+    omit_param = 'omit'
+
+    def __init__(self, *args, fields=None, omit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            self._sparse_spec = fields
+        if omit is not None:
+            self._sparse_omit = omit
+
+    def get_fields(self):
+        fields = super().get_fields()
+        spec = self.sparse_spec()
+        omit = self.sparse_spec(omitted=True)
+        if spec is None and omit is None:
+            return fields
+
+        for name in list(fields):
+            nested_omit = omit.get(name, {}) if omit is not None else {}
+            if (spec is not None and name not in spec) or nested_omit is None:
+                del fields[name]
+                continue
+            nested = getattr(fields[name], 'child', fields[name])
+            if isinstance(nested, SparseFieldsetMixin):
+                if spec is not None and spec[name]:
+                    nested._sparse_spec = spec[name]
+                if nested_omit:
+                    nested._sparse_omit = nested_omit
+        return fields
+
+    def sparse_spec(self, omitted=False):
+        attr = '_sparse_omit' if omitted else '_sparse_spec'
+        if hasattr(self, attr):
+            return getattr(self, attr)
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            # Nested serializers only get what their parent passes down
+            return None
+        request = self.context.get('request')
+        return omitted_spec(request) if omitted else requested_spec(request)
+
+    @classmethod
+    def requested_fields(cls, request):
+        """
+        {name: nested spec or None} for the top-level fields a response
+        to this request will contain; every field without `fields` or `omit`.
+        """
+        return select_fields(cls().fields, requested_spec(request), omitted_spec(request))
@@ -0,0 +1,38 @@
+from celery import current_app, shared_task
+from django.utils import timezone
+from .metrics import QUEUE_DEPTH
+from .models import IdempotencyKey
+
+
+@shared_task(ignore_result=True)
+def sample_queue_depths():
+    """
+    Record how many messages are waiting in each task queue.
+    Runs periodically from beat.
+    """
+    depths = {}
+    with current_app.connection_for_read() as connection:
+        for queue in current_app.conf.task_queues:
+            # A passive declare only reads the size and never creates the
+            # queue. It fails for a queue that does not exist yet, and the
+            # broker may close the channel, so each queue gets its own.
+            channel = connection.channel()
+            try:
+                _, depth, _ = channel.queue_declare(queue=queue.name, passive=True)
+            except connection.channel_errors:
+                depth = 0
+            finally:
+                channel.close()
+            QUEUE_DEPTH.labels(queue.name).set(depth)
+            depths[queue.name] = depth
+    return depths
+
+
+@shared_task(ignore_result=True)
+def purge_idempotency_keys():
+    """
+    Delete expired idempotency keys from the database fallback.
+    Keys in Redis expire on their own. Runs hourly from beat.
+    """
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,587 @@
+import gzip
+import json
+import os
+import secrets
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import SkipTest, mock, skipIf
+import redis
+from kombu import Connection, Exchange, Queue
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from prometheus_client import REGISTRY
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from analytics.models import SalesEvent, SalesRollup
+from gamekeys.celery import app as celery_app
+from orders.benchmarks import create_user
+from orders.models import Order, OrderItem
+from orders.views import OrderViewSet
+from products.benchmarks import create_catalog
+from products.models import Category, Platform, Product
+from users.models import CashbackTransaction
+from users.serializers import UserSerializer
+from users.tokens import RefreshToken
+from . import celery_metrics, idempotency, throttling
+from .idempotency import RedisIdempotencyStore, StoredResponse, digest
+from .metrics import QUEUE_DEPTH
+from .middleware import CompressionMiddleware, brotli, negotiate_encoding
+from .models import IdempotencyKey
+from .profiling import RequestProfilerMiddleware, StackSampler, check_token, issue_token
+from .renderers import ORJSONRenderer, orjson
+from .tasks import sample_queue_depths
+from .throttling import MemoryTokenBucket, RegistrationThrottle
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, IDEMPOTENCY_BACKEND='database')
+class IdempotencyTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for patch in (
+            mock.patch.object(idempotency, '_store', None),
+            mock.patch.object(OrderViewSet, 'get_throttles', return_value=[]),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        product = create_catalog(1)[0]
+        self.data = {
+            'email': 'guest@example.com',
+            'items': [{'product_id': product.id, 'quantity': 1}],
+            'payment_method': 'PAYPAL',
+        }
+        self.client = APIClient()
+
+    def post(self, data, key='order-1'):
+        return self.client.post('/api/orders/', data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def lock(self, key='order-1'):
+        """An entry as left by a first request that is still running."""
+        return IdempotencyKey.objects.create(
+            key=digest(f':POST:/api/orders/:{key}'),
+            fingerprint=digest(idempotency.json.dumps(self.data, sort_keys=True, default=str)),
+            lock_token=secrets.token_hex(16),
+            locked_until=timezone.now() + timezone.timedelta(minutes=1),
+            expires_at=timezone.now() + timezone.timedelta(days=1),
+        )
+
+    def test_retry_replays_the_first_response(self):
+        first = self.post(self.data)
+        retry = self.post(self.data)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_other_keys_are_separate_requests(self):
+        self.post(self.data)
+        self.post(self.data, key='order-2')
+
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_key_reused_for_a_different_body_is_rejected(self):
+        self.post(self.data)
+        response = self.post({**self.data, 'email': 'other@example.com'})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_failed_requests_are_not_stored(self):
+        data = {**self.data, 'email': 'not an email'}
+        self.assertEqual(self.post(data).status_code, 400)
+        response = self.post(data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_concurrent_retry_waits_for_the_first_response(self):
+        entry = self.lock()
+        body = b'{"order":"from the first request"}'
+
+        def first_request_finishes(seconds):
+            IdempotencyKey.objects.filter(key=entry.key).update(
+                status_code=201, content_type='application/json', body=zlib.compress(body),
+                lock_token='', locked_until=None,
+            )
+
+        with mock.patch.object(idempotency.time, 'sleep', side_effect=first_request_finishes) as sleep:
+            response = self.post(self.data)
+
+        sleep.assert_called_once()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.content, body)
+        self.assertEqual(Order.objects.count(), 0)
+
+    @override_settings(IDEMPOTENCY_LOCK_WAIT=0)
+    def test_concurrent_retry_gives_up_after_the_lock_wait(self):
+        self.lock()
+        response = self.post(self.data)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_stale_lock_is_taken_over(self):
+        entry = self.lock()
+        IdempotencyKey.objects.filter(key=entry.key).update(locked_until=timezone.now())
+
+        self.assertEqual(self.post(self.data).status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class RedisIdempotencyStoreTests(SimpleTestCase):
+    """Runs against the Redis at IDEMPOTENCY_REDIS_URL when one is reachable."""
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.store = RedisIdempotencyStore(settings.IDEMPOTENCY_REDIS_URL)
+            cls.store.client.ping()
+        except (redis.RedisError, ValueError):
+            raise SkipTest("Redis is not available")
+        super().setUpClass()
+
+    def setUp(self):
+        self.key = f'test-{secrets.token_hex(8)}'
+        self.addCleanup(self.store.client.delete, self.store._key(self.key))
+        self.stored = StoredResponse('f' * 32, 201, 'application/json', zlib.compress(b'{}'))
+
+    def test_replays_a_finished_request(self):
+        self.assertIsNone(self.store.begin(self.key, 'f' * 32, 'a' * 32))
+        self.store.finish(self.key, 'f' * 32, 'a' * 32, self.stored)
+
+        self.assertEqual(self.store.begin(self.key, 'f' * 32, 'b' * 32), self.stored)
+
+    def test_expired_lock_holder_cannot_overwrite_the_new_entry(self):
+        self.store.begin(self.key, 'f' * 32, 'a' * 32)
+        # The first lock expires and a retry takes over
+        self.store.client.delete(self.store._key(self.key))
+        self.assertIsNone(self.store.begin(self.key, 'f' * 32, 'b' * 32))
+
+        self.store.finish(self.key, 'f' * 32, 'a' * 32, self.stored)
+        self.assertEqual(self.store.begin(self.key, 'f' * 32, 'c' * 32), idempotency.Locked('f' * 32))
+
+        self.store.finish(self.key, 'f' * 32, 'b' * 32, self.stored)
+        self.assertEqual(self.store.begin(self.key, 'f' * 32, 'c' * 32), self.stored)
+
+
+class MemoryTokenBucketTests(SimpleTestCase):
+
+    def setUp(self):
+        self.buckets = MemoryTokenBucket()
+        patch = mock.patch.object(throttling.time, 'monotonic', return_value=1000.0)
+        self.clock = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_empty_bucket_refills_at_the_rate(self):
+        self.assertEqual(self.buckets.consume(['a'], 2, 0.5), (True, 0))
+        self.assertEqual(self.buckets.consume(['a'], 2, 0.5), (True, 0))
+        self.assertEqual(self.buckets.consume(['a'], 2, 0.5), (False, 2.0))
+
+        self.clock.return_value += 2
+        self.assertEqual(self.buckets.consume(['a'], 2, 0.5), (True, 0))
+
+    def test_refill_stops_at_the_capacity(self):
+        self.buckets.consume(['a'], 2, 0.5)
+        self.clock.return_value += 60
+
+        self.assertEqual([self.buckets.consume(['a'], 2, 0.5)[0] for _ in range(3)], [True, True, False])
+
+    def test_request_is_taken_from_every_bucket_only_if_all_have_a_token(self):
+        self.buckets.consume(['ip', 'email:a'], 1, 0.5)
+        self.assertFalse(self.buckets.consume(['ip', 'email:b'], 1, 0.5)[0])
+
+        # The refused request did not empty email:b
+        self.clock.return_value += 2
+        self.assertTrue(self.buckets.consume(['ip', 'email:b'], 1, 0.5)[0])
+
+
+@override_settings(
+    TOKEN_BUCKET_BACKEND='memory',
+    TOKEN_BUCKET_RATES={'registration': {'capacity': 1, 'refill_per_minute': 1}},
+)
+class TokenBucketThrottleTests(SimpleTestCase):
+
+    def setUp(self):
+        patch = mock.patch.object(throttling, '_bucket_backend', None)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def allowed(self, email='user@example.com', **meta):
+        request = APIRequestFactory().post(
+            '/api/users/register/', {'email': email}, format='json', **{'REMOTE_ADDR': '203.0.113.5', **meta}
+        )
+        return RegistrationThrottle().allow_request(Request(request, parsers=[JSONParser()]), None)
+
+    def test_forwarded_for_is_ignored_without_trusted_proxies(self):
+        self.assertTrue(self.allowed(email='a@example.com', HTTP_X_FORWARDED_FOR='198.51.100.1'))
+        self.assertFalse(self.allowed(email='b@example.com', HTTP_X_FORWARDED_FOR='198.51.100.2'))
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1})
+    def test_forwarded_for_is_read_behind_a_trusted_proxy(self):
+        self.assertTrue(self.allowed(email='a@example.com', HTTP_X_FORWARDED_FOR='198.51.100.1'))
+        # Only the address the proxy appended counts, not what the client sent before it
+        self.assertTrue(self.allowed(email='b@example.com', HTTP_X_FORWARDED_FOR='10.0.0.1, 198.51.100.2'))
+        self.assertFalse(self.allowed(email='c@example.com', HTTP_X_FORWARDED_FOR='10.0.0.2, 198.51.100.2'))
+
+    def test_email_is_limited_across_addresses(self):
+        self.assertTrue(self.allowed(email='user@example.com'))
+        self.assertFalse(self.allowed(email=' User@Example.com', REMOTE_ADDR='203.0.113.6'))
+
+    def test_fails_open_when_redis_errors(self):
+        with mock.patch.object(MemoryTokenBucket, 'consume', side_effect=redis.ConnectionError):
+            self.assertTrue(self.allowed())
+            self.assertTrue(self.allowed())
+
+    def test_rates_must_be_positive(self):
+        for limits in ({'capacity': 1, 'refill_per_minute': 0}, {'capacity': 0, 'refill_per_minute': 1}):
+            with self.subTest(limits=limits), override_settings(TOKEN_BUCKET_RATES={'registration': limits}):
+                with self.assertRaisesMessage(ImproperlyConfigured, "TOKEN_BUCKET_RATES['registration']"):
+                    RegistrationThrottle()
+
+        with override_settings(TOKEN_BUCKET_RATES={}):
+            self.assertTrue(self.allowed())
+
+
+class SeedPerfDataTests(TestCase):
+
+    def seed(self):
+        call_command('seed_perf_data', scale=0.002, seed=7, days=30, stdout=StringIO())
+        users = get_user_model().objects.filter(username__startswith='perf7-').order_by('username')
+        orders = Order.objects.order_by('created_at')
+        return {
+            'users': list(users.values_list('email', 'password', 'date_joined', 'cashback_balance')),
+            'products': list(Product.objects.order_by('slug').values_list('slug', 'price', 'sale_price', 'created_at')),
+            'orders': list(orders.values_list('id', 'email', 'status', 'total', 'created_at', 'fulfilled_at')),
+            'items': list(OrderItem.objects.order_by('order__created_at', 'product__slug').values_list('product__slug', 'price', 'quantity')),
+            'cashback': list(CashbackTransaction.objects.order_by('timestamp', 'amount').values_list('user__email', 'amount', 'timestamp')),
+            'rollups': list(SalesRollup.objects.order_by('granularity', 'bucket', 'product__slug').values_list(
+                'granularity', 'bucket', 'product__slug', 'units_sold', 'revenue', 'cashback_earned', 'refunds'
+            )),
+        }
+
+    def test_same_seed_produces_the_same_data(self):
+        first = self.seed()
+        self.assertEqual(len(first['orders']), 200)
+        self.assertEqual(
+            SalesEvent.objects.filter(event='PAID').count(),
+            Order.objects.filter(paid_at__isnull=False).count(),
+        )
+        self.assertTrue(first['rollups'])
+
+        for model in (SalesEvent, SalesRollup, Order, Product, Category, Platform, get_user_model()):
+            model.objects.all().delete()
+        self.assertEqual(self.seed(), first)
+
+
+@skipIf(orjson is None, "orjson is not installed")
+class ORJSONRendererTests(SimpleTestCase):
+
+    def assertRendersLikeJSONRenderer(self, data):
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_output_matches_the_stdlib_renderer(self):
+        self.assertRendersLikeJSONRenderer({
+            'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'price': Decimal('19.99'),
+            'amount': 19.99,
+            'created_at': datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=dt_timezone.utc),
+            'date': date(2024, 1, 2),
+            'name': gettext_lazy("Name"),
+            'text': "café \u2028",
+            'items': [1, True, None],
+            1: 'int key',
+        })
+
+    def test_integers_orjson_rejects_fall_back_to_the_stdlib_renderer(self):
+        self.assertRendersLikeJSONRenderer({'id': 2 ** 70})
+
+    def test_float_exponents_differ_but_read_back_the_same(self):
+        data = {'small': 1e-7, 'large': 1e16}
+
+        self.assertEqual(ORJSONRenderer().render(data), b'{"small":1e-7,"large":1e16}')
+        self.assertEqual(json.loads(ORJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100)
+class CompressionMiddlewareTests(SimpleTestCase):
+    body = b'{"name":"' + b'product ' * 100 + b'"}'
+
+    def respond(self, accept_encoding='gzip, br', method='get', content_type='application/json', **meta):
+        def view(request):
+            response = HttpResponse(self.body, content_type=content_type)
+            response['ETag'] = '"v1"'
+            return response
+
+        request = getattr(RequestFactory(), method)('/', HTTP_ACCEPT_ENCODING=accept_encoding, **meta)
+        return CompressionMiddleware(view)(request)
+
+    def test_encoding_follows_the_client_preference(self):
+        for header, expected in (
+            ('gzip', 'gzip'),
+            ('br;q=0.5, gzip', 'gzip'),
+            ('*', 'br' if brotli else 'gzip'),
+            ('gzip;q=0, identity', None),
+            ('', None),
+        ):
+            with self.subTest(header=header):
+                self.assertEqual(negotiate_encoding(header), expected)
+
+    def test_gzip_response(self):
+        response = self.respond('gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertEqual(response['ETag'], 'W/"v1"')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    @skipIf(brotli is None, "brotli is not installed")
+    def test_public_reads_prefer_brotli(self):
+        response = self.respond()
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), self.body)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['ETag'], 'W/"v1"')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_responses_that_may_carry_secrets_get_padded_gzip(self):
+        for response in (
+            self.respond(HTTP_AUTHORIZATION='Bearer token'),
+            self.respond(method='post'),
+            self.respond(HTTP_COOKIE=f'{settings.SESSION_COOKIE_NAME}=session'),
+        ):
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_small_and_binary_responses_are_left_alone(self):
+        with override_settings(COMPRESSION_MIN_SIZE=10_000):
+            self.assertFalse(self.respond().has_header('Content-Encoding'))
+        self.assertFalse(self.respond(content_type='image/png').has_header('Content-Encoding'))
+
+
+class StackSamplerTests(SimpleTestCase):
+
+    def test_overlapping_samplers_restore_the_switch_interval(self):
+        original = sys.getswitchinterval()
+        first = StackSampler(threading.get_ident(), 0.002)
+        second = StackSampler(threading.get_ident(), 0.001)
+
+        first.start()
+        second.start()
+        first.stop()
+        self.assertEqual(sys.getswitchinterval(), 0.0005)
+        second.stop()
+
+        self.assertEqual(sys.getswitchinterval(), original)
+
+
+class RequestProfilerMiddlewareTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        patch = override_settings(REQUEST_PROFILE_DIR=self.directory)
+        patch.enable()
+        self.addCleanup(patch.disable)
+        self.staff = get_user_model().objects.create_user(
+            username='staff', email='staff@example.com', password=None, is_staff=True
+        )
+
+    def profile(self, token):
+        def view(request):
+            Category.objects.exists()
+            return HttpResponse()
+
+        request = RequestFactory().get('/', HTTP_X_PROFILE=token)
+        return RequestProfilerMiddleware(view)(request)
+
+    def test_staff_token_profiles_the_request(self):
+        for mode, suffix in (('sample', '.collapsed'), ('cprofile', '.pstats')):
+            with self.subTest(mode=mode):
+                profile_id = self.profile(issue_token(self.staff, mode))['X-Profile-Id']
+
+                self.assertTrue(os.path.exists(os.path.join(self.directory, profile_id + suffix)))
+                with open(os.path.join(self.directory, profile_id + '.sql.json')) as f:
+                    summary = json.load(f)
+                self.assertEqual((summary['mode'], summary['queries']), (mode, 1))
+
+    def test_other_tokens_are_ignored(self):
+        customer = get_user_model().objects.create_user(username='customer', email='customer@example.com', password=None)
+        for token in (issue_token(customer), 'not a token'):
+            self.assertFalse(self.profile(token).has_header('X-Profile-Id'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_command_issues_a_token_for_staff_only(self):
+        out = StringIO()
+        call_command('profile_token', 'staff@example.com', mode='cprofile', stdout=out, stderr=StringIO())
+        self.assertEqual(check_token(out.getvalue().strip()), 'cprofile')
+
+        self.staff.is_staff = False
+        self.staff.save()
+        with self.assertRaises(CommandError):
+            call_command('profile_token', 'staff@example.com', stdout=StringIO(), stderr=StringIO())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, ROOT_URLCONF='gamekeys.asgi_urls')
+class AsyncAPIViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.async_client = AsyncClient()
+
+    async def test_errors_have_the_api_error_bodies(self):
+        response = await self.async_client.get('/api/users/me/')
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+        self.assertEqual(response.json(), {'detail': 'Authentication credentials were not provided.'})
+
+    async def test_user_is_authenticated_and_serialized(self):
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(self.user).access_token))()
+
+        response = await self.async_client.get('/api/users/me/', headers={'Authorization': f'Bearer {token}'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json(), await sync_to_async(lambda: dict(UserSerializer(self.user).data))())
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TaskMetricsTests(SimpleTestCase):
+
+    def task(self, **request):
+        request = {'enqueued_at': None, 'eta': None, 'delivery_info': {'routing_key': 'email'}, **request}
+        return mock.Mock(request=mock.Mock(**request))
+
+    def run_task(self, task):
+        celery_metrics.record_task_start(task_id='task-1', task=task)
+        celery_metrics.record_task_end(task_id='task-1', task=task, state='SUCCESS')
+
+    def test_wait_runs_from_the_enqueue_time_or_eta(self):
+        labels = {'task': 'metrics-test', 'queue': 'email'}
+        task = self.task(enqueued_at=time.time() - 5)
+        task.name = 'metrics-test'
+        count, total = sample('celery_task_wait_seconds_count', **labels), sample('celery_task_wait_seconds_sum', **labels)
+
+        self.run_task(task)
+        self.assertEqual(sample('celery_task_wait_seconds_count', **labels), count + 1)
+        self.assertAlmostEqual(sample('celery_task_wait_seconds_sum', **labels) - total, 5, delta=1)
+
+        # Waiting for a countdown is not counted
+        task.request.eta = datetime.fromtimestamp(time.time() - 1, dt_timezone.utc).isoformat()
+        total = sample('celery_task_wait_seconds_sum', **labels)
+        self.run_task(task)
+        self.assertAlmostEqual(sample('celery_task_wait_seconds_sum', **labels) - total, 1, delta=0.5)
+
+    def test_outcomes_and_runtime_are_recorded_per_queue(self):
+        task = self.task(delivery_info=None)
+        task.name = 'metrics-test'
+        before = sample('celery_tasks_total', task='metrics-test', queue='default', outcome='success')
+        runtime = sample('celery_task_runtime_seconds_count', task='metrics-test', queue='default')
+
+        self.run_task(task)
+
+        self.assertEqual(sample('celery_tasks_total', task='metrics-test', queue='default', outcome='success'), before + 1)
+        self.assertEqual(sample('celery_task_runtime_seconds_count', task='metrics-test', queue='default'), runtime + 1)
+        # Eager tasks carry no enqueue time
+        self.assertEqual(sample('celery_task_wait_seconds_count', task='metrics-test', queue='default'), 0)
+        self.assertNotIn('task-1', celery_metrics._started)
+
+    def test_publishing_stamps_the_enqueue_time(self):
+        headers = {}
+        celery_metrics.stamp_enqueue_time(headers=headers)
+        self.assertAlmostEqual(headers['enqueued_at'], time.time(), delta=1)
+
+
+class QueueDepthTests(SimpleTestCase):
+
+    def setUp(self):
+        self.connection = Connection('memory://')
+        self.addCleanup(self.connection.release)
+        patch = mock.patch.object(celery_app, 'connection_for_read', return_value=self.connection)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_missing_queues_read_as_empty(self):
+        queue = Queue('email', Exchange('email'), routing_key='email')
+        with Connection('memory://') as connection:
+            producer = connection.Producer()
+            for _ in range(2):
+                producer.publish({}, exchange=queue.exchange, routing_key='email', declare=[queue])
+        self.addCleanup(lambda: Connection('memory://').default_channel.queue_delete('email'))
+        QUEUE_DEPTH.labels('suppliers').set(5)
+
+        depths = sample_queue_depths()
+
+        self.assertEqual(set(depths), {queue.name for queue in celery_app.conf.task_queues})
+        self.assertEqual(depths['email'], 2)
+        self.assertEqual(depths['suppliers'], 0)
+        self.assertEqual(sample('celery_queue_depth', queue='email'), 2)
+        self.assertEqual(sample('celery_queue_depth', queue='suppliers'), 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RequestMetricsMiddlewareTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        create_catalog(1)
+
+    def count(self, route, method='GET', status='2xx'):
+        return sample('http_request_duration_seconds_count', route=route, method=method, status=status)
+
+    def test_requests_are_labelled_by_route_name(self):
+        before = {
+            'list': self.count('product-list'),
+            'missing': self.count('product-detail', status='4xx'),
+            'unmatched': self.count('unmatched', status='4xx'),
+        }
+        size = sample('http_response_size_bytes_sum', route='product-list', method='GET', status='2xx')
+
+        response = self.client.get('/api/products/')
+        self.client.get('/api/products/no-such-product/')
+        self.client.get('/no-such-page/')
+
+        self.assertEqual(self.count('product-list'), before['list'] + 1)
+        self.assertEqual(self.count('product-detail', status='4xx'), before['missing'] + 1)
+        self.assertEqual(self.count('unmatched', status='4xx'), before['unmatched'] + 1)
+        self.assertEqual(
+            sample('http_response_size_bytes_sum', route='product-list', method='GET', status='2xx') - size,
+            len(response.content),
+        )
+
+    def test_unknown_methods_share_one_label(self):
+        before = self.count('product-list', method='OTHER', status='4xx')
+
+        self.client.generic('PROPFIND', '/api/products/')
+        self.client.generic('BREW', '/api/products/')
+
+        self.assertEqual(self.count('product-list', method='OTHER', status='4xx'), before + 2)
+        self.assertEqual(self.count('product-list', method='BREW', status='4xx'), 0)
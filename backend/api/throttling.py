@@ -0,0 +1,188 @@
+import hashlib
+import math
+import threading
+import time
+import redis
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.throttling import BaseThrottle
+
+
+# Checks every bucket in KEYS and takes one token from each only if all of
+# them have one, so the request is counted against IP, user and email at
+# once. ARGV holds the capacity and refill rate (tokens/second) of the
+# buckets. Returns {allowed, seconds to wait as a string}.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local ttl = math.ceil(capacity / rate) + 1
+
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+end
+
+local allowed = 0
+if wait == 0 then
+    allowed = 1
+end
+
+for i, key in ipairs(KEYS) do
+    local tokens = levels[i]
+    if allowed == 1 then
+        tokens = tokens - 1
+    end
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', key, ttl)
+end
+
+return {allowed, tostring(wait)}
+"""
+
+
+class RedisTokenBucket:
+    """Token buckets stored in Redis, updated atomically by a Lua script."""
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def consume(self, keys, capacity, rate):
+        allowed, wait = self.script(keys=keys, args=[capacity, rate])
+        return bool(allowed), float(wait)
+
+
+class MemoryTokenBucket:
+    """In-process token buckets with the same behaviour, for tests and development."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def consume(self, keys, capacity, rate):
+        now = time.monotonic()
+        with self.lock:
+            levels = []
+            wait = 0
+            for key in keys:
+                tokens, ts = self.buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + max(0, now - ts) * rate)
+                levels.append(tokens)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+
+            allowed = wait == 0
+            for key, tokens in zip(keys, levels):
+                self.buckets[key] = (tokens - 1 if allowed else tokens, now)
+
+        return allowed, wait
+
+
+_bucket_backend = None
+_bucket_backend_lock = threading.Lock()
+
+
+def get_bucket_backend():
+    global _bucket_backend
+    if _bucket_backend is None:
+        with _bucket_backend_lock:
+            if _bucket_backend is None:
+                if settings.TOKEN_BUCKET_BACKEND == 'memory':
+                    _bucket_backend = MemoryTokenBucket()
+                else:
+                    _bucket_backend = RedisTokenBucket(settings.TOKEN_BUCKET_REDIS_URL)
+    return _bucket_backend
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttle backed by token buckets, one per client identity.
+
+    Limits come from settings.TOKEN_BUCKET_RATES[scope], as a bucket
+    `capacity` (burst size) and `refill_per_minute`. Identities are read from
+    the request without queries of their own; authentication has already
+    run by then. The client IP comes from REMOTE_ADDR, or from
+    X-Forwarded-For as far as REST_FRAMEWORK['NUM_PROXIES'] trusts it.
+    """
+    scope = None
+    identities = ('ip',)
+
+    def __init__(self):
+        self.wait_seconds = None
+        self.limits = self.get_limits()
+
+    def get_limits(self):
+        """
+        Return the scope's (capacity, refill per second), or None if it is
+        not limited. Both must be positive: the bucket expiry divides by the rate.
+        """
+        limits = settings.TOKEN_BUCKET_RATES.get(self.scope)
+        if not limits:
+            return None
+
+        capacity, per_minute = limits['capacity'], limits['refill_per_minute']
+        if capacity <= 0 or per_minute <= 0:
+            raise ImproperlyConfigured(
+                f"TOKEN_BUCKET_RATES['{self.scope}'] needs a positive capacity and refill_per_minute."
+            )
+        return capacity, per_minute / 60
+
+    def get_identities(self, request, view):
+        values = []
+        if 'ip' in self.identities:
+            values.append(f'ip:{self.get_ident(request)}')
+
+        if 'user' in self.identities and request.user and request.user.is_authenticated:
+            values.append(f'user:{request.user.pk}')
+
+        if 'email' in self.identities:
+            email = request.data.get('email') if hasattr(request.data, 'get') else None
+            if isinstance(email, str) and email.strip():
+                digest = hashlib.sha1(email.strip().lower().encode('utf-8')).hexdigest()
+                values.append(f'email:{digest}')
+
+        return values
+
+    def allow_request(self, request, view):
+        if not self.limits:
+            return True
+
+        keys = [f'throttle:{self.scope}:{identity}' for identity in self.get_identities(request, view)]
+        capacity, rate = self.limits
+
+        try:
+            allowed, wait = get_bucket_backend().consume(keys, capacity, rate)
+        except redis.RedisError:
+            # Fail open rather than take the endpoint down with Redis
+            return True
+
+        self.wait_seconds = wait
+        return allowed
+
+    def wait(self):
+        return math.ceil(self.wait_seconds) if self.wait_seconds else None
+
+
+class CheckoutThrottle(TokenBucketThrottle):
+    scope = 'checkout'
+    identities = ('ip', 'user', 'email')
+
+
+class RegistrationThrottle(TokenBucketThrottle):
+    scope = 'registration'
+    identities = ('ip', 'email')
+
+
+class TokenObtainThrottle(TokenBucketThrottle):
+    scope = 'token'
+    identities = ('ip', 'email')
@@ -1,13 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
     TokenRefreshView,
     TokenVerifyView,
 )
-from users.views import UserViewSet, CashbackTransactionViewSet
+from users.views import UserViewSet, CashbackTransactionViewSet, TokenObtainPairView
 from products.views import CategoryViewSet, PlatformViewSet, ProductViewSet, AdminProductViewSet
-from orders.views import OrderViewSet, StripeWebhookView
+from orders.views import OrderViewSet, CartViewSet, StripeWebhookView
+from suppliers.views import SupplierStockWebhookView
+from analytics.views import SalesAnalyticsViewSet
 
 
 # Create a router and register our viewsets
@@ -25,6 +26,10 @@ router.register(r'admin/products', AdminProductViewSet, basename='admin-product'
 
 # Order endpoints
 router.register(r'orders', OrderViewSet, basename='order')
+router.register(r'cart', CartViewSet, basename='cart')
+
+# Analytics endpoints
+router.register(r'admin/analytics/sales', SalesAnalyticsViewSet, basename='admin-sales-analytics')
 
 # API URLs
 urlpatterns = [
@@ -38,4 +43,5 @@ urlpatterns = [
     
     # Webhook endpoints
     path('webhooks/stripe/', StripeWebhookView.as_view(), name='stripe-webhook'),
+    path('webhooks/suppliers/<int:supplier_id>/stock/', SupplierStockWebhookView.as_view(), name='supplier-stock-webhook'),
 ]
\ No newline at end of file
@@ -0,0 +1,5 @@
+# Load the Celery app when Django starts, so tasks queued from the web
+# process use its broker settings and signal handlers
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
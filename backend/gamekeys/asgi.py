@@ -0,0 +1,27 @@
+"""
+ASGI config for gamekeys project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Requests served here use gamekeys.asgi_urls, which routes the hot catalog
+and profile reads to async views and everything else to the regular API.
+"""
+
+import os
+import django
+from django.core.handlers.asgi import ASGIHandler
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gamekeys.settings')
+
+
+class GameKeysASGIHandler(ASGIHandler):
+    """ASGI handler that resolves requests against the async URLconf."""
+
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = 'gamekeys.asgi_urls'
+        return request, error_response
+
+
+django.setup(set_prefix=False)
+application = GameKeysASGIHandler()
@@ -0,0 +1,23 @@
+from django.urls import path, re_path
+from products.async_views import (
+    AsyncProductListView, AsyncProductDetailView,
+    AsyncFeaturedProductsView, AsyncOnSaleProductsView,
+)
+from users.async_views import AsyncUserMeView
+from .urls import urlpatterns as wsgi_urlpatterns
+
+
+# URLconf used under ASGI: the hot read endpoints are served by async views
+# with the same paths and JSON as the API viewsets, everything else falls
+# through to the regular URLconf.
+urlpatterns = [
+    path('api/products/', AsyncProductListView.as_view(), name='product-list'),
+    path('api/products/featured/', AsyncFeaturedProductsView.as_view(), name='product-featured'),
+    path('api/products/on_sale/', AsyncOnSaleProductsView.as_view(), name='product-on-sale'),
+    re_path(
+        r'^api/products/(?!featured/$|on_sale/$|by_category/$|by_platform/$)(?P<slug>[^/.]+)/$',
+        AsyncProductDetailView.as_view(),
+        name='product-detail'
+    ),
+    path('api/users/me/', AsyncUserMeView.as_view(), name='user-me'),
+] + wsgi_urlpatterns
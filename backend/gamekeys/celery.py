@@ -1,6 +1,7 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
+from kombu import Queue
 
 # Set the default Django settings module for the 'celery' program
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gamekeys.settings')
@@ -14,12 +15,57 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs
 app.autodiscover_tasks()
 
+# Connect the signal handlers that record task wait, runtime and outcome
+import api.celery_metrics  # noqa: E402,F401
+
+# Each workload gets its own queue, so a supplier sync or an email backlog
+# cannot hold up fulfillment. Workers are started per queue with their own
+# concurrency and prefetch settings (see docker/docker-compose.yml); a
+# worker started without -Q consumes every queue, which suits development.
+app.conf.task_default_queue = 'default'
+app.conf.task_queues = [
+    Queue(name) for name in ('fulfillment', 'payments', 'email', 'suppliers', 'analytics', 'default')
+]
+
+# Priorities order tasks within a queue. The Redis broker treats 0 as the
+# highest priority (see CELERY_BROKER_TRANSPORT_OPTIONS in settings). They
+# are set per route only: task_default_priority would become every task's
+# own priority, which takes precedence over the route's.
+
+app.conf.task_routes = {
+    'orders.tasks.fulfill_paid_order': {'queue': 'fulfillment', 'priority': 0},
+    'orders.tasks.process_stripe_event': {'queue': 'payments', 'priority': 0},
+    'orders.tasks.send_order_confirmation_email': {'queue': 'email', 'priority': 3},
+    # Buffer refills keep external fulfillment fast, so they jump the sync backlog
+    'suppliers.tasks.refill_key_buffers': {'queue': 'suppliers', 'priority': 0},
+    'suppliers.tasks.apply_supplier_stock_updates': {'queue': 'suppliers', 'priority': 3},
+    'suppliers.tasks.sync_supplier_stock': {'queue': 'suppliers', 'priority': 9},
+    'orders.tasks.sync_external_products': {'queue': 'suppliers', 'priority': 9},
+    'analytics.tasks.*': {'queue': 'analytics'},
+    # Sampled next to the latency-sensitive work, so a backed up
+    # default queue cannot hide its own depth
+    'api.tasks.sample_queue_depths': {'queue': 'payments', 'priority': 9},
+}
+
 # Configure periodic tasks
 app.conf.beat_schedule = {
     'sync-external-products': {
         'task': 'orders.tasks.sync_external_products',
         'schedule': crontab(hour='*/6'),  # Run every 6 hours
     },
+    'refill-key-buffers': {
+        'task': 'suppliers.tasks.refill_key_buffers',
+        'schedule': crontab(minute='*/10'),  # Run every 10 minutes
+    },
+    'purge-idempotency-keys': {
+        'task': 'api.tasks.purge_idempotency_keys',
+        'schedule': crontab(minute=0),  # Run every hour
+    },
+    'sample-queue-depths': {
+        'task': 'api.tasks.sample_queue_depths',
+        'schedule': 30.0,  # Run every 30 seconds
+        'options': {'expires': 30},
+    },
 }
 
 
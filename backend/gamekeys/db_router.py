@@ -0,0 +1,146 @@
+import hashlib
+import random
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.backends.signals import connection_created
+from api.metrics import DB_QUERIES
+
+
+# Models whose reads may be served by a replica during safe requests:
+# the public catalog and order/cashback history.
+REPLICA_READ_APPS = {'products'}
+REPLICA_READ_MODELS = {'orders.order', 'orders.orderitem', 'users.cashbacktransaction'}
+
+# Replica the current request reads from, picked once per request so its
+# reads see one consistent copy; None reads everything from the primary
+_request_replica = ContextVar('request_replica', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends catalog and history reads to a replica while a safe request from
+    an unpinned client is being served. Everything else, including all
+    reads outside such requests (tasks, commands, checkout), uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS:
+            return None
+        replica = _request_replica.get()
+        if replica is None:
+            return 'default'
+
+        if model._meta.app_label in REPLICA_READ_APPS or model._meta.label_lower in REPLICA_READ_MODELS:
+            return replica
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The primary and its replicas hold the same data
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def _pin_key(request):
+    """Identify the client by its credentials, session or address."""
+    identity = (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        or request.META.get('REMOTE_ADDR', '')
+    )
+    return 'db-pin:' + hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+
+def _pick_replica():
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Picks one replica for each GET/HEAD/OPTIONS request to read from, and
+    pins a client to the primary for REPLICA_PIN_SECONDS after any other
+    request of theirs, so they always read their own writes. Safe requests
+    are expected not to write.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        pin_key = _pin_key(request)
+        safe = request.method in SAFE_METHODS
+        replica = _pick_replica() if safe and not cache.get(pin_key) else None
+
+        token = _request_replica.set(replica)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_replica.reset(token)
+            if not safe:
+                cache.set(pin_key, True, timeout=settings.REPLICA_PIN_SECONDS)
+
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        pin_key = _pin_key(request)
+        safe = request.method in SAFE_METHODS
+        replica = _pick_replica() if safe and not await cache.aget(pin_key) else None
+
+        token = _request_replica.set(replica)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_replica.reset(token)
+            if not safe:
+                await cache.aset(pin_key, True, timeout=settings.REPLICA_PIN_SECONDS)
+
+        return response
+
+
+# Queries per alias, exported on /metrics as db_queries_total
+def _count_query(alias):
+    queries = DB_QUERIES.labels(alias)
+
+    def wrapper(execute, sql, params, many, context):
+        queries.inc()
+        return execute(sql, params, many, context)
+    wrapper.counts_queries = True
+    return wrapper
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    if not any(getattr(wrapper, 'counts_queries', False) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(_count_query(connection.alias))
+
+
+connection_created.connect(_install_query_counter)
+
+# Connections opened before this module was imported
+for _connection in connections.all(initialized_only=True):
+    _install_query_counter(sender=None, connection=_connection)
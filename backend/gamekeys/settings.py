@@ -49,19 +49,24 @@ INSTALLED_APPS = [
     'products',
     'orders',
     'suppliers',
+    'analytics',
     'api',
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',  # Per-route latency metrics
+    'api.middleware.CompressionMiddleware',  # Brotli/gzip responses
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # For static files
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS headers
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
+    'gamekeys.db_router.ReplicaRoutingMiddleware',  # Replica reads
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.profiling.RequestProfilerMiddleware',  # Opt-in request profiling
     'debug_toolbar.middleware.DebugToolbarMiddleware',  # Debug toolbar
 ]
 
@@ -93,6 +98,19 @@ DATABASES = {
     'default': env.db()
 }
 
+# Read replicas, used for catalog and history reads (see gamekeys.db_router)
+DATABASE_REPLICAS = []
+for index, replica_url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[]), start=1):
+    alias = f'replica_{index}'
+    DATABASES[alias] = env.db_url_config(replica_url)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['gamekeys.db_router.PrimaryReplicaRouter']
+
+# Seconds a client reads from the primary after writing
+REPLICA_PIN_SECONDS = env.int('REPLICA_PIN_SECONDS', default=10)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -145,7 +163,7 @@ AUTH_USER_MODEL = 'users.User'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.JWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
@@ -158,6 +176,19 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # orjson when installed, same output as DRF's JSONRenderer/JSONParser
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    # Proxies in front of the app that append to X-Forwarded-For. With 0,
+    # throttles use REMOTE_ADDR, so clients cannot pick their own IP
+    'NUM_PROXIES': env.int('NUM_PROXIES', default=0),
 }
 
 # SimpleJWT settings
@@ -166,6 +197,34 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    # Tokens carry a hash of the password so password changes revoke them
+    'CHECK_REVOKE_TOKEN': True,
+    # Rotated refresh tokens are blacklisted in the cache
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.TokenRefreshSerializer',
+    'TOKEN_VERIFY_SERIALIZER': 'users.serializers.TokenVerifySerializer',
+}
+
+# Seconds an authenticated user is cached for JWT requests
+AUTH_USER_CACHE_TIMEOUT = env.int('AUTH_USER_CACHE_TIMEOUT', default=60)
+
+# Token bucket throttling: 'redis', or 'memory' for an in-process fake
+TOKEN_BUCKET_BACKEND = env('TOKEN_BUCKET_BACKEND', default='redis')
+TOKEN_BUCKET_REDIS_URL = env('REDIS_URL')
+
+# Bucket size (burst) and refill rate per throttle scope
+TOKEN_BUCKET_RATES = {
+    'checkout': {
+        'capacity': env.int('THROTTLE_CHECKOUT_CAPACITY', default=10),
+        'refill_per_minute': env.int('THROTTLE_CHECKOUT_PER_MINUTE', default=5),
+    },
+    'registration': {
+        'capacity': env.int('THROTTLE_REGISTRATION_CAPACITY', default=5),
+        'refill_per_minute': env.int('THROTTLE_REGISTRATION_PER_MINUTE', default=1),
+    },
+    'token': {
+        'capacity': env.int('THROTTLE_TOKEN_CAPACITY', default=10),
+        'refill_per_minute': env.int('THROTTLE_TOKEN_PER_MINUTE', default=5),
+    },
 }
 
 # CORS settings
@@ -177,6 +236,14 @@ INTERNAL_IPS = [
     '127.0.0.1',
 ]
 
+# Cache settings
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': env('REDIS_URL'),
+    }
+}
+
 # Celery settings
 CELERY_BROKER_URL = env('REDIS_URL')
 CELERY_RESULT_BACKEND = env('REDIS_URL')
@@ -184,6 +251,11 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Redis emulates priorities with one list per step; 0 is the highest
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': [0, 3, 6, 9],
+    'queue_order_strategy': 'priority',
+}
 
 # Email settings
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -204,4 +276,66 @@ STRIPE_SECRET_KEY = env('STRIPE_SECRET_KEY', default='')
 STRIPE_WEBHOOK_SECRET = env('STRIPE_WEBHOOK_SECRET', default='')
 
 # Cashback rate (default 5%)
-CASHBACK_RATE = env.decimal('CASHBACK_RATE', default=0.05)
\ No newline at end of file
+CASHBACK_RATE = env.decimal('CASHBACK_RATE', default=0.05)
+
+# Server-side carts live in the cache for this long after their last change
+CART_TTL = env.int('CART_TTL', default=7 * 24 * 60 * 60)
+CART_MAX_ITEMS = env.int('CART_MAX_ITEMS', default=50)
+# How long a cart quote can be turned into an order
+CART_QUOTE_TTL = env.int('CART_QUOTE_TTL', default=15 * 60)
+
+# External supplier settings
+SUPPLIER_MAX_PARALLEL_REQUESTS = env.int('SUPPLIER_MAX_PARALLEL_REQUESTS', default=4)
+SUPPLIER_CIRCUIT_FAILURE_THRESHOLD = env.int('SUPPLIER_CIRCUIT_FAILURE_THRESHOLD', default=5)
+SUPPLIER_CIRCUIT_RESET_TIMEOUT = env.int('SUPPLIER_CIRCUIT_RESET_TIMEOUT', default=60)
+SUPPLIER_PUSH_COALESCE_WINDOW = env.int('SUPPLIER_PUSH_COALESCE_WINDOW', default=5)
+SUPPLIER_PUSH_STALE_AFTER = timedelta(seconds=env.int('SUPPLIER_PUSH_STALE_AFTER', default=6 * 60 * 60))
+SUPPLIER_WEBHOOK_TOLERANCE = env.int('SUPPLIER_WEBHOOK_TOLERANCE', default=300)
+EXTERNAL_STOCK_CACHE_TIMEOUT = env.int('EXTERNAL_STOCK_CACHE_TIMEOUT', default=24 * 60 * 60)
+
+
+# Catalog settings
+CATALOG_CACHE_TIMEOUT = env.int('CATALOG_CACHE_TIMEOUT', default=5 * 60)
+PRODUCT_BULK_MAX_ROWS = env.int('PRODUCT_BULK_MAX_ROWS', default=50000)
+# Products one /api/products/batch/ request may ask for
+PRODUCT_BATCH_MAX_ITEMS = env.int('PRODUCT_BATCH_MAX_ITEMS', default=300)
+PRODUCT_BULK_CHUNK_SIZE = env.int('PRODUCT_BULK_CHUNK_SIZE', default=1000)
+
+# Admin changelists
+ADMIN_ESTIMATED_COUNT_THRESHOLD = env.int('ADMIN_ESTIMATED_COUNT_THRESHOLD', default=100000)
+ADMIN_COUNT_TIMEOUT_MS = env.int('ADMIN_COUNT_TIMEOUT_MS', default=200)
+
+# Orders and cashback transactions older than this are moved to the archive tables
+ORDER_ARCHIVE_AFTER_MONTHS = env.int('ORDER_ARCHIVE_AFTER_MONTHS', default=12)
+
+# Resized image copies written by products.tasks.generate_image_variants
+IMAGE_VARIANT_WIDTHS = env.list('IMAGE_VARIANT_WIDTHS', cast=int, default=[160, 320, 640, 960])
+IMAGE_VARIANT_QUALITY = env.int('IMAGE_VARIANT_QUALITY', default=80)
+
+# Metrics
+# Bearer token required by /metrics; the endpoint is disabled while empty
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+# Port on which each Celery worker serves its task metrics (0 disables it)
+CELERY_METRICS_PORT = env.int('CELERY_METRICS_PORT', default=0)
+
+# Staff-only request profiling, enabled while a directory is set
+REQUEST_PROFILE_DIR = env('REQUEST_PROFILE_DIR', default='')
+REQUEST_PROFILE_TOKEN_MAX_AGE = env.int('REQUEST_PROFILE_TOKEN_MAX_AGE', default=60 * 60)
+REQUEST_PROFILE_SAMPLE_INTERVAL = env.float('REQUEST_PROFILE_SAMPLE_INTERVAL', default=0.002)
+
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MIN_SIZE = env.int('COMPRESSION_MIN_SIZE', default=1024)
+# Brotli quality (0-11); higher levels cost too much CPU per response
+COMPRESSION_BROTLI_QUALITY = env.int('COMPRESSION_BROTLI_QUALITY', default=4)
+
+# Idempotency-Key support for order creation and payment confirmation.
+# Keys live in Redis, or in the database when Redis is down or the
+# backend is 'database'.
+IDEMPOTENCY_BACKEND = env('IDEMPOTENCY_BACKEND', default='redis')
+IDEMPOTENCY_REDIS_URL = env('REDIS_URL')
+# How long a response is replayed for retries with the same key
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', default=24 * 60 * 60)
+# Longest a first request may hold its key before a retry takes over
+IDEMPOTENCY_LOCK_TIMEOUT = env.int('IDEMPOTENCY_LOCK_TIMEOUT', default=60)
+# How long a concurrent retry waits for the first request's response
+IDEMPOTENCY_LOCK_WAIT = env.float('IDEMPOTENCY_LOCK_WAIT', default=10)
\ No newline at end of file
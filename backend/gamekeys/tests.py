@@ -0,0 +1,109 @@
+import os
+import tempfile
+from unittest import mock
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from prometheus_client import REGISTRY
+from products.models import Category, Platform, Product, Supplier
+from users.models import User
+from . import db_router
+from .db_router import PrimaryReplicaRouter, ReplicaRoutingMiddleware
+
+
+REPLICA = 'replica_1'
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def add_replica_database():
+    """
+    Register a second SQLite file as REPLICA, holding the catalog tables
+    only. It is not a mirror, so tests can tell which database a read hit.
+    """
+    handle, path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(handle)
+    connections.settings[REPLICA] = connections.configure_settings({
+        'default': connections.settings['default'],
+        REPLICA: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path},
+    })[REPLICA]
+    with connections[REPLICA].schema_editor() as editor:
+        for model in (Category, Platform, Supplier, Product):
+            editor.create_model(model)
+    return path
+
+
+def remove_replica_database(path):
+    connections[REPLICA].close()
+    del connections[REPLICA]
+    del connections.settings[REPLICA]
+    os.remove(path)
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], CACHES=LOCMEM_CACHES, REPLICA_PIN_SECONDS=10)
+class ReplicaRoutingTests(TestCase):
+
+    def setUp(self):
+        # Registered after the test case locked down its databases, and
+        # outside its transaction: each test gets a fresh file
+        self.addCleanup(remove_replica_database, add_replica_database())
+        cache.clear()
+        Category.objects.create(name="Primary", slug='primary')
+        Category.objects.using(REPLICA).create(name="Replica", slug='replica')
+        self.factory = RequestFactory()
+
+    def request(self, method='get', token='client-1', write=False):
+        """Run a request through the middleware; returns the category slugs it read."""
+        read = []
+
+        def view(request):
+            if write:
+                Category.objects.create(name="New", slug='new')
+            read.extend(Category.objects.values_list('slug', flat=True))
+            return HttpResponse()
+
+        request = getattr(self.factory, method)('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        ReplicaRoutingMiddleware(view)(request)
+        return read
+
+    def test_safe_requests_read_the_catalog_from_a_replica(self):
+        self.assertEqual(self.request(), ['replica'])
+
+    def test_other_reads_use_the_primary(self):
+        self.assertEqual(list(Category.objects.values_list('slug', flat=True)), ['primary'])
+        self.assertEqual(self.request(method='post'), ['primary'])
+
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(User), 'default')
+
+    def test_a_write_pins_the_client_to_the_primary(self):
+        self.assertEqual(sorted(self.request(method='post', write=True)), ['new', 'primary'])
+
+        # Reads its own write, while other clients still use the replica
+        self.assertEqual(sorted(self.request()), ['new', 'primary'])
+        self.assertEqual(self.request(token='client-2'), ['replica'])
+
+        cache.clear()
+        self.assertEqual(self.request(), ['replica'])
+
+    def test_a_request_reads_from_one_replica(self):
+        def view(request):
+            first = list(Category.objects.values_list('slug', flat=True))
+            # Routing a write does not change where the request reads
+            PrimaryReplicaRouter().db_for_write(Category)
+            return HttpResponse(first + list(Category.objects.values_list('slug', flat=True)))
+
+        request = self.factory.get('/', HTTP_AUTHORIZATION='Bearer client-1')
+        with mock.patch.object(db_router, '_pick_replica', return_value=REPLICA) as pick:
+            self.assertEqual(ReplicaRoutingMiddleware(view)(request).content, b'replicareplica')
+        pick.assert_called_once_with()
+
+    def test_queries_are_counted_per_alias(self):
+        def count(alias):
+            return REGISTRY.get_sample_value('db_queries_total', {'alias': alias}) or 0
+
+        replica, primary = count(REPLICA), count('default')
+        self.request()
+
+        self.assertEqual(count(REPLICA), replica + 1)
+        self.assertEqual(count('default'), primary)
@@ -5,6 +5,7 @@ from django.conf.urls.static import static
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
+from api.metrics import metrics_view
 
 # API Documentation
 schema_view = get_schema_view(
@@ -27,6 +28,9 @@ urlpatterns = [
     # API
     path('api/', include('api.urls')),
     
+    # Prometheus metrics
+    path('metrics', metrics_view, name='metrics'),
+    
     # API Documentation
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
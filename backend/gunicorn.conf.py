@@ -0,0 +1,23 @@
+# Gunicorn loads this file from the working directory on start.
+#
+# With PROMETHEUS_MULTIPROC_DIR set, each worker writes its metrics to
+# files in that directory and /metrics adds them up, so a scrape sees
+# every worker and not only the one that answered.
+import os
+
+
+def on_starting(server):
+    # The arbiter starts before any worker, so files left by a previous
+    # run can be removed safely
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.endswith('.db'):
+                os.remove(os.path.join(path, name))
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,80 @@
+from django.contrib import admin
+from api.admin_utils import LargeTableAdmin, export_as_csv
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    autocomplete_fields = ['product']
+    readonly_fields = ['total']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+    
+    @admin.display(description='Item total')
+    def total(self, obj):
+        # The blank "add another" row has no price yet
+        return obj.item_total if obj.price is not None else None
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = [
+        'id', 'email', 'user', 'status', 'payment_method',
+        'total', 'cashback_used', 'created_at', 'paid_at'
+    ]
+    list_select_related = ['user']
+    list_filter = ['status', 'payment_method', 'is_guest']
+    search_fields = ['=id', '=email', '=stripe_payment_intent_id', '=paypal_transaction_id']
+    raw_id_fields = ['user']
+    readonly_fields = ['created_at', 'updated_at', 'paid_at', 'fulfilled_at', 'refunded_at']
+    inlines = [OrderItemInline]
+    actions = [
+        export_as_csv([
+            ('id', 'ID'),
+            ('email', 'Email'),
+            ('user_id', 'User ID'),
+            ('status', 'Status'),
+            ('payment_method', 'Payment method'),
+            ('subtotal', 'Subtotal'),
+            ('cashback_used', 'Cashback used'),
+            ('total', 'Total'),
+            ('cashback_earned', 'Cashback earned'),
+            ('created_at', 'Created at'),
+            ('paid_at', 'Paid at'),
+            ('fulfilled_at', 'Fulfilled at'),
+        ], 'orders.csv'),
+    ]
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(LargeTableAdmin):
+    list_display = ['id', 'order', 'product', 'price', 'quantity']
+    list_select_related = ['order', 'product']
+    search_fields = ['=order__id']
+    raw_id_fields = ['order']
+    autocomplete_fields = ['product']
+    ordering = ['-id']
+
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    raw_id_fields = ['product']
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(LargeTableAdmin):
+    list_display = ['id', 'email', 'user', 'status', 'total', 'created_at', 'archived_at']
+    list_select_related = ['user']
+    list_filter = ['status']
+    search_fields = ['=id', '=email']
+    raw_id_fields = ['user']
+    inlines = [ArchivedOrderItemInline]
+    
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,73 @@
+import json
+from django.db import transaction
+from rest_framework.utils.encoders import JSONEncoder
+from products.models import SoldKey
+from users.models import CashbackTransaction, ArchivedCashbackTransaction
+from .models import Order, ArchivedOrder, ArchivedOrderItem
+from .serializers import key_representation
+
+
+# Orders that can no longer change
+ARCHIVABLE_STATUSES = ('FULFILLED', 'FAILED', 'REFUNDED')
+
+
+def _copy(instance, model, **extra):
+    """Build an instance of `model` with the column values of `instance`."""
+    values = {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields}
+    return model(**values, **extra)
+
+
+def archive_orders(order_ids):
+    """
+    Move the given orders, with their items and a snapshot of their keys,
+    to the archive tables in one transaction. Orders that are locked or not
+    in a final status are left alone. Returns the number archived.
+    """
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(id__in=order_ids, status__in=ARCHIVABLE_STATUSES)
+            .prefetch_related('items')
+        )
+        if not orders:
+            return 0
+
+        keys = {}
+        for key in SoldKey.objects.filter(order__in=orders).select_related('product__platform').order_by('id'):
+            keys.setdefault(str(key.order_id), []).append(key_representation(key))
+        # Stored exactly as the API renders them
+        keys = json.loads(json.dumps(keys, cls=JSONEncoder))
+
+        ArchivedOrder.objects.bulk_create([
+            _copy(order, ArchivedOrder, keys=keys.get(str(order.id), []))
+            for order in orders
+        ])
+        ArchivedOrderItem.objects.bulk_create([
+            _copy(item, ArchivedOrderItem)
+            for order in orders
+            for item in order.items.all()
+        ])
+
+        # Items go with the orders; sold keys stay in the ledger without the link
+        Order.objects.filter(id__in=[order.id for order in orders]).delete()
+
+    return len(orders)
+
+
+def archive_cashback_transactions(transaction_ids):
+    """
+    Move the given cashback transactions to the archive table in one
+    transaction. Returns the number archived.
+    """
+    with transaction.atomic():
+        transactions = list(
+            CashbackTransaction.objects.select_for_update(skip_locked=True)
+            .filter(id__in=transaction_ids)
+        )
+        ArchivedCashbackTransaction.objects.bulk_create([
+            _copy(cashback, ArchivedCashbackTransaction)
+            for cashback in transactions
+        ])
+        CashbackTransaction.objects.filter(id__in=[cashback.id for cashback in transactions]).delete()
+
+    return len(transactions)
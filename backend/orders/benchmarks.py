@@ -0,0 +1,188 @@
+from decimal import Decimal
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from rest_framework.test import APIRequestFactory, force_authenticate
+from django.utils import timezone
+from api.benchmarking import benchmark
+from products.benchmarks import create_catalog
+from products.models import DigitalKey, Product, Supplier
+from suppliers.tasks import refill_key_buffers
+from .cart import build_quote
+from .fulfillment import fulfill_order
+from .models import Order, OrderItem
+from .serializers import OrderCreateSerializer, OrderKeySerializer, OrderSerializer
+from .tasks import send_order_confirmation_email
+from .views import OrderViewSet
+
+
+def create_user():
+    count = get_user_model().objects.count()
+    return get_user_model().objects.create_user(
+        username=f'benchmark{count}', email=f'benchmark{count}@example.com', password=None
+    )
+
+
+def create_order(user, products, quantity=1, status='PAID'):
+    """An order for one item per product, totals filled in."""
+    order = Order.objects.create(
+        user=user,
+        email=user.email,
+        payment_method='STRIPE',
+        subtotal=Decimal('0.00'),
+        total=Decimal('0.00'),
+        status=status,
+        paid_at=timezone.now() if status != 'PENDING' else None,
+    )
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=product, price=product.price, quantity=quantity)
+        for product in products
+    ])
+    order.calculate_total()
+    order.calculate_cashback()
+    return order
+
+
+def no_queued_tasks():
+    # Benchmarks measure the work itself, not publishing to the broker
+    patches = [
+        mock.patch.object(send_order_confirmation_email, 'delay'),
+        mock.patch.object(refill_key_buffers, 'delay'),
+    ]
+    for patch in patches:
+        patch.start()
+    return patches
+
+
+@benchmark('orders.order_serializer_50_items')
+def order_serializer(runs):
+    order = create_order(create_user(), create_catalog(50))
+    for _ in range(runs):
+        yield lambda: OrderSerializer(Order.objects.get(id=order.id)).data
+
+
+@benchmark('orders.order_key_serializer_50_items')
+def order_key_serializer(runs):
+    order = create_order(create_user(), create_catalog(50, keys_per_product=2), quantity=2)
+    for item in order.items.select_related('product'):
+        DigitalKey.allocate(item.product, item.quantity, order)
+    order.mark_as_fulfilled()
+    for _ in range(runs):
+        yield lambda: OrderKeySerializer(Order.objects.get(id=order.id)).data
+
+
+@benchmark('orders.create_serializer_10_items')
+def create_serializer(runs):
+    user = create_user()
+    products = create_catalog(10, keys_per_product=runs)
+    request = RequestFactory().post('/api/orders/', REMOTE_ADDR='127.0.0.1')
+    request.user = user
+    data = {
+        'email': user.email,
+        'items': [{'product_id': product.id, 'quantity': 1} for product in products],
+        'payment_method': 'STRIPE',
+    }
+
+    def run():
+        serializer = OrderCreateSerializer(data=data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    for _ in range(runs):
+        yield run
+
+
+@benchmark('orders.create_from_quote_10_items')
+def create_from_quote(runs):
+    user = create_user()
+    products = create_catalog(10, keys_per_product=runs)
+    request = RequestFactory().post('/api/orders/', REMOTE_ADDR='127.0.0.1')
+    request.user = user
+    owner = f'user:{user.pk}'
+    cart = {product.id: 1 for product in products}
+
+    def run(quote_id):
+        data = {'email': user.email, 'quote_id': quote_id, 'payment_method': 'STRIPE'}
+        serializer = OrderCreateSerializer(data=data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    for _ in range(runs):
+        # Quotes are single use; pricing the cart is not part of the timing
+        quote_id = build_quote(owner, cart, user)['quote_id']
+        yield lambda: run(quote_id)
+
+
+@benchmark('orders.fulfill_internal_5_items')
+def fulfill_internal(runs):
+    patches = no_queued_tasks()
+    try:
+        user = create_user()
+        products = create_catalog(5, keys_per_product=runs)
+        for _ in range(runs):
+            order = create_order(user, products)
+            yield lambda: fulfill_order(order, raise_errors=True)
+    finally:
+        for patch in patches:
+            patch.stop()
+
+
+@benchmark('orders.fulfill_external_5_items')
+def fulfill_external(runs):
+    patches = no_queued_tasks()
+    try:
+        user = create_user()
+        supplier = Supplier.objects.create(name="Benchmark supplier", api_url='https://supplier.example.com')
+        products = create_catalog(5, keys_per_product=0, is_external=True, supplier=supplier)
+        for product in products:
+            product.external_id = f'BENCH-{product.id}'
+        Product.objects.bulk_update(products, ['external_id'])
+        for _ in range(runs):
+            order = create_order(user, products)
+            yield lambda: fulfill_order(order, raise_errors=True)
+    finally:
+        for patch in patches:
+            patch.stop()
+
+
+@benchmark('orders.confirmation_email_render_20_items')
+def confirmation_email_render(runs):
+    order = create_order(create_user(), create_catalog(20))
+    for item in order.items.select_related('product'):
+        DigitalKey.allocate(item.product, item.quantity, order)
+
+    def run():
+        context = {
+            'order': order,
+            'items': order.items.all(),
+            'keys': order.purchased_keys.select_related('product__platform'),
+            'site_name': settings.SITE_NAME,
+            'site_url': settings.SITE_URL,
+        }
+        render_to_string('emails/order_confirmation.html', context)
+
+    for _ in range(runs):
+        yield run
+
+
+def my_orders_benchmark(name, fields):
+    @benchmark(f'orders.my_orders_view_20.{name}')
+    def my_orders(runs):
+        user = create_user()
+        products = create_catalog(3)
+        for _ in range(20):
+            create_order(user, products)
+        view = OrderViewSet.as_view({'get': 'my_orders'})
+        url = f'/api/orders/my_orders/?fields={fields}' if fields else '/api/orders/my_orders/'
+        for _ in range(runs):
+            request = APIRequestFactory().get(url)
+            force_authenticate(request, user)
+            yield lambda: view(request)
+
+
+# Sparse fieldsets skip the item prefetches; the query counts show it
+my_orders_benchmark('all_fields', None)
+my_orders_benchmark('sparse', 'id,status,total')
+my_orders_benchmark('sparse_items', 'id,items.price,items.quantity')
@@ -0,0 +1,207 @@
+import uuid
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from products.cache import get_cached_catalog_many
+from products.models import Product
+from products.serializers import format_price
+from suppliers.stock import get_external_stock_many
+
+
+# Guests send the cart_id they were given back in this header
+CART_ID_HEADER = 'HTTP_X_CART_ID'
+
+
+def _cart_key(owner):
+    return f'cart:{owner}'
+
+
+def _quote_key(quote_id):
+    return f'cart-quote:{quote_id}'
+
+
+def guest_cart_owner(request):
+    """'guest:<cart id>' for a well-formed X-Cart-Id header, else None."""
+    try:
+        return f'guest:{uuid.UUID(request.META[CART_ID_HEADER]).hex}'
+    except (KeyError, ValueError):
+        return None
+
+
+def request_cart_owner(request):
+    """The cart owner of a request: the signed-in user, or the guest cart id."""
+    if request.user and request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return guest_cart_owner(request)
+
+
+def new_guest_owner():
+    return f'guest:{uuid.uuid4().hex}'
+
+
+def cart_id(owner):
+    """The id a guest sends back as X-Cart-Id; None for users' carts."""
+    return owner[len('guest:'):] if owner.startswith('guest:') else None
+
+
+def get_cart(owner):
+    """{product_id: quantity} of a cart; empty once it has expired."""
+    return cache.get(_cart_key(owner)) or {}
+
+
+def save_cart(owner, items):
+    """Store a cart for another CART_TTL seconds. Empty carts are dropped."""
+    if items:
+        cache.set(_cart_key(owner), items, timeout=settings.CART_TTL)
+    else:
+        cache.delete(_cart_key(owner))
+
+
+def remove_from_cart(owner, product_ids):
+    """Drop products from a cart, as once they have been ordered."""
+    items = get_cart(owner)
+    if any(product_id in items for product_id in product_ids):
+        save_cart(owner, {
+            product_id: quantity for product_id, quantity in items.items() if product_id not in product_ids
+        })
+
+
+def merged_items(items, guest_items):
+    """
+    A user's cart items with a guest cart's merged in. Guest quantities
+    win; products new to the user's cart are added only up to
+    CART_MAX_ITEMS, and the rest are dropped.
+    """
+    items = dict(items)
+    for product_id, quantity in guest_items.items():
+        if product_id in items or len(items) < settings.CART_MAX_ITEMS:
+            items[product_id] = quantity
+    return items
+
+
+def merge_guest_cart(owner, guest_owner):
+    """Move a guest cart into a user's cart after they sign in."""
+    guest_items = get_cart(guest_owner)
+    if guest_items:
+        save_cart(owner, merged_items(get_cart(owner), guest_items))
+        cache.delete(_cart_key(guest_owner))
+
+
+def quote_products(product_ids):
+    """
+    {product_id: {'name', 'price', 'is_external', 'available_keys'}} for
+    active products, False for the rest, from the catalog cache. Misses
+    are loaded together with one query.
+    """
+    names = {product_id: f'quote-product:{product_id}' for product_id in product_ids}
+
+    def build(missing):
+        ids = [product_id for product_id, name in names.items() if name in missing]
+        rows = (
+            Product.objects.filter(id__in=ids, is_active=True)
+            .with_availability(count=True)
+            .values('id', 'name', 'price', 'sale_price', 'is_external', 'available_keys')
+        )
+        built = dict.fromkeys(missing, False)
+        for row in rows:
+            built[names[row['id']]] = {
+                'name': row['name'],
+                # Same as Product.current_price
+                'price': row['sale_price'] or row['price'],
+                'is_external': row['is_external'],
+                'available_keys': row['available_keys'],
+            }
+        return built
+
+    cached = get_cached_catalog_many(list(names.values()), build)
+    return {product_id: cached.get(name, False) for product_id, name in names.items()}
+
+
+def build_quote(owner, items, user=None):
+    """
+    Price a cart's items and check their stock from cached catalog and
+    supplier stock data. When every line can be ordered, the quote is
+    stored for CART_QUOTE_TTL seconds and its quote_id can be passed to
+    order creation instead of the items.
+    """
+    products = quote_products(list(items))
+    external_ids = [product_id for product_id, product in products.items() if product and product['is_external']]
+    external_stock = get_external_stock_many(external_ids) if external_ids else {}
+
+    lines = []
+    stored = []
+    subtotal = Decimal('0.00')
+    for product_id, quantity in items.items():
+        product = products[product_id]
+        if not product:
+            lines.append({
+                'product_id': product_id,
+                'quantity': quantity,
+                'available': False,
+                'error': f"Product with ID {product_id} does not exist.",
+            })
+            continue
+
+        if product['is_external']:
+            # Same fallback as Product.available_keys_count
+            available_keys = external_stock.get(product_id, 999)
+        else:
+            available_keys = product['available_keys']
+
+        item_total = product['price'] * quantity
+        subtotal += item_total
+        line = {
+            'product_id': product_id,
+            'name': product['name'],
+            'price': format_price(product['price']),
+            'quantity': quantity,
+            'item_total': format_price(item_total),
+            'available': available_keys >= quantity,
+        }
+        if available_keys < 1:
+            line['error'] = f"Product {product['name']} is out of stock."
+        elif available_keys < quantity:
+            line['error'] = (
+                f"Not enough keys available for {product['name']}. "
+                f"Only {available_keys} left."
+            )
+        lines.append(line)
+        stored.append((product_id, quantity, str(product['price'])))
+
+    # Guests earn no cashback, as in Order.calculate_cashback()
+    cashback_earned = round(subtotal * cashback_rate(), 2) if user else Decimal('0.00')
+    valid = bool(lines) and all(line['available'] for line in lines)
+
+    quote_id = None
+    if valid:
+        quote_id = uuid.uuid4().hex
+        cache.set(_quote_key(quote_id), (owner, stored), timeout=settings.CART_QUOTE_TTL)
+
+    return {
+        'quote_id': quote_id,
+        'valid': valid,
+        'items': lines,
+        'subtotal': format_price(subtotal),
+        'cashback_earned': format_price(cashback_earned),
+        'expires_in': settings.CART_QUOTE_TTL if valid else None,
+    }
+
+
+def take_quote(quote_id, owner):
+    """
+    Remove a stored quote and return its [(product_id, quantity, price)]
+    lines, or None if it expired, was used already or belongs to another
+    cart owner. Each quote can be turned into one order only.
+    """
+    key = _quote_key(quote_id)
+    quote = cache.get(key)
+    if quote is None or quote[0] != owner:
+        return None
+    if not cache.delete(key):
+        # A concurrent request took it first
+        return None
+    return [(product_id, quantity, Decimal(price)) for product_id, quantity, price in quote[1]]
+
+
+def cashback_rate():
+    return Decimal(str(settings.CASHBACK_RATE))
@@ -0,0 +1,196 @@
+from django.core.cache import cache
+from django.db import transaction
+from products.models import DigitalKey
+from suppliers.procurement import buy_missing_keys, procure_external_keys
+from suppliers.tasks import refill_key_buffers
+from .models import ArchivedOrder, Order
+from .tasks import fulfill_paid_order, send_order_confirmation_email
+
+
+# Held while an order buys keys from suppliers and is fulfilled, so the
+# webhook task and confirm_payment cannot both buy its missing keys
+FULFILLMENT_LOCK_TIMEOUT = 10 * 60
+
+
+def _fulfillment_lock(order_id):
+    return f'order-fulfillment:{order_id}'
+
+
+def fulfill_order(order, raise_errors=False):
+    """
+    Fulfill an order by assigning keys and sending confirmation email.
+    Keys missing from external products' buffers are bought first, with no
+    transaction open. The order row is then locked while keys are
+    assigned, so the webhook task and confirm_payment cannot both fulfill
+    it. Returns False if another call is already fulfilling the order.
+    Errors are logged and reported by returning False unless `raise_errors`.
+    """
+    if not cache.add(_fulfillment_lock(order.pk), True, timeout=FULFILLMENT_LOCK_TIMEOUT):
+        return False
+
+    try:
+        current = Order.objects.get(pk=order.pk)
+        if not current.is_paid or current.is_fulfilled:
+            return False
+
+        external_items = [
+            item for item in current.items.select_related('product__supplier')
+            if item.product.is_external
+        ]
+        if external_items:
+            buy_missing_keys(current, external_items)
+
+        with transaction.atomic():
+            # Re-read under the lock; the caller's copy may be stale
+            locked = Order.objects.select_for_update().get(pk=order.pk)
+
+            # Only process if the order is paid but not yet fulfilled
+            if not locked.is_paid or locked.is_fulfilled:
+                return False
+
+            # Get all items in the order
+            order_items = locked.items.select_related('product__supplier')
+            external_items = []
+
+            # Assign keys for each item
+            for item in order_items:
+                product = item.product
+                quantity = item.quantity
+
+                if product.is_external:
+                    # External keys are assigned together below
+                    external_items.append(item)
+                else:
+                    # For internal products, move keys from the pool to the
+                    # sold ledger. Raises ValueError if there are not enough;
+                    # in a real app, you might notify admin and handle this case
+                    DigitalKey.allocate(product, quantity, locked)
+
+            # For external products, take the keys bought above and draw
+            # the rest from the buffer
+            if external_items:
+                drawn_products = procure_external_keys(locked, external_items)
+                if drawn_products:
+                    transaction.on_commit(lambda: refill_key_buffers.delay(drawn_products))
+
+            # Mark order as fulfilled
+            locked.mark_as_fulfilled()
+
+            # Add cashback to user's balance if applicable
+            if locked.cashback_earned > 0 and locked.user and not locked.is_guest:
+                locked.add_cashback_to_user()
+
+            # Send confirmation email
+            transaction.on_commit(lambda: send_order_confirmation_email.delay(locked.id))
+
+        order.status = locked.status
+        order.fulfilled_at = locked.fulfilled_at
+        return True
+
+    except Exception as e:
+        # Log the error and handle accordingly
+        print(f"Error fulfilling order {order.id}: {str(e)}")
+        if raise_errors:
+            raise
+        return False
+
+    finally:
+        cache.delete(_fulfillment_lock(order.pk))
+
+
+def mark_order_paid(order):
+    """
+    Mark an order as paid unless it already is. The row is locked, so the
+    webhook and confirm_payment cannot both do it. Returns whether this
+    call marked it.
+    """
+    with transaction.atomic():
+        locked = Order.objects.select_for_update().get(pk=order.pk)
+        if locked.is_paid:
+            return False
+        locked.mark_as_paid()
+
+    order.status = locked.status
+    order.paid_at = locked.paid_at
+    return True
+
+
+def handle_payment_success(payment_intent):
+    """
+    Handle successful Stripe payment.
+    """
+    # Get the order ID from metadata
+    order_id = payment_intent.get('metadata', {}).get('order_id')
+
+    if not order_id:
+        return
+
+    try:
+        # Find the order
+        order = Order.objects.get(id=order_id)
+
+        # Only process if the order is not already paid
+        if not mark_order_paid(order):
+            return
+
+        # Assign keys and send the email on the fulfillment queue
+        fulfill_paid_order.delay(order.id)
+
+    except Order.DoesNotExist:
+        # Order not found - log this event
+        print(f"Webhook error: Order {order_id} not found")
+
+
+def handle_payment_failure(payment_intent):
+    """
+    Handle failed Stripe payment.
+    """
+    # Get the order ID from metadata
+    order_id = payment_intent.get('metadata', {}).get('order_id')
+
+    if not order_id:
+        return
+
+    try:
+        # Find the order
+        order = Order.objects.get(id=order_id)
+
+        # Update order status to failed
+        order.status = 'FAILED'
+        order.save(update_fields=['status'])
+
+        # You might want to notify the customer here
+
+    except Order.DoesNotExist:
+        # Order not found - log this event
+        print(f"Webhook error: Order {order_id} not found")
+
+
+def handle_refund(charge):
+    """
+    Handle a fully refunded Stripe charge.
+    """
+    payment_intent_id = charge.get('payment_intent')
+
+    if not payment_intent_id or not charge.get('refunded'):
+        return
+
+    order = (
+        Order.objects.filter(stripe_payment_intent_id=payment_intent_id).first()
+        # Refunds can come in after the order was archived
+        or ArchivedOrder.objects.filter(stripe_payment_intent_id=payment_intent_id).first()
+    )
+    if order is None:
+        # Order not found - log this event
+        print(f"Webhook error: No order for payment intent {payment_intent_id}")
+        return
+
+    if order.is_paid:
+        order.mark_as_refunded()
+
+
+STRIPE_EVENT_HANDLERS = {
+    'payment_intent.succeeded': handle_payment_success,
+    'payment_intent.payment_failed': handle_payment_failure,
+    'charge.refunded': handle_refund,
+}
@@ -0,0 +1,90 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from orders.archive import ARCHIVABLE_STATUSES, archive_orders, archive_cashback_transactions
+from orders.models import Order
+from users.models import CashbackTransaction
+
+
+def month_start(moment):
+    return moment.astimezone(dt_timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(moment, months):
+    month = moment.month - 1 + months
+    return moment.replace(year=moment.year + month // 12, month=month % 12 + 1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move fulfilled, failed and refunded orders (and cashback transactions) older "
+        "than a number of months to the archive tables, one month at a time in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-months', type=int, default=settings.ORDER_ARCHIVE_AFTER_MONTHS,
+            help="Archive rows created before the start of the month this many months ago.",
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--skip-cashback', action='store_true', help="Leave cashback transactions in place.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be archived without moving it.")
+
+    def handle(self, *args, **options):
+        if options['older_than_months'] < 1:
+            raise CommandError("--older-than-months must be at least 1.")
+
+        cutoff = add_months(month_start(timezone.now()), -options['older_than_months'])
+        self.stdout.write(f"Archiving rows created before {cutoff:%Y-%m-%d}")
+
+        started = time.monotonic()
+        orders = Order.objects.filter(status__in=ARCHIVABLE_STATUSES)
+        archived_orders = self.archive(orders, 'created_at', cutoff, archive_orders, 'orders', options)
+
+        archived_cashback = 0
+        if not options['skip_cashback']:
+            archived_cashback = self.archive(
+                CashbackTransaction.objects.all(), 'timestamp', cutoff,
+                archive_cashback_transactions, 'cashback transactions', options,
+            )
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {archived_orders} orders and {archived_cashback} cashback transactions in {elapsed:.1f}s"
+            + (" (dry run)" if options['dry_run'] else "")
+        ))
+
+    def archive(self, queryset, date_field, cutoff, archive, label, options):
+        """Archive the rows of queryset created before cutoff, oldest month first."""
+        oldest = queryset.filter(**{f'{date_field}__lt': cutoff}).order_by(date_field).values_list(date_field, flat=True).first()
+        if oldest is None:
+            return 0
+
+        total = 0
+        month = month_start(oldest)
+        while month < cutoff:
+            next_month = add_months(month, 1)
+            rows = queryset.filter(**{f'{date_field}__gte': month, f'{date_field}__lt': next_month})
+
+            if options['dry_run']:
+                archived = rows.count()
+            else:
+                archived = 0
+                batch = rows.order_by('id')
+                while True:
+                    ids = list(batch.values_list('id', flat=True)[:options['batch_size']])
+                    if not ids:
+                        break
+                    # Rows locked by running requests stay behind; carry on
+                    # after the batch so they do not stop the rest of the month
+                    archived += archive(ids)
+                    batch = rows.filter(id__gt=ids[-1]).order_by('id')
+
+            if archived:
+                self.stdout.write(f"{month:%Y-%m}: {archived} {label}")
+            total += archived
+            month = next_month
+
+        return total
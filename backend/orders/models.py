@@ -1,12 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 import uuid
 
-class Order(models.Model):
+class BaseOrder(models.Model):
     """
-    Order model to store purchases made by users or guests.
+    Fields shared by live orders and their archived copies.
     """
     STATUS_CHOICES = (
         ('PENDING', 'Pending'),
@@ -25,15 +25,6 @@ class Order(models.Model):
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     
-    # User can be null for guest checkouts
-    user = models.ForeignKey(
-        settings.AUTH_USER_MODEL,
-        on_delete=models.SET_NULL,
-        null=True,
-        blank=True,
-        related_name='orders'
-    )
-    
     # Always require an email for key delivery
     email = models.EmailField()
     
@@ -66,7 +57,7 @@ class Order(models.Model):
     cashback_used = models.DecimalField(
         max_digits=10,
         decimal_places=2,
-        default=0.00,
+        default=Decimal('0.00'),
         validators=[MinValueValidator(Decimal('0.00'))]
     )
     total = models.DecimalField(
@@ -79,7 +70,7 @@ class Order(models.Model):
     cashback_earned = models.DecimalField(
         max_digits=10,
         decimal_places=2,
-        default=0.00,
+        default=Decimal('0.00'),
         validators=[MinValueValidator(Decimal('0.00'))]
     )
     
@@ -88,11 +79,13 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     paid_at = models.DateTimeField(null=True, blank=True)
     fulfilled_at = models.DateTimeField(null=True, blank=True)
+    refunded_at = models.DateTimeField(null=True, blank=True)
     
     # IP address for basic fraud prevention
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     
     class Meta:
+        abstract = True
         ordering = ['-created_at']
     
     def __str__(self):
@@ -106,6 +99,42 @@ class Order(models.Model):
     def is_fulfilled(self):
         return self.status == 'FULFILLED'
     
+    def mark_as_refunded(self):
+        """Mark order as refunded and record timestamp."""
+        from django.utils import timezone
+        self.status = 'REFUNDED'
+        self.refunded_at = timezone.now()
+        self.save(update_fields=['status', 'refunded_at'])
+        self.update_sales_rollups()
+    
+    def update_sales_rollups(self):
+        """Fold this order's latest status change into the sales rollups."""
+        from analytics.tasks import update_sales_rollups
+        order_id = str(self.id)
+        transaction.on_commit(lambda: update_sales_rollups.delay(order_id))
+
+
+class Order(BaseOrder):
+    """
+    Order model to store purchases made by users or guests.
+    """
+    # User can be null for guest checkouts
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='orders'
+    )
+    
+    class Meta(BaseOrder.Meta):
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['email']),
+            models.Index(fields=['stripe_payment_intent_id']),
+        ]
+    
     def calculate_total(self):
         """Calculate order total considering cashback applied."""
         self.subtotal = sum(item.price * item.quantity for item in self.items.all())
@@ -131,6 +160,7 @@ class Order(models.Model):
         self.status = 'PAID'
         self.paid_at = timezone.now()
         self.save(update_fields=['status', 'paid_at'])
+        self.update_sales_rollups()
     
     def mark_as_fulfilled(self):
         """Mark order as fulfilled and record timestamp."""
@@ -138,6 +168,7 @@ class Order(models.Model):
         self.status = 'FULFILLED'
         self.fulfilled_at = timezone.now()
         self.save(update_fields=['status', 'fulfilled_at'])
+        self.update_sales_rollups()
     
     def add_cashback_to_user(self):
         """Add earned cashback to user's balance."""
@@ -174,4 +205,59 @@ class OrderItem(models.Model):
     
     @property
     def item_total(self):
-        return self.price * self.quantity
\ No newline at end of file
+        return self.price * self.quantity
+
+class ArchivedOrder(BaseOrder):
+    """
+    Copy of an old fulfilled, failed or refunded order moved out of the
+    live orders table by the archive_orders command.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='archived_orders'
+    )
+    
+    # Plain timestamps, so archiving keeps the original values
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    
+    # Keys delivered with the order, as returned by the order API
+    keys = models.JSONField(default=list, blank=True)
+    
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta(BaseOrder.Meta):
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['stripe_payment_intent_id']),
+        ]
+
+
+class ArchivedOrderItem(models.Model):
+    """
+    Item of an archived order, keeping the id it had while live.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(
+        ArchivedOrder,
+        on_delete=models.CASCADE,
+        related_name='items'
+    )
+    product = models.ForeignKey(
+        'products.Product',
+        on_delete=models.PROTECT,
+        related_name='archived_order_items'
+    )
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.product.name} in Order {self.order_id}"
+    
+    @property
+    def item_total(self):
+        return self.price * self.quantity
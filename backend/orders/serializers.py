@@ -1,9 +1,23 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import Order, OrderItem
-from products.models import Product, DigitalKey
+from .cart import cashback_rate, remove_from_cart, request_cart_owner, take_quote
+from .models import Order, OrderItem, ArchivedOrder
+from api.serializers import SparseFieldsetMixin
+from products.models import Product, SoldKey
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+def key_representation(key):
+    """A delivered key as it appears in an order."""
+    return {
+        'id': key.id,
+        'product_name': key.product.name,
+        'key_code': key.key_code,
+        'platform': key.product.platform.name,
+        'sold_at': key.sold_at
+    }
+
+
+class OrderItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for order items."""
     product_name = serializers.CharField(source='product.name', read_only=True)
     product_image = serializers.ImageField(source='product.image', read_only=True)
@@ -18,7 +32,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'product_name', 'product_image', 'platform', 'item_total']
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for order details."""
     items = OrderItemSerializer(many=True, read_only=True)
     
@@ -33,7 +47,7 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
-class OrderKeySerializer(serializers.ModelSerializer):
+class OrderKeySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for order with digital keys."""
     items = OrderItemSerializer(many=True, read_only=True)
     keys = serializers.SerializerMethodField()
@@ -51,29 +65,47 @@ class OrderKeySerializer(serializers.ModelSerializer):
     def get_keys(self, obj):
         """Get the digital keys for this order if fulfilled."""
         if obj.is_fulfilled:
-            keys = DigitalKey.objects.filter(order=obj)
-            return [
-                {
-                    'id': key.id,
-                    'product_name': key.product.name,
-                    'key_code': key.key_code,
-                    'platform': key.product.platform.name,
-                    'sold_at': key.sold_at
-                }
-                for key in keys
-            ]
+            if isinstance(obj, ArchivedOrder):
+                # Snapshot taken when the order was archived
+                return obj.keys
+            keys = SoldKey.objects.filter(order=obj).select_related('product__platform')
+            return [key_representation(key) for key in keys]
         return []
 
 
+class CartItemSerializer(serializers.Serializer):
+    """A cart line; quantity 0 removes the product from the cart."""
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0)
+
+
+class CartSerializer(serializers.Serializer):
+    """Cart contents as {product_id: quantity}."""
+    items = CartItemSerializer(many=True)
+    
+    def validate_items(self, value):
+        items = {item['product_id']: item['quantity'] for item in value}
+        items = {product_id: quantity for product_id, quantity in items.items() if quantity}
+        if len(items) > settings.CART_MAX_ITEMS:
+            raise serializers.ValidationError(f"A cart can hold at most {settings.CART_MAX_ITEMS} products.")
+        return items
+
+
 class OrderCreateSerializer(serializers.Serializer):
-    """Serializer for order creation."""
+    """
+    Serializer for order creation, from a list of items or from the
+    quote_id of a cart quote. Quoted items were checked when the quote
+    was made, so they are not looked up again.
+    """
     email = serializers.EmailField()
     items = serializers.ListField(
         child=serializers.DictField(
             child=serializers.IntegerField(),
             allow_empty=False
-        )
+        ),
+        required=False
     )
+    quote_id = serializers.CharField(required=False)
     payment_method = serializers.ChoiceField(choices=Order.PAYMENT_METHOD_CHOICES)
     use_cashback = serializers.BooleanField(default=False)
     
@@ -106,7 +138,7 @@ class OrderCreateSerializer(serializers.Serializer):
                     )
                 
                 validated_items.append({
-                    'product': product,
+                    'product_id': product.id,
                     'quantity': quantity,
                     'price': product.current_price,
                 })
@@ -131,6 +163,9 @@ class OrderCreateSerializer(serializers.Serializer):
                 {"use_cashback": "You must be logged in to use cashback."}
             )
         
+        if ('items' in data) == ('quote_id' in data):
+            raise serializers.ValidationError("Provide either items or quote_id.")
+        
         # Add user to validated data, or mark as guest
         data['user'] = user
         data['is_guest'] = user is None
@@ -143,6 +178,19 @@ class OrderCreateSerializer(serializers.Serializer):
             else:
                 data['ip_address'] = request.META.get('REMOTE_ADDR')
         
+        # Taken last, so a quote is only used up by a valid request
+        if 'quote_id' in data:
+            data['cart_owner'] = request_cart_owner(request) if request else None
+            lines = take_quote(data.pop('quote_id'), data['cart_owner'])
+            if lines is None:
+                raise serializers.ValidationError(
+                    {"quote_id": "This quote has expired or was already used. Request a new quote."}
+                )
+            data['items'] = [
+                {'product_id': product_id, 'quantity': quantity, 'price': price}
+                for product_id, quantity, price in lines
+            ]
+        
         return data
     
     def create(self, validated_data):
@@ -168,13 +216,15 @@ class OrderCreateSerializer(serializers.Serializer):
         )
         
         # Add items to order
-        for item in items:
-            OrderItem.objects.create(
+        OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
-                product=item['product'],
+                product_id=item['product_id'],
                 price=item['price'],
                 quantity=item['quantity']
             )
+            for item in items
+        ])
         
         # Calculate order total
         order.calculate_total()
@@ -189,6 +239,10 @@ class OrderCreateSerializer(serializers.Serializer):
                 order.calculate_total()  # Recalculate with cashback applied
         
         # Calculate potential cashback earned from this order
-        order.calculate_cashback()
+        order.calculate_cashback(cashback_rate())
+        
+        # The quoted products are ordered, so they leave the cart
+        if validated_data.get('cart_owner'):
+            remove_from_cart(validated_data['cart_owner'], [item['product_id'] for item in items])
         
         return order
\ No newline at end of file
@@ -3,71 +3,104 @@ from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
+from django.utils import timezone
 from .models import Order
 
 
-@shared_task
+# Connection and SMTP errors (smtplib.SMTPException is an OSError) are
+# retried; anything else, such as a missing order, fails the task
+@shared_task(autoretry_for=(OSError,), retry_backoff=True, retry_backoff_max=600, max_retries=6)
 def send_order_confirmation_email(order_id):
     """
     Send an email with order confirmation and the purchased digital keys.
     """
-    try:
-        # Get the order
-        order = Order.objects.get(id=order_id)
-        
-        # Get purchased keys
-        purchased_keys = order.purchased_keys.all()
-        
-        # Prepare context for the email template
-        context = {
-            'order': order,
-            'items': order.items.all(),
-            'keys': purchased_keys,
-            'site_name': settings.SITE_NAME,
-            'site_url': settings.SITE_URL,
-        }
-        
-        # Render the HTML content
-        html_content = render_to_string('emails/order_confirmation.html', context)
-        text_content = strip_tags(html_content)
-        
-        # Create the email
-        subject = f'Your Order Confirmation #{order.id}'
-        from_email = settings.DEFAULT_FROM_EMAIL
-        to_email = order.email
-        
-        # Create and send the email
-        email = EmailMultiAlternatives(
-            subject=subject,
-            body=text_content,
-            from_email=from_email,
-            to=[to_email]
-        )
-        email.attach_alternative(html_content, "text/html")
-        email.send()
-        
-        return f"Order confirmation email sent for order {order_id}"
+    # Get the order
+    order = Order.objects.get(id=order_id)
     
-    except Order.DoesNotExist:
-        return f"Error: Order {order_id} not found"
+    # Get purchased keys
+    purchased_keys = order.purchased_keys.select_related('product__platform')
+    
+    # Prepare context for the email template
+    context = {
+        'order': order,
+        'items': order.items.all(),
+        'keys': purchased_keys,
+        'site_name': settings.SITE_NAME,
+        'site_url': settings.SITE_URL,
+    }
+    
+    # Render the HTML content
+    html_content = render_to_string('emails/order_confirmation.html', context)
+    text_content = strip_tags(html_content)
+    
+    # Create the email
+    subject = f'Your Order Confirmation #{order.id}'
+    from_email = settings.DEFAULT_FROM_EMAIL
+    to_email = order.email
+    
+    # Create and send the email
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=text_content,
+        from_email=from_email,
+        to=[to_email]
+    )
+    email.attach_alternative(html_content, "text/html")
+    email.send()
     
-    except Exception as e:
-        return f"Error sending confirmation email for order {order_id}: {str(e)}"
+    return f"Order confirmation email sent for order {order_id}"
 
 
 @shared_task
 def sync_external_products():
     """
     Sync product inventory from external supplier APIs.
-    This would be scheduled to run periodically.
+    Suppliers that push stock through the webhook are skipped unless
+    they have gone quiet, so polling only covers the others.
+    """
+    from products.models import Supplier
+    from suppliers.tasks import sync_supplier_stock
+    
+    pushed_since = timezone.now() - settings.SUPPLIER_PUSH_STALE_AFTER
+    suppliers = Supplier.objects.filter(active=True).exclude(last_push_at__gte=pushed_since)
+    
+    for supplier_id in suppliers.values_list('id', flat=True):
+        sync_supplier_stock.delay(supplier_id)
+    
+    return "Product sync completed"
+
+
+@shared_task
+def fulfill_paid_order(order_id):
+    """
+    Assign keys to a paid order and send the confirmation email.
+    """
+    from .fulfillment import fulfill_order
+    
+    order = Order.objects.filter(id=order_id).first()
+    if order is None:
+        return f"Error: Order {order_id} not found"
+    
+    if not order.is_paid or order.is_fulfilled:
+        return f"Order {order_id} not fulfilled (status {order.status})"
+    
+    # Errors propagate so the task is recorded as failed. It is not retried,
+    # since keys may already have been assigned to some of the items.
+    fulfill_order(order, raise_errors=True)
+    return f"Order {order_id} fulfilled"
+
+
+@shared_task
+def process_stripe_event(event):
+    """
+    Apply a verified Stripe webhook event, queued so the webhook can
+    answer Stripe straight away.
     """
-    # This is a placeholder function where you'd implement the logic
-    # to sync with external APIs like Kinguin or CodesWholesale
+    from .fulfillment import STRIPE_EVENT_HANDLERS
     
-    # Example implementation steps:
-    # 1. Get all active suppliers
-    # 2. For each supplier, call their API to get product updates
-    # 3. Update existing products and add new ones
-    # 4. Update prices and availability
+    handler = STRIPE_EVENT_HANDLERS.get(event['type'])
+    if handler is None:
+        return f"Ignored Stripe event {event['type']}"
     
-    return "Product sync completed"
\ No newline at end of file
+    handler(event['data']['object'])
+    return f"Processed Stripe event {event['id']}"
\ No newline at end of file
@@ -0,0 +1,428 @@
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
+from rest_framework.test import APIClient
+from analytics.models import SalesEvent, SalesRollup
+from gamekeys.celery import app, debug_task
+from products.benchmarks import create_catalog
+from products.models import Product, SoldKey, Supplier
+from suppliers.clients import SupplierClient, SupplierError
+from suppliers.tasks import sync_supplier_stock
+from users.models import CashbackTransaction
+from .archive import archive_orders
+from .benchmarks import create_order, create_user
+from .management.commands import archive_orders as archive_orders_command
+from .cart import get_cart
+from .fulfillment import _fulfillment_lock, fulfill_order, handle_payment_success, handle_refund
+from .models import ArchivedOrder, Order
+from .tasks import fulfill_paid_order, send_order_confirmation_email
+from .views import OrderViewSet
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FulfillmentTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.products = create_catalog(2, keys_per_product=4)
+        self.order = create_order(self.user, self.products, quantity=2)
+        patch = mock.patch.object(send_order_confirmation_email, 'delay')
+        self.send_email = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_stale_copy_does_not_fulfill_again(self):
+        stale = Order.objects.get(pk=self.order.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(fulfill_order(self.order))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(fulfill_order(stale))
+
+        self.assertEqual(SoldKey.objects.filter(order=self.order).count(), 4)
+        self.assertEqual(CashbackTransaction.objects.filter(user=self.user).count(), 1)
+        self.send_email.assert_called_once_with(self.order.id)
+
+    def test_webhook_after_confirm_queues_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            fulfill_order(self.order)
+
+        with mock.patch.object(fulfill_paid_order, 'delay') as queue_fulfillment:
+            handle_payment_success({'metadata': {'order_id': str(self.order.id)}})
+
+        queue_fulfillment.assert_not_called()
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'FULFILLED')
+
+    def test_keys_bought_before_a_supplier_failure_are_kept(self):
+        working = Supplier.objects.create(name="Working", api_url='https://working.example.com')
+        failing = Supplier.objects.create(name="Failing", api_url='https://failing.example.com')
+        bought = create_catalog(1, keys_per_product=0, is_external=True, supplier=working)[0]
+        missing = create_catalog(1, keys_per_product=0, is_external=True, supplier=failing)[0]
+        order = create_order(self.user, [self.products[0], bought, missing])
+
+        def purchase(client, external_id, quantity):
+            if client.supplier == failing:
+                raise SupplierError("Supplier is down")
+            return [f'KEY-{n}' for n in range(quantity)]
+
+        with mock.patch.object(SupplierClient, 'purchase_keys', autospec=True, side_effect=purchase):
+            self.assertFalse(fulfill_order(order))
+
+        # The internal key allocation is rolled back; the bought key stays with the order
+        self.assertEqual(list(SoldKey.objects.filter(order=order).values_list('product_id', flat=True)), [bought.id])
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'PAID')
+
+    def test_order_another_call_is_fulfilling_is_skipped(self):
+        cache.add(_fulfillment_lock(self.order.pk), True)
+
+        self.assertFalse(fulfill_order(self.order))
+        self.assertFalse(SoldKey.objects.filter(order=self.order).exists())
+
+    def test_confirming_twice_fulfills_once(self):
+        order = create_order(self.user, self.products, status='PENDING')
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f'/api/orders/{order.id}/confirm_payment/'
+
+        with mock.patch.object(OrderViewSet, 'get_throttles', return_value=[]):
+            # Different keys, as from two tabs: only the order lock stops a second fulfillment
+            for key in ('confirm-1', 'confirm-2'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = client.post(url, {'payment_method': 'PAYPAL'}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+                self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(SoldKey.objects.filter(order=order).count(), 2)
+        self.assertEqual(CashbackTransaction.objects.filter(user=self.user).count(), 1)
+        self.send_email.assert_called_once_with(order.id)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OrderQueryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.products = create_catalog(3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_my_orders_queries_do_not_grow_with_orders(self):
+        for count in (2, 10):
+            while Order.objects.count() < count:
+                create_order(self.user, self.products)
+            # Orders, items, products, platforms and archived orders
+            with self.assertNumQueries(5):
+                orders = self.get('/api/orders/my_orders/')
+            self.assertEqual(len(orders), count)
+            self.assertEqual(orders[0]['items'][0]['platform'], 'Benchmark')
+
+    def test_my_orders_skips_the_prefetches_of_omitted_fields(self):
+        create_order(self.user, self.products)
+        for omit, queries in (('items', 2), ('items.platform', 4), ('items.platform,items.product_name,items.product_image', 3)):
+            with self.subTest(omit=omit), self.assertNumQueries(queries):
+                orders = self.get(f'/api/orders/my_orders/?omit={omit}')
+            self.assertNotIn('platform', orders[0].get('items', [{}])[0])
+
+    def test_retrieve_fulfilled_order(self):
+        order = create_order(self.user, self.products)
+        fulfill_order(order)
+
+        # Order, items, products, platforms and keys
+        with self.assertNumQueries(5):
+            data = self.get(f'/api/orders/{order.id}/')
+        self.assertEqual(len(data['keys']), 3)
+
+        with self.assertNumQueries(1):
+            data = self.get(f'/api/orders/{order.id}/?omit=items,keys')
+        self.assertNotIn('keys', data)
+        self.assertEqual(data['status'], 'FULFILLED')
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.products = create_catalog(2, keys_per_product=2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fulfilled_order(self):
+        order = create_order(self.user, self.products)
+        with mock.patch.object(send_order_confirmation_email, 'delay'):
+            fulfill_order(order)
+        return order
+
+    def test_archived_order_reads_as_it_did_live(self):
+        order = self.fulfilled_order()
+        live = self.client.get(f'/api/orders/{order.id}/').json()
+        live_list = self.client.get('/api/orders/my_orders/').json()
+
+        self.assertEqual(archive_orders([order.id]), 1)
+
+        self.assertFalse(Order.objects.filter(pk=order.pk).exists())
+        self.assertEqual(len(live['keys']), 2)
+        self.assertEqual(self.client.get(f'/api/orders/{order.id}/').json(), live)
+        self.assertEqual(self.client.get('/api/orders/my_orders/').json(), live_list)
+
+    def test_orders_that_can_still_change_are_skipped(self):
+        orders = [create_order(self.user, self.products, status=status) for status in ('PENDING', 'PAID')]
+
+        self.assertEqual(archive_orders([order.id for order in orders]), 0)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertFalse(ArchivedOrder.objects.exists())
+
+    def test_command_archives_final_orders_before_the_cutoff(self):
+        old, recent = self.fulfilled_order(), self.fulfilled_order()
+        paid = create_order(self.user, self.products)
+        Order.objects.filter(pk__in=[old.pk, paid.pk]).update(created_at=timezone.now() - timedelta(days=120))
+
+        call_command('archive_orders', older_than_months=2, skip_cashback=True, stdout=StringIO())
+
+        self.assertEqual(list(ArchivedOrder.objects.values_list('pk', flat=True)), [old.pk])
+        self.assertCountEqual(Order.objects.values_list('pk', flat=True), [recent.pk, paid.pk])
+
+    def test_command_carries_on_past_locked_orders(self):
+        orders = [create_order(self.user, self.products, status='FULFILLED') for _ in range(3)]
+        Order.objects.update(created_at=timezone.now() - timedelta(days=120))
+        calls = []
+
+        def first_batch_locked(ids):
+            calls.append(ids)
+            return 0 if len(calls) == 1 else archive_orders(ids)
+
+        with mock.patch.object(archive_orders_command, 'archive_orders', side_effect=first_batch_locked):
+            call_command('archive_orders', older_than_months=2, batch_size=1, skip_cashback=True, stdout=StringIO())
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(list(Order.objects.values_list('pk', flat=True)), calls[0])
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+        self.assertEqual({order.pk for order in orders}, {ids[0] for ids in calls})
+
+    def test_refund_of_an_archived_order(self):
+        order = self.fulfilled_order()
+        Order.objects.filter(pk=order.pk).update(stripe_payment_intent_id='pi_archived')
+        archive_orders([order.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            handle_refund({'payment_intent': 'pi_archived', 'refunded': True})
+
+        archived = ArchivedOrder.objects.get(pk=order.pk)
+        self.assertEqual(archived.status, 'REFUNDED')
+        self.assertIsNotNone(archived.refunded_at)
+        self.assertEqual(self.client.get(f'/api/orders/{order.id}/').json()['status'], 'REFUNDED')
+        self.assertEqual(
+            SalesEvent.objects.get(order_id=order.pk, event='REFUNDED').occurred_at, archived.refunded_at
+        )
+        self.assertEqual(
+            sum(SalesRollup.objects.filter(granularity='DAY').values_list('units_refunded', flat=True)),
+            sum(item.quantity for item in archived.items.all()),
+        )
+
+
+class ArchiveLockTests(TransactionTestCase):
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_locked_orders_are_skipped(self):
+        order = create_order(create_user(), create_catalog(1), status='FULFILLED')
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            with transaction.atomic():
+                Order.objects.select_for_update().get(pk=order.pk)
+                locked.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        try:
+            locked.wait(5)
+            self.assertEqual(archive_orders([order.id]), 0)
+        finally:
+            release.set()
+            holder.join()
+
+        self.assertEqual(archive_orders([order.id]), 1)
+
+@override_settings(CACHES=LOCMEM_CACHES, CART_MAX_ITEMS=3)
+class CartMergeTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.products = [product.id for product in create_catalog(5)]
+        self.client = APIClient()
+
+    def add(self, product_id, quantity, **headers):
+        response = self.client.post(
+            '/api/cart/items/', {'product_id': product_id, 'quantity': quantity}, format='json', **headers
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data['cart_id']
+
+    def items(self, response):
+        return {item['product_id']: item['quantity'] for item in response.data['items']}
+
+    def test_merge_keeps_the_cart_within_the_limit(self):
+        guest_cart = self.add(self.products[0], 1)
+        for product_id in self.products[1:3]:
+            self.add(product_id, 2, HTTP_X_CART_ID=guest_cart)
+
+        self.client.force_authenticate(self.user)
+        self.add(self.products[3], 1)
+        self.add(self.products[0], 5)
+        # The first change sent with the guest cart merges it
+        self.add(self.products[1], 4, HTTP_X_CART_ID=guest_cart)
+
+        # Guest quantities win; new products fill the cart up to the limit
+        self.assertEqual(
+            self.items(self.client.get('/api/cart/', HTTP_X_CART_ID=guest_cart)),
+            {self.products[3]: 1, self.products[0]: 1, self.products[1]: 4},
+        )
+        # The guest cart is gone, so the dropped products do not come back
+        self.assertFalse(get_cart(f'guest:{guest_cart}'))
+
+    def test_reading_the_cart_shows_the_merge_without_making_it(self):
+        guest_cart = self.add(self.products[0], 1)
+        self.client.force_authenticate(self.user)
+        self.add(self.products[1], 1)
+
+        response = self.client.get('/api/cart/', HTTP_X_CART_ID=guest_cart)
+
+        self.assertEqual(self.items(response), {self.products[1]: 1, self.products[0]: 1})
+        self.assertEqual(get_cart(f'guest:{guest_cart}'), {self.products[0]: 1})
+        self.assertEqual(get_cart(f'user:{self.user.pk}'), {self.products[1]: 1})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QuoteOrderTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.products = create_catalog(2, keys_per_product=2)
+        self.client = APIClient()
+        patch = mock.patch.object(OrderViewSet, 'get_throttles', return_value=[])
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def quote(self, **headers):
+        for product in self.products:
+            response = self.client.post(
+                '/api/cart/items/', {'product_id': product.id, 'quantity': 1}, format='json', **headers
+            )
+            if response.data['cart_id']:
+                headers['HTTP_X_CART_ID'] = response.data['cart_id']
+        response = self.client.post('/api/cart/quote/', **headers)
+        self.assertTrue(response.data['valid'])
+        return response.data['quote_id'], headers
+
+    def order(self, quote_id, **headers):
+        return self.client.post(
+            '/api/orders/',
+            {'quote_id': quote_id, 'email': 'buyer@example.com', 'payment_method': 'PAYPAL'},
+            format='json', **headers,
+        )
+
+    def test_quote_becomes_an_order_at_the_quoted_prices(self):
+        self.client.force_authenticate(self.user)
+        quote_id, _ = self.quote()
+        Product.objects.filter(pk=self.products[0].pk).update(price=Decimal('99.00'))
+
+        response = self.order(quote_id)
+
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data['order']['id'])
+        self.assertEqual(order.user, self.user)
+        self.assertCountEqual(
+            order.items.values_list('product_id', 'price'),
+            [(product.id, product.current_price) for product in self.products],
+        )
+        self.assertEqual(self.client.get('/api/cart/').data['items'], [])
+
+    def test_guest_orders_with_their_cart_id(self):
+        quote_id, headers = self.quote()
+
+        self.assertEqual(self.order(quote_id).status_code, 400)
+        response = self.order(quote_id, **headers)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['order']['is_guest'])
+        self.assertEqual(self.client.get('/api/cart/', **headers).data['items'], [])
+
+    def test_quote_is_used_once(self):
+        self.client.force_authenticate(self.user)
+        quote_id, _ = self.quote()
+
+        self.assertEqual(self.order(quote_id).status_code, 201)
+        response = self.order(quote_id)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quote_id', response.data)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_quote_of_another_owner_is_rejected(self):
+        self.client.force_authenticate(self.user)
+        quote_id, _ = self.quote()
+
+        self.client.force_authenticate(create_user())
+        self.assertEqual(self.order(quote_id).status_code, 400)
+
+        # Still usable by its owner
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.order(quote_id).status_code, 201)
+
+    def test_expired_quote_is_rejected(self):
+        self.client.force_authenticate(self.user)
+        quote_id, _ = self.quote()
+
+        expired = time.time() + settings.CART_QUOTE_TTL + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=expired):
+            response = self.order(quote_id)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class QueueRoutingTests(SimpleTestCase):
+    """Publishes through a mocked producer, as a worker per queue would see it."""
+
+    def setUp(self):
+        # The app reads Django settings with the CELERY_ namespace
+        eager = app.conf.task_always_eager
+        app.conf.update(CELERY_TASK_ALWAYS_EAGER=False)
+        self.addCleanup(app.conf.update, CELERY_TASK_ALWAYS_EAGER=eager)
+
+    def published(self, task, *args):
+        """Returns the queue a message is published to, and its priority."""
+        producer = mock.MagicMock()
+        task.apply_async(args, producer=producer)
+        publish = producer.publish.call_args.kwargs
+        # Direct queues are published through the default exchange
+        self.assertEqual(publish['exchange'], '')
+        return publish['routing_key'], publish.get('priority')
+
+    def test_fulfillment_and_supplier_syncs_use_separate_queues(self):
+        self.assertEqual(self.published(fulfill_paid_order, 1), ('fulfillment', 0))
+        self.assertEqual(self.published(sync_supplier_stock, 1), ('suppliers', 9))
+        self.assertEqual(self.published(send_order_confirmation_email, 1), ('email', 3))
+
+    def test_unrouted_tasks_use_the_default_queue(self):
+        self.assertEqual(self.published(debug_task), ('default', None))
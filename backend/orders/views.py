@@ -1,15 +1,24 @@
+import json
 from rest_framework import viewsets, status, generics
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated, AllowAny, SAFE_METHODS
 import stripe
 from django.conf import settings
 from django.utils import timezone
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from .models import Order, OrderItem
-from products.models import Product, DigitalKey
-from .serializers import OrderSerializer, OrderCreateSerializer, OrderKeySerializer
-from .tasks import send_order_confirmation_email
+from .models import Order, OrderItem, ArchivedOrder
+from .serializers import OrderSerializer, OrderCreateSerializer, OrderKeySerializer, CartSerializer, CartItemSerializer
+from .cart import (
+    build_quote, cart_id, get_cart, guest_cart_owner, merge_guest_cart, merged_items, new_guest_owner, save_cart
+)
+from .fulfillment import STRIPE_EVENT_HANDLERS, fulfill_order, mark_order_paid
+from .tasks import process_stripe_event
+from api.idempotency import idempotent
+from api.serializers import omitted_spec, requested_spec
+from api.throttling import CheckoutThrottle
 
 
 # Setup Stripe
@@ -38,6 +47,12 @@ class OrderViewSet(viewsets.GenericViewSet):
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
     
+    def get_throttles(self):
+        if self.action == 'create':
+            # Checkout is open to anyone, so push back on bursts before validation
+            return [CheckoutThrottle()]
+        return super().get_throttles()
+    
     def get_queryset(self):
         """
         Filter orders to only show those belonging to the current user.
@@ -46,9 +61,37 @@ class OrderViewSet(viewsets.GenericViewSet):
         user = self.request.user
         
         if user.is_staff:
-            return Order.objects.all()
+            queryset = Order.objects.all()
+        else:
+            queryset = Order.objects.filter(user=user)
         
-        return Order.objects.filter(user=user)
+        if self.action in ('retrieve', 'my_orders'):
+            queryset = queryset.prefetch_related(*self.get_item_prefetches())
+        return queryset
+    
+    def get_item_prefetches(self):
+        """
+        Related rows the requested order fields need (see
+        SparseFieldsetMixin), so items are not loaded one order at a time.
+        """
+        fields = self.get_serializer_class().requested_fields(self.request)
+        if 'items' not in fields:
+            return []
+        item_fields = fields['items'] or {'platform': None}
+        if 'platform' in item_fields:
+            return ['items__product__platform']
+        if 'product_name' in item_fields or 'product_image' in item_fields:
+            return ['items__product']
+        return ['items']
+    
+    def get_archived_object(self):
+        """
+        Look up an archived order with the same visibility rules as live ones.
+        """
+        queryset = ArchivedOrder.objects.prefetch_related(*self.get_item_prefetches())
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user=self.request.user)
+        return get_object_or_404(queryset, pk=self.kwargs[self.lookup_url_kwarg or self.lookup_field])
     
     @action(detail=False, methods=['get'])
     def my_orders(self, request):
@@ -56,7 +99,15 @@ class OrderViewSet(viewsets.GenericViewSet):
         Returns a list of orders for the current user.
         """
         queryset = self.get_queryset().filter(user=request.user)
-        serializer = self.get_serializer(queryset, many=True)
+        archived = ArchivedOrder.objects.filter(user=request.user).prefetch_related(*self.get_item_prefetches())
+        
+        # Old orders live in the archive; list both, newest first
+        orders = sorted(
+            [*queryset, *archived],
+            key=lambda order: order.created_at,
+            reverse=True
+        )
+        serializer = self.get_serializer(orders, many=True)
         return Response(serializer.data)
     
     def retrieve(self, request, *args, **kwargs):
@@ -64,10 +115,13 @@ class OrderViewSet(viewsets.GenericViewSet):
         Get a specific order. Either the user's own order or an admin can view.
         Include keys if order is fulfilled.
         """
-        order = self.get_object()
+        try:
+            order = self.get_object()
+        except Http404:
+            order = self.get_archived_object()
         
         # Check if user is authorized to view this order
-        if not request.user.is_staff and order.user != request.user:
+        if not request.user.is_staff and order.user_id != request.user.pk:
             if order.is_guest and order.email == request.data.get('email'):
                 # Allow guest to view their order with email verification
                 pass
@@ -78,16 +132,18 @@ class OrderViewSet(viewsets.GenericViewSet):
                 )
         
         # Use OrderKeySerializer if order is fulfilled, otherwise use OrderSerializer
+        fields, omit = requested_spec(request), omitted_spec(request)
         if order.is_fulfilled:
-            serializer = OrderKeySerializer(order)
+            serializer = OrderKeySerializer(order, fields=fields, omit=omit)
         else:
-            serializer = OrderSerializer(order)
+            serializer = OrderSerializer(order, fields=fields, omit=omit)
         
         return Response(serializer.data)
     
+    @idempotent
     def create(self, request, *args, **kwargs):
         """
-        Create a new order.
+        Create a new order. Safe to retry with an Idempotency-Key header.
         """
         serializer = self.get_serializer(
             data=request.data,
@@ -132,7 +188,9 @@ class OrderViewSet(viewsets.GenericViewSet):
                 metadata={
                     'order_id': str(order.id),
                     'email': order.email
-                }
+                },
+                # Retrying for the same order returns the same intent
+                idempotency_key=f'payment-intent-{order.id}'
             )
             
             # Store the payment intent ID with the order
@@ -185,10 +243,12 @@ class OrderViewSet(viewsets.GenericViewSet):
         self._fulfill_order(order)
     
     @action(detail=True, methods=['post'])
+    @idempotent
     def confirm_payment(self, request, pk=None):
         """
         Confirm that payment was successful and fulfill the order.
         This would typically be called after a successful client-side payment.
+        Safe to retry with an Idempotency-Key header.
         """
         order = self.get_object()
         
@@ -215,10 +275,10 @@ class OrderViewSet(viewsets.GenericViewSet):
                         status=status.HTTP_400_BAD_REQUEST
                     )
                     
-                # Mark order as paid
-                order.mark_as_paid()
+                # Mark order as paid, unless the webhook already did
+                mark_order_paid(order)
                 
-                # Process the order
+                # Process the order; a no-op if it is already fulfilled
                 self._fulfill_order(order)
                 
                 return Response(
@@ -237,9 +297,9 @@ class OrderViewSet(viewsets.GenericViewSet):
             # In a real implementation, verify with PayPal API
             
             # For now, just mark as paid
-            order.mark_as_paid()
+            mark_order_paid(order)
             
-            # Process the order
+            # Process the order; a no-op if it is already fulfilled
             self._fulfill_order(order)
             
             return Response(
@@ -256,79 +316,90 @@ class OrderViewSet(viewsets.GenericViewSet):
         """
         Fulfill an order by assigning keys and sending confirmation email.
         """
-        # Only process if the order is paid but not yet fulfilled
-        if not order.is_paid or order.is_fulfilled:
-            return False
+        return fulfill_order(order)
+
+
+class CartViewSet(viewsets.ViewSet):
+    """
+    Server-side cart for users and guests, kept in the cache for CART_TTL
+    seconds after its last change. Guests get a cart_id to send back in
+    the X-Cart-Id header; a guest cart sent by a signed-in user is merged
+    into theirs by the next change or quote, and shown merged until then.
+    """
+    permission_classes = [AllowAny]
+    
+    def get_owner(self):
+        request = self.request
+        guest_owner = guest_cart_owner(request)
+        if not request.user.is_authenticated:
+            return guest_owner or new_guest_owner()
         
-        try:
-            # Get all items in the order
-            order_items = order.items.all()
-            
-            # Assign keys for each item
-            for item in order_items:
-                product = item.product
-                quantity = item.quantity
-                
-                if product.is_external:
-                    # For external products, fetch keys from supplier API
-                    # This is a placeholder - in a real app, you'd call the supplier API
-                    for _ in range(quantity):
-                        self._get_external_key(order, product)
-                else:
-                    # For internal products, assign keys from inventory
-                    available_keys = DigitalKey.objects.filter(
-                        product=product, 
-                        is_sold=False
-                    )[:quantity]
-                    
-                    # Check if we have enough keys
-                    if available_keys.count() < quantity:
-                        # Not enough keys available
-                        # In a real app, you might notify admin and handle this case
-                        raise ValueError(f"Not enough keys available for {product.name}")
-                    
-                    # Mark keys as sold and associate with this order
-                    for key in available_keys:
-                        key.mark_as_sold(order)
-            
-            # Mark order as fulfilled
-            order.mark_as_fulfilled()
-            
-            # Add cashback to user's balance if applicable
-            if order.cashback_earned > 0 and order.user and not order.is_guest:
-                order.add_cashback_to_user()
-            
-            # Send confirmation email
-            send_order_confirmation_email.delay(order.id)
-            
-            return True
-            
-        except Exception as e:
-            # Log the error and handle accordingly
-            print(f"Error fulfilling order {order.id}: {str(e)}")
-            return False
+        owner = f'user:{request.user.pk}'
+        if guest_owner and request.method not in SAFE_METHODS:
+            merge_guest_cart(owner, guest_owner)
+        return owner
     
-    def _get_external_key(self, order, product):
+    def cart_response(self, owner, items):
+        return Response({
+            'cart_id': cart_id(owner),
+            'items': [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in items.items()],
+        })
+    
+    def list(self, request):
+        """
+        Return the current cart.
+        """
+        owner = self.get_owner()
+        items = get_cart(owner)
+        guest_owner = guest_cart_owner(request)
+        if request.user.is_authenticated and guest_owner:
+            items = merged_items(items, get_cart(guest_owner))
+        return self.cart_response(owner, items)
+    
+    @action(detail=False, methods=['post', 'put', 'delete'])
+    def items(self, request):
         """
-        Get a key from external supplier API.
-        This is a placeholder - in a real app, you'd call the API.
+        Change the cart: POST sets the quantity of one product (0 removes
+        it), PUT replaces all items and DELETE empties the cart.
         """
-        # Placeholder for external API call
-        # In a real implementation, you would:
-        # 1. Call the supplier API
-        # 2. Purchase or reserve a key
-        # 3. Save the key to your database
+        owner = self.get_owner()
+        if request.method == 'DELETE':
+            save_cart(owner, {})
+            return self.cart_response(owner, {})
         
-        # For now, just create a dummy key
-        key = DigitalKey.objects.create(
-            product=product,
-            key_code=f"EXTERNAL-DEMO-KEY-{order.id}-{product.id}",
-            is_sold=True,
-            sold_at=timezone.now(),
-            order=order
-        )
+        if request.method == 'PUT':
+            serializer = CartSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            items = serializer.validated_data['items']
+        else:
+            serializer = CartItemSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            product_id, quantity = serializer.validated_data['product_id'], serializer.validated_data['quantity']
+            items = get_cart(owner)
+            if quantity:
+                items[product_id] = quantity
+            else:
+                items.pop(product_id, None)
+            if len(items) > settings.CART_MAX_ITEMS:
+                raise ValidationError(f"A cart can hold at most {settings.CART_MAX_ITEMS} products.")
         
-        return key
+        save_cart(owner, items)
+        return self.cart_response(owner, items)
+    
+    @action(detail=False, methods=['post'])
+    def quote(self, request):
+        """
+        Price the cart and check stock from cached catalog data. A valid
+        quote's quote_id can be sent to POST /api/orders/ instead of items.
+        """
+        owner = self.get_owner()
+        items = get_cart(owner)
+        user = request.user if request.user.is_authenticated else None
+        quote = build_quote(owner, items, user)
+        if items:
+            # Checking out keeps the cart alive
+            save_cart(owner, items)
+        return Response({'cart_id': cart_id(owner), **quote})
 
 
 class StripeWebhookView(generics.GenericAPIView):
@@ -347,11 +418,9 @@ class StripeWebhookView(generics.GenericAPIView):
                 payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
             )
             
-            # Handle specific events
-            if event['type'] == 'payment_intent.succeeded':
-                self._handle_payment_success(event['data']['object'])
-            elif event['type'] == 'payment_intent.payment_failed':
-                self._handle_payment_failure(event['data']['object'])
+            # Handle specific events on the payment events queue
+            if event['type'] in STRIPE_EVENT_HANDLERS:
+                process_stripe_event.delay(json.loads(payload))
             
             return Response(status=status.HTTP_200_OK)
             
@@ -364,57 +433,4 @@ class StripeWebhookView(generics.GenericAPIView):
             return Response(
                 {"error": str(e)},
                 status=status.HTTP_400_BAD_REQUEST
-            )
-    
-    def _handle_payment_success(self, payment_intent):
-        """
-        Handle successful Stripe payment.
-        """
-        # Get the order ID from metadata
-        order_id = payment_intent.get('metadata', {}).get('order_id')
-        
-        if not order_id:
-            return
-        
-        try:
-            # Find the order
-            order = Order.objects.get(id=order_id)
-            
-            # Only process if the order is not already paid
-            if order.is_paid:
-                return
-            
-            # Update order status
-            order.mark_as_paid()
-            
-            # Fulfill the order (assign keys, send email)
-            order_view = OrderViewSet()
-            order_view._fulfill_order(order)
-            
-        except Order.DoesNotExist:
-            # Order not found - log this event
-            print(f"Webhook error: Order {order_id} not found")
-    
-    def _handle_payment_failure(self, payment_intent):
-        """
-        Handle failed Stripe payment.
-        """
-        # Get the order ID from metadata
-        order_id = payment_intent.get('metadata', {}).get('order_id')
-        
-        if not order_id:
-            return
-        
-        try:
-            # Find the order
-            order = Order.objects.get(id=order_id)
-            
-            # Update order status to failed
-            order.status = 'FAILED'
-            order.save(update_fields=['status'])
-            
-            # You might want to notify the customer here
-            
-        except Order.DoesNotExist:
-            # Order not found - log this event
-            print(f"Webhook error: Order {order_id} not found")
\ No newline at end of file
+            )
\ No newline at end of file
@@ -0,0 +1,113 @@
+from django.contrib import admin
+from api.admin_utils import LargeTableAdmin, export_as_csv
+from .models import Category, Platform, Supplier, Product, DigitalKey, SoldKey
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ['name', 'slug']
+    search_fields = ['name']
+    prepopulated_fields = {'slug': ('name',)}
+    readonly_fields = ['image_variants']
+
+
+@admin.register(Platform)
+class PlatformAdmin(admin.ModelAdmin):
+    list_display = ['name', 'slug']
+    search_fields = ['name']
+    prepopulated_fields = {'slug': ('name',)}
+    readonly_fields = ['image_variants']
+
+
+@admin.register(Supplier)
+class SupplierAdmin(admin.ModelAdmin):
+    list_display = ['name', 'api_url', 'active', 'batch_size', 'last_push_at']
+    list_filter = ['active']
+    search_fields = ['name']
+
+
+@admin.register(Product)
+class ProductAdmin(LargeTableAdmin):
+    list_display = [
+        'name', 'category', 'platform', 'price', 'sale_price',
+        'is_active', 'is_featured', 'is_external', 'supplier', 'created_at'
+    ]
+    list_select_related = ['category', 'platform', 'supplier']
+    list_filter = ['is_active', 'is_featured', 'is_external', 'category', 'platform', 'region']
+    search_fields = ['name', '=slug', '=external_id']
+    prepopulated_fields = {'slug': ('name',)}
+    autocomplete_fields = ['category', 'platform', 'supplier']
+    readonly_fields = ['feed_hash', 'image_variants', 'created_at', 'updated_at']
+    actions = [
+        export_as_csv([
+            ('id', 'ID'),
+            ('name', 'Name'),
+            ('slug', 'Slug'),
+            ('category__name', 'Category'),
+            ('platform__name', 'Platform'),
+            ('price', 'Price'),
+            ('sale_price', 'Sale price'),
+            ('is_active', 'Active'),
+            ('is_external', 'External'),
+            ('supplier__name', 'Supplier'),
+            ('external_id', 'External ID'),
+        ], 'products.csv'),
+    ]
+
+
+def mask_key_code(key_code):
+    return f"{key_code[:4]}…{key_code[-4:]}" if len(key_code) > 8 else key_code
+
+
+class MaskedKeyCodeMixin:
+    
+    @admin.display(description='Key code')
+    def masked_key_code(self, obj):
+        return mask_key_code(obj.key_code)
+
+
+@admin.register(DigitalKey)
+class DigitalKeyAdmin(MaskedKeyCodeMixin, LargeTableAdmin):
+    list_display = ['id', 'product', 'masked_key_code', 'created_at']
+    list_select_related = ['product']
+    # Filtering on product goes through ?product__id__exact= or search,
+    # since a product filter sidebar would list every product
+    search_fields = ['=key_code']
+    autocomplete_fields = ['product']
+    readonly_fields = ['created_at']
+    ordering = ['-id']
+    actions = [
+        # Masked as in the changelist; full codes stay out of bulk exports
+        export_as_csv([
+            ('id', 'ID'),
+            ('product_id', 'Product ID'),
+            ('product__name', 'Product'),
+            ('key_code', 'Key code', mask_key_code),
+            ('created_at', 'Created at'),
+        ], 'digital-keys.csv'),
+    ]
+
+
+@admin.register(SoldKey)
+class SoldKeyAdmin(MaskedKeyCodeMixin, LargeTableAdmin):
+    list_display = ['id', 'product', 'masked_key_code', 'sold_at', 'order']
+    list_select_related = ['product', 'order']
+    search_fields = ['=key_code', '=order__id']
+    raw_id_fields = ['order']
+    autocomplete_fields = ['product']
+    ordering = ['-id']
+    actions = [
+        # Masked as in the changelist; full codes stay out of bulk exports
+        export_as_csv([
+            ('id', 'ID'),
+            ('product_id', 'Product ID'),
+            ('product__name', 'Product'),
+            ('key_code', 'Key code', mask_key_code),
+            ('sold_at', 'Sold at'),
+            ('order_id', 'Order ID'),
+        ], 'sold-keys.csv'),
+    ]
+    
+    def has_add_permission(self, request):
+        # Keys are only sold by allocating them from the pool
+        return False
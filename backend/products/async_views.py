@@ -0,0 +1,136 @@
+import math
+from asgiref.sync import sync_to_async
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from django.conf import settings
+from django.core.cache import cache
+from api.async_views import AsyncAPIView
+from .cache import aget_catalog_version, catalog_key
+from .models import Product
+from .serializers import ProductListSerializer, ProductDetailSerializer
+from .views import ProductViewSet
+
+
+class AsyncProductView(AsyncAPIView):
+    """
+    Async counterpart of a ProductViewSet action.
+    Filtering, ordering and querysets are delegated to ProductViewSet so
+    both paths serve the same results. Queries use the async ORM, and
+    serializers, which may read stock from Redis, run in a worker thread.
+    """
+    action = None
+    serializer_class = ProductListSerializer
+
+    def get_viewset(self, request):
+        return ProductViewSet(
+            request=self.drf_request(request),
+            action=self.action,
+            format_kwarg=None,
+            args=(),
+            kwargs=self.kwargs,
+        )
+
+    def serialize(self, viewset, data, many=False):
+        context = {'request': viewset.request, 'format': None, 'view': viewset}
+        return self.serializer_class(data, many=many, context=context).data
+
+
+class AsyncProductListView(AsyncProductView):
+    """
+    Async API endpoint for the paginated product list.
+    """
+    action = 'list'
+
+    async def get(self, request, *args, **kwargs):
+        viewset = self.get_viewset(request)
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+
+        # Same page numbering and links as DRF's PageNumberPagination
+        page_size = api_settings.PAGE_SIZE
+        count = await queryset.acount()
+        num_pages = max(1, math.ceil(count / page_size))
+
+        page_number = request.GET.get('page', 1)
+        if page_number == 'last':
+            page_number = num_pages
+        try:
+            page_number = int(page_number)
+        except (TypeError, ValueError):
+            raise exceptions.NotFound('Invalid page.')
+        if page_number < 1 or page_number > num_pages:
+            raise exceptions.NotFound('Invalid page.')
+
+        offset = (page_number - 1) * page_size
+        rows = [row async for row in viewset.list_values(queryset)[offset:offset + page_size]]
+
+        url = request.build_absolute_uri()
+        next_url = previous_url = None
+        if page_number < num_pages:
+            next_url = replace_query_param(url, 'page', page_number + 1)
+        if page_number == 2:
+            previous_url = remove_query_param(url, 'page')
+        elif page_number > 2:
+            previous_url = replace_query_param(url, 'page', page_number - 1)
+
+        return self.render({
+            'count': count,
+            'next': next_url,
+            'previous': previous_url,
+            'results': await sync_to_async(viewset.serialize_list)(rows),
+        })
+
+
+class AsyncProductDetailView(AsyncProductView):
+    """
+    Async API endpoint for a single product, looked up by slug.
+    """
+    action = 'retrieve'
+    serializer_class = ProductDetailSerializer
+
+    async def get(self, request, slug, *args, **kwargs):
+        viewset = self.get_viewset(request)
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+
+        try:
+            product = await queryset.aget(slug=slug)
+        except Product.DoesNotExist:
+            raise exceptions.NotFound()
+
+        return self.render(await sync_to_async(self.serialize)(viewset, product))
+
+
+class AsyncFeaturedProductsView(AsyncProductView):
+    """
+    Async API endpoint for featured products.
+    """
+    action = 'featured'
+
+    async def get(self, request, *args, **kwargs):
+        viewset = self.get_viewset(request)
+        key = catalog_key(viewset.catalog_cache_name('featured'), await aget_catalog_version())
+        data = await cache.aget(key)
+        if data is None:
+            featured = viewset.get_queryset().filter(is_featured=True)[:10]
+            rows = [row async for row in viewset.list_values(featured)]
+            data = await sync_to_async(viewset.serialize_list)(rows)
+            await cache.aset(key, data, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        return self.render(data)
+
+
+class AsyncOnSaleProductsView(AsyncProductView):
+    """
+    Async API endpoint for products that are on sale.
+    """
+    action = 'on_sale'
+
+    async def get(self, request, *args, **kwargs):
+        viewset = self.get_viewset(request)
+        key = catalog_key(viewset.catalog_cache_name('on_sale'), await aget_catalog_version())
+        data = await cache.aget(key)
+        if data is None:
+            on_sale = viewset.get_queryset().filter(sale_price__isnull=False)[:10]
+            rows = [row async for row in viewset.list_values(on_sale)]
+            data = await sync_to_async(viewset.serialize_list)(rows)
+            await cache.aset(key, data, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        return self.render(data)
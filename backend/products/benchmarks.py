@@ -0,0 +1,118 @@
+from decimal import Decimal
+from django.test import RequestFactory
+from rest_framework.test import APIRequestFactory
+from api.benchmarking import benchmark
+from .cache import invalidate_catalog
+from .models import Category, DigitalKey, Platform, Product
+from .serializers import (
+    ProductDetailSerializer, ProductListSerializer, product_list_values, serialize_product_list
+)
+from .views import ProductViewSet
+
+
+def create_catalog(count, keys_per_product=1, **fields):
+    """Bulk create `count` active products with keys in the pool."""
+    category, _ = Category.objects.get_or_create(slug='benchmark', defaults={'name': 'Benchmark'})
+    platform, _ = Platform.objects.get_or_create(slug='benchmark', defaults={'name': 'Benchmark'})
+    start = Product.objects.count()
+    products = Product.objects.bulk_create([
+        Product(
+            name=f"Benchmark product {start + n}",
+            slug=f"benchmark-product-{start + n}",
+            short_description="A product created for benchmarks.",
+            description="A product created for benchmarks. " * 20,
+            category=category,
+            platform=platform,
+            price=Decimal('19.99'),
+            sale_price=Decimal('14.99') if n % 3 == 0 else None,
+            **fields
+        )
+        for n in range(count)
+    ])
+    DigitalKey.objects.bulk_create([
+        DigitalKey(product=product, key_code=f"BENCH-{product.id}-{n}")
+        for product in products
+        for n in range(keys_per_product)
+    ], batch_size=5000)
+    return products
+
+
+@benchmark('products.list_serializer_1k')
+def list_serializer(runs):
+    create_catalog(1000)
+    # The queryset ProductViewSet lists
+    queryset = Product.objects.filter(is_active=True).select_related('category', 'platform').with_availability()
+    for _ in range(runs):
+        yield lambda: ProductListSerializer(queryset.all(), many=True).data
+
+
+def create_list_page(size):
+    """A page of products with images, as ProductViewSet lists them."""
+    image = 'products/benchmark.jpg'
+    variants = {
+        'source': image,
+        'webp': {str(width): f'products/variants/benchmark.{width}w.webp' for width in (160, 320, 640)},
+        'jpeg': {str(width): f'products/variants/benchmark.{width}w.jpg' for width in (160, 320, 640)},
+    }
+    create_catalog(size, image=image, image_variants=variants)
+    request = RequestFactory().get('/api/products/')
+    queryset = Product.objects.filter(is_active=True).select_related('category', 'platform').with_availability()
+    return queryset[:size], request
+
+
+def list_page_benchmarks(size):
+    @benchmark(f'products.list_page_{size}.serializer')
+    def serializer(runs):
+        page, request = create_list_page(size)
+        for _ in range(runs):
+            yield lambda: ProductListSerializer(page.all(), many=True, context={'request': request}).data
+
+    @benchmark(f'products.list_page_{size}.values')
+    def values(runs):
+        page, request = create_list_page(size)
+        for _ in range(runs):
+            yield lambda: serialize_product_list(product_list_values(page.all()), request)
+
+
+for size in (20, 100, 500):
+    list_page_benchmarks(size)
+
+
+def list_view_benchmark(name, fields):
+    @benchmark(f'products.list_view_20.{name}')
+    def list_view(runs):
+        create_list_page(100)
+        view = ProductViewSet.as_view({'get': 'list'})
+        url = f'/api/products/?fields={fields}' if fields else '/api/products/'
+        for _ in range(runs):
+            yield lambda: view(APIRequestFactory().get(url))
+
+
+# What a mobile client asks for: no stock subquery or joins
+list_view_benchmark('all_fields', None)
+list_view_benchmark('sparse', 'id,name,slug,current_price,image')
+
+
+def batch_view_benchmark(name, cached):
+    @benchmark(f'products.batch_view_200.{name}')
+    def batch_view(runs):
+        products = create_catalog(200)
+        view = ProductViewSet.as_view({'post': 'batch'})
+        ids = [product.id for product in products]
+        for _ in range(runs):
+            if not cached:
+                invalidate_catalog()
+            yield lambda: view(APIRequestFactory().post('/api/products/batch/', {'ids': ids}, format='json'))
+
+
+# A cart of 200 products; one query on a cold catalog cache, none when warm
+batch_view_benchmark('cold', False)
+batch_view_benchmark('warm', True)
+
+
+@benchmark('products.detail_serializer')
+def detail_serializer(runs):
+    slug = create_catalog(1, keys_per_product=20)[0].slug
+    queryset = Product.objects.filter(is_active=True).select_related('category', 'platform').with_availability(count=True)
+    for _ in range(runs):
+        yield lambda: ProductDetailSerializer(queryset.get(slug=slug)).data
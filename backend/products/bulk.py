@@ -0,0 +1,143 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from .cache import invalidate_catalog
+from .models import Category, Platform, Product, Supplier
+from .serializers import ProductBulkRowSerializer, ProductBulkCreateSerializer
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _row_error(index, errors, product_id=None):
+    error = {'index': index, 'errors': errors}
+    if product_id is not None:
+        error['id'] = product_id
+    return error
+
+
+def validate_rows(items):
+    """Validate per-product bulk update items. Returns (rows, errors)."""
+    rows = []
+    errors = []
+    for index, item in enumerate(items):
+        serializer = ProductBulkRowSerializer(data=item)
+        if serializer.is_valid():
+            changes = dict(serializer.validated_data)
+            rows.append((index, changes.pop('id'), changes))
+        else:
+            errors.append(_row_error(index, serializer.errors, item.get('id')))
+    return rows, errors
+
+
+def bulk_update_products(rows):
+    """
+    Apply [(index, product_id, changes)] with bulk_update, a chunk at a time
+    inside one transaction. Rows whose product is missing or whose sale price
+    would not be below the price are skipped and reported.
+    Returns (updated_count, errors).
+    """
+    chunk_size = settings.PRODUCT_BULK_CHUNK_SIZE
+    now = timezone.now()
+    updated = 0
+    errors = []
+
+    with transaction.atomic():
+        for chunk in _chunks(rows, chunk_size):
+            fields = sorted({field for _, _, changes in chunk for field in changes})
+            products = Product.objects.select_for_update().only(
+                'id', 'price', 'sale_price', *fields
+            ).in_bulk([product_id for _, product_id, _ in chunk])
+
+            to_update = {}
+            for index, product_id, changes in chunk:
+                product = to_update.get(product_id) or products.get(product_id)
+                if product is None:
+                    errors.append(_row_error(index, {'id': ["Product not found."]}, product_id))
+                    continue
+
+                price = changes.get('price', product.price)
+                sale_price = changes.get('sale_price', product.sale_price)
+                if sale_price is not None and sale_price >= price:
+                    errors.append(_row_error(
+                        index, {'sale_price': ["Sale price must be lower than the price."]}, product_id
+                    ))
+                    continue
+
+                for field, value in changes.items():
+                    setattr(product, field, value)
+                product.updated_at = now
+                to_update[product_id] = product
+
+            if to_update:
+                Product.objects.bulk_update(list(to_update.values()), fields + ['updated_at'])
+                updated += len(to_update)
+
+    if updated:
+        invalidate_catalog()
+    return updated, errors
+
+
+def bulk_create_products(items):
+    """
+    Validate and insert products with bulk_create, a chunk at a time inside
+    one transaction. Invalid rows are skipped and reported.
+    Returns (created_products, errors).
+    """
+    rows = []
+    errors = []
+    for index, item in enumerate(items):
+        serializer = ProductBulkCreateSerializer(data=item)
+        if serializer.is_valid():
+            rows.append((index, dict(serializer.validated_data)))
+        else:
+            errors.append(_row_error(index, serializer.errors))
+
+    # Check relations and slugs for the whole batch, as save() would per row
+    related = {
+        'category': set(Category.objects.filter(id__in={row['category'] for _, row in rows}).values_list('id', flat=True)),
+        'platform': set(Platform.objects.filter(id__in={row['platform'] for _, row in rows}).values_list('id', flat=True)),
+        'supplier': set(Supplier.objects.filter(
+            id__in={row['supplier'] for _, row in rows if row.get('supplier') is not None}
+        ).values_list('id', flat=True)),
+    }
+    for _, row in rows:
+        row['slug'] = row.get('slug') or slugify(row['name'])[:255]
+    taken = set(Product.objects.filter(slug__in={row['slug'] for _, row in rows}).values_list('slug', flat=True))
+
+    to_create = []
+    for index, row in rows:
+        row_errors = {}
+        for field, ids in related.items():
+            if row.get(field) is not None and row[field] not in ids:
+                row_errors[field] = [f'Invalid pk "{row[field]}" - object does not exist.']
+        if row['slug'] in taken:
+            row_errors['slug'] = ["product with this slug already exists."]
+        sale_price = row.get('sale_price')
+        if sale_price is not None and sale_price >= row['price']:
+            row_errors['sale_price'] = ["Sale price must be lower than the price."]
+
+        if row_errors:
+            errors.append(_row_error(index, row_errors))
+            continue
+
+        taken.add(row['slug'])
+        to_create.append(Product(
+            category_id=row.pop('category'),
+            platform_id=row.pop('platform'),
+            supplier_id=row.pop('supplier', None),
+            **row
+        ))
+
+    created = []
+    with transaction.atomic():
+        for chunk in _chunks(to_create, settings.PRODUCT_BULK_CHUNK_SIZE):
+            created.extend(Product.objects.bulk_create(chunk))
+
+    if created:
+        invalidate_catalog()
+    errors.sort(key=lambda error: error['index'])
+    return created, errors
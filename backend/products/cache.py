@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Every catalog cache key embeds this version, so bumping it invalidates
+# all cached catalog responses at once without having to find the keys
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+async def aget_catalog_version():
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = await cache.aget(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def invalidate_catalog():
+    """Drop every cached catalog response. Call once per batch of writes."""
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # No version yet, so nothing is cached under one either
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+
+
+def catalog_key(name, version):
+    return f'catalog:{version}:{name}'
+
+
+def get_cached_catalog(name, build):
+    """Return the cached value for name, building and caching it on a miss."""
+    key = catalog_key(name, get_catalog_version())
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+def get_cached_catalog_many(names, build):
+    """
+    Return {name: value} for names from the cache, building all misses
+    with a single build(missing_names) call that returns {name: value}.
+    Names build() has no value for are left out and not cached.
+    """
+    version = get_catalog_version()
+    keys = {catalog_key(name, version): name for name in names}
+    values = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+    missing = [name for name in dict.fromkeys(names) if name not in values]
+    if missing:
+        built = build(missing)
+        cache.set_many(
+            {catalog_key(name, version): value for name, value in built.items()},
+            timeout=settings.CATALOG_CACHE_TIMEOUT,
+        )
+        values.update(built)
+    return values
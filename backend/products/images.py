@@ -0,0 +1,146 @@
+import hashlib
+import io
+import posixpath
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.utils.encoding import filepath_to_uri
+from PIL import Image, ImageOps
+
+
+# Pillow format name and file extension per variant format
+FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()[:12]
+
+
+def variant_name(source_name, digest, width, extension):
+    """products/cover.png -> products/variants/cover.<hash>.320w.webp"""
+    directory, filename = posixpath.split(source_name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'variants', f'{stem}.{digest}.{width}w.{extension}')
+
+
+def _encode(image, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha channel, so flatten onto white
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=settings.IMAGE_VARIANT_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def build_variants(source_name, storage=default_storage, previous=None):
+    """
+    Write fixed-width WebP and JPEG copies of an uploaded image.
+
+    File names carry a hash of the source content, so they can be served
+    with far-future cache headers and a re-upload never reuses a name.
+    Widths larger than the original are skipped. If `previous` variants
+    were built from the same content they are returned unchanged.
+    """
+    with storage.open(source_name, 'rb') as source:
+        data = source.read()
+
+    digest = content_hash(data)
+    if previous and previous.get('source') == source_name and previous.get('hash') == digest:
+        return previous
+
+    image = Image.open(io.BytesIO(data))
+    # Apply camera rotation before resizing, since the EXIF data is dropped
+    image = ImageOps.exif_transpose(image)
+
+    widths = [width for width in settings.IMAGE_VARIANT_WIDTHS if width < image.width] or [image.width]
+    variants = {'source': source_name, 'hash': digest, 'widths': widths}
+    for key, (image_format, extension) in FORMATS.items():
+        variants[key] = {}
+        for width in widths:
+            name = variant_name(source_name, digest, width, extension)
+            if not storage.exists(name):
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+                name = storage.save(name, ContentFile(_encode(resized, image_format)))
+            variants[key][str(width)] = name
+
+    return variants
+
+
+def schedule_image_variants(instance):
+    """
+    Queue derivative generation after a save if the image changed.
+    Called from the save() of models with `image` and `image_variants`.
+    """
+    image_name = instance.image.name if instance.image else ''
+    if image_name == instance.image_variants.get('source', ''):
+        return
+
+    if not image_name:
+        type(instance).objects.filter(pk=instance.pk).update(image_variants={})
+        instance.image_variants = {}
+        return
+
+    from .tasks import generate_image_variants
+    label = instance._meta.label_lower
+    pk = instance.pk
+    transaction.on_commit(lambda: generate_image_variants.delay(label, pk))
+
+
+def media_url(storage=default_storage, request=None):
+    """
+    Return a function mapping file names to the URL that storage.url()
+    followed by request.build_absolute_uri() would give. For local
+    storage the base URL is resolved once, which matters when building
+    thousands of URLs for a product list.
+    """
+    def url(name):
+        location = storage.url(name)
+        return request.build_absolute_uri(location) if request is not None else location
+    
+    if getattr(storage.url, '__func__', None) is not FileSystemStorage.url or storage.base_url is None:
+        return url
+    
+    prefix = storage.base_url
+    if request is not None:
+        prefix = request.build_absolute_uri(prefix)
+    
+    def local_url(name):
+        path = filepath_to_uri(name).lstrip('/')
+        if '.' in path and ('/./' in f'/{path}/' or '/../' in f'/{path}/'):
+            # urljoin() resolves dot segments, leave those to the storage
+            return url(name)
+        return prefix + path
+    
+    return local_url
+
+
+def srcset(instance, request=None):
+    """
+    Map each variant format to a srcset string, e.g.
+    {'webp': '/media/...320w.webp 320w, ...', 'jpeg': ...}.
+    Empty until the derivatives have been generated.
+    """
+    name = instance.image.name if instance.image else None
+    return variant_srcset(name, instance.image_variants, media_url(default_storage, request))
+
+
+def variant_srcset(source_name, variants, url):
+    """srcset() from the raw image name and image_variants values, with URLs from media_url()."""
+    if not variants or not source_name or variants.get('source') != source_name:
+        return {}
+
+    result = {}
+    for key in FORMATS:
+        result[key] = ', '.join(f'{url(name)} {width}w' for width, name in variants.get(key, {}).items())
+    return result
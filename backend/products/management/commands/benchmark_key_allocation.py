@@ -0,0 +1,98 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from products.models import Category, Platform, Product, DigitalKey, SoldKey
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure key allocation latency for a product with a large sold key "
+        "ledger. Runs in a transaction that is rolled back unless --keep."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sold', type=int, default=10_000_000, help="Sold keys in the ledger.")
+        parser.add_argument('--available', type=int, default=10_000, help="Keys in the available pool.")
+        parser.add_argument('--iterations', type=int, default=1000, help="Allocations to time.")
+        parser.add_argument('--quantity', type=int, default=1, help="Keys per allocation.")
+        parser.add_argument('--keep', action='store_true', help="Commit the generated data instead of rolling it back.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write("Rolled back benchmark data")
+
+    def run(self, options):
+        category, _ = Category.objects.get_or_create(slug='benchmark', defaults={'name': 'Benchmark'})
+        platform, _ = Platform.objects.get_or_create(slug='benchmark', defaults={'name': 'Benchmark'})
+        product = Product.objects.create(
+            name=f"Key allocation benchmark {int(time.time())}",
+            category=category,
+            platform=platform,
+            price='1.00',
+            is_active=False,
+        )
+
+        started = time.monotonic()
+        self.seed_sold_keys(product, options['sold'])
+        DigitalKey.objects.bulk_create(
+            (DigitalKey(product=product, key_code=f"AVAILABLE-{i}") for i in range(options['available'])),
+            batch_size=5000,
+        )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE products_digitalkey')
+                cursor.execute('ANALYZE products_soldkey')
+        self.stdout.write(
+            f"Seeded {options['sold']} sold and {options['available']} available keys "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+
+        iterations = min(options['iterations'], options['available'] // max(1, options['quantity']))
+        timings = []
+        for _ in range(iterations):
+            allocation_started = time.perf_counter()
+            DigitalKey.allocate(product, options['quantity'])
+            timings.append((time.perf_counter() - allocation_started) * 1000)
+
+        timings.sort()
+
+        def percentile(fraction):
+            return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{iterations} allocations of {options['quantity']} key(s): "
+            f"mean {statistics.mean(timings):.2f} ms, p50 {percentile(0.5):.2f} ms, "
+            f"p95 {percentile(0.95):.2f} ms, p99 {percentile(0.99):.2f} ms, max {timings[-1]:.2f} ms"
+        ))
+
+    def seed_sold_keys(self, product, count):
+        if connection.vendor == 'postgresql':
+            # Generate the ledger server side instead of sending 10M rows
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {SoldKey._meta.db_table} (product_id, key_code, sold_at, created_at)
+                    SELECT %s, 'SOLD-' || n, now(), now() FROM generate_series(1, %s) AS n
+                    """,
+                    [product.id, count],
+                )
+            return
+
+        now = timezone.now()
+        batch = 10_000
+        for start in range(0, count, batch):
+            SoldKey.objects.bulk_create([
+                SoldKey(product=product, key_code=f"SOLD-{n}", sold_at=now, created_at=now)
+                for n in range(start, min(count, start + batch))
+            ])
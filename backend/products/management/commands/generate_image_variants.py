@@ -0,0 +1,78 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from products.cache import invalidate_catalog
+from products.images import build_variants
+from products.models import Category, Platform, Product
+
+
+MODELS = {
+    'products': Product,
+    'categories': Category,
+    'platforms': Platform,
+}
+
+
+def _build(model_label, pk, source_name, previous, force):
+    """Worker entry point: only touches storage, the parent writes the rows."""
+    try:
+        return model_label, pk, build_variants(source_name, previous=None if force else previous), None
+    except Exception as e:
+        return model_label, pk, None, f"{type(e).__name__}: {e}"
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG copies of existing product, category and platform images."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=list(MODELS), action='append', help="Limit to these models (repeatable).")
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (defaults to the CPU count).")
+        parser.add_argument('--batch-size', type=int, default=500, help="Images submitted to the pool at a time.")
+        parser.add_argument('--force', action='store_true', help="Rebuild variants that are already up to date.")
+
+    def _pending(self, model, force):
+        rows = model.objects.exclude(image='').exclude(image__isnull=True).order_by('pk')
+        for pk, image, variants in rows.values_list('pk', 'image', 'image_variants').iterator(chunk_size=2000):
+            if force or variants.get('source') != image:
+                yield model._meta.label_lower, pk, image, variants
+
+    def handle(self, *args, **options):
+        models = [MODELS[name] for name in options['model'] or MODELS]
+        pending = [job for model in models for job in self._pending(model, options['force'])]
+        if not pending:
+            self.stdout.write("All images are up to date.")
+            return
+
+        self.stdout.write(f"Generating variants for {len(pending)} images...")
+        by_label = {model._meta.label_lower: model for model in models}
+        started = time.monotonic()
+        generated = 0
+        failed = 0
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            for start in range(0, len(pending), options['batch_size']):
+                batch = pending[start:start + options['batch_size']]
+                futures = [
+                    pool.submit(_build, label, pk, image, variants, options['force'])
+                    for label, pk, image, variants in batch
+                ]
+                for future in as_completed(futures):
+                    label, pk, variants, error = future.result()
+                    if error:
+                        failed += 1
+                        self.stderr.write(f"{label} {pk}: {error}")
+                        continue
+                    by_label[label].objects.filter(pk=pk, image=variants['source']).update(image_variants=variants)
+                    generated += 1
+
+        if generated:
+            invalidate_catalog()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated variants for {generated} images in {elapsed:.1f}s ({failed} failed)"
+        ))
@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator
 from decimal import Decimal
+from .cache import invalidate_catalog
+from .images import schedule_image_variants
 
 class Category(models.Model):
     """
@@ -11,6 +14,8 @@ class Category(models.Model):
     slug = models.SlugField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    # Resized WebP/JPEG copies of image, written by generate_image_variants
+    image_variants = models.JSONField(default=dict, blank=True)
     
     class Meta:
         verbose_name = 'category'
@@ -24,6 +29,7 @@ class Category(models.Model):
         if not self.slug:
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
+        schedule_image_variants(self)
 
 
 class Platform(models.Model):
@@ -34,6 +40,8 @@ class Platform(models.Model):
     slug = models.SlugField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='platforms/', blank=True, null=True)
+    # Resized WebP/JPEG copies of image, written by generate_image_variants
+    image_variants = models.JSONField(default=dict, blank=True)
     
     class Meta:
         ordering = ['name']
@@ -45,6 +53,7 @@ class Platform(models.Model):
         if not self.slug:
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
+        schedule_image_variants(self)
 
 
 class Supplier(models.Model):
@@ -57,10 +66,33 @@ class Supplier(models.Model):
     api_url = models.URLField()
     active = models.BooleanField(default=True)
     
+    # Maximum number of keys requested from the supplier in a single call
+    batch_size = models.PositiveIntegerField(default=50)
+    
+    # Maps Product fields to the columns of the supplier's feed files
+    feed_mapping = models.JSONField(default=dict, blank=True)
+    
+    # Last stock/price notification pushed by the supplier's webhook
+    last_push_at = models.DateTimeField(null=True, blank=True)
+    
     def __str__(self):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    
+    def with_availability(self, count=False):
+        """
+        Annotate stock availability so in_stock (and available_keys_count
+        when count=True) need no extra query per product.
+        """
+        available_keys = DigitalKey.objects.filter(product=models.OuterRef('pk'))
+        queryset = self.annotate(has_available_keys=models.Exists(available_keys))
+        if count:
+            queryset = queryset.annotate(available_keys=models.Count('keys'))
+        return queryset
+
+
 class Product(models.Model):
     """
     Digital products (game keys, software keys, etc.) for sale.
@@ -105,6 +137,8 @@ class Product(models.Model):
     )
     
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Resized WebP/JPEG copies of image, written by generate_image_variants
+    image_variants = models.JSONField(default=dict, blank=True)
     
     is_active = models.BooleanField(default=True)
     is_featured = models.BooleanField(default=False)
@@ -119,6 +153,12 @@ class Product(models.Model):
     )
     external_id = models.CharField(max_length=255, blank=True, null=True)
     
+    # Number of pre-purchased keys to keep in stock for external products
+    key_buffer_size = models.PositiveIntegerField(default=0)
+    
+    # Hash of the last supplier feed row applied, used to skip unchanged rows
+    feed_hash = models.CharField(max_length=40, blank=True)
+    
     region = models.CharField(
         max_length=10, 
         choices=REGION_CHOICES, 
@@ -128,8 +168,14 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ProductQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['supplier', 'external_id']),
+        ]
         
     def __str__(self):
         return self.name
@@ -138,6 +184,14 @@ class Product(models.Model):
         if not self.slug:
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
+        schedule_image_variants(self)
+        # Bulk writes skip save() and invalidate once per batch instead
+        invalidate_catalog()
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        invalidate_catalog()
+        return result
     
     @property
     def current_price(self):
@@ -155,29 +209,37 @@ class Product(models.Model):
     def in_stock(self):
         """
         Check if product has available keys.
-        For external products, this would query the supplier API.
+        For external products, this uses the supplier stock cache.
         """
         if self.is_external:
-            # Placeholder for external supplier stock check
-            # In a real implementation, this would call the supplier API
-            return True
+            return self.available_keys_count > 0
+        elif hasattr(self, 'has_available_keys'):
+            # Annotated by ProductQuerySet.with_availability()
+            return self.has_available_keys
         else:
-            return self.keys.filter(is_sold=False).exists()
+            return self.keys.exists()
     
     @property
     def available_keys_count(self):
         """Count available keys for this product."""
         if self.is_external:
-            # Placeholder for external supplier stock check
-            # In a real implementation, this would call the supplier API
-            return 999  # Assume always in stock for external
+            from suppliers.stock import get_external_stock
+            stock = get_external_stock(self.id)
+            if stock is None:
+                # No stock reported by the supplier yet
+                return 999  # Assume always in stock for external
+            return stock
+        elif hasattr(self, 'available_keys'):
+            return self.available_keys
         else:
-            return self.keys.filter(is_sold=False).count()
+            return self.keys.count()
 
 
 class DigitalKey(models.Model):
     """
-    Individual digital keys/codes for products.
+    Available digital keys/codes for products.
+    Keys are moved to the SoldKey ledger when they are allocated, so this
+    table only ever holds the keys that can still be sold.
     """
     product = models.ForeignKey(
         Product, 
@@ -185,8 +247,67 @@ class DigitalKey(models.Model):
         related_name='keys'
     )
     key_code = models.CharField(max_length=255)
-    is_sold = models.BooleanField(default=False)
-    sold_at = models.DateTimeField(null=True, blank=True)
+    # Not auto_now_add, so released keys keep the time they were first added
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    
+    class Meta:
+        verbose_name = 'digital key'
+        verbose_name_plural = 'digital keys'
+        unique_together = ('product', 'key_code')
+        indexes = [
+            models.Index(fields=['key_code']),
+            models.Index(fields=['product', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} - Available"
+    
+    @classmethod
+    def allocate(cls, product, quantity, order=None, partial=False):
+        """
+        Atomically move up to `quantity` available keys of a product to the
+        sold key ledger, oldest first, so released keys go out before newer
+        ones. Keys locked by a concurrent allocation are skipped.
+        Raises ValueError when fewer keys are available, unless `partial`.
+        Returns the new SoldKey rows.
+        """
+        with transaction.atomic():
+            keys = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(product=product)
+                .order_by('created_at', 'id')[:quantity]
+            )
+            if len(keys) < quantity and not partial:
+                raise ValueError(f"Not enough keys available for {product.name}")
+            if not keys:
+                return []
+            
+            now = timezone.now()
+            sold = SoldKey.objects.bulk_create([
+                SoldKey(
+                    product_id=key.product_id,
+                    key_code=key.key_code,
+                    order=order,
+                    sold_at=now,
+                    created_at=key.created_at,
+                )
+                for key in keys
+            ])
+            cls.objects.filter(id__in=[key.id for key in keys]).delete()
+        
+        return sold
+
+
+class SoldKey(models.Model):
+    """
+    Ledger of keys that have been sold, with the order they went to.
+    """
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='sold_keys'
+    )
+    key_code = models.CharField(max_length=255)
     order = models.ForeignKey(
         'orders.Order',
         on_delete=models.SET_NULL,
@@ -194,20 +315,32 @@ class DigitalKey(models.Model):
         blank=True,
         related_name='purchased_keys'
     )
-    created_at = models.DateTimeField(auto_now_add=True)
+    sold_at = models.DateTimeField()
+    # When the key was added to the pool
+    created_at = models.DateTimeField()
     
     class Meta:
-        verbose_name = 'digital key'
-        verbose_name_plural = 'digital keys'
+        verbose_name = 'sold key'
+        verbose_name_plural = 'sold keys'
+        # A code can never be sold twice
         unique_together = ('product', 'key_code')
+        indexes = [
+            models.Index(fields=['key_code']),
+        ]
     
     def __str__(self):
-        return f"{self.product.name} - {'Sold' if self.is_sold else 'Available'}"
-    
-    def mark_as_sold(self, order):
-        """Mark this key as sold and associate with an order."""
-        from django.utils import timezone
-        self.is_sold = True
-        self.sold_at = timezone.now()
-        self.order = order
-        self.save()
\ No newline at end of file
+        return f"{self.product.name} - Sold"
+    
+    @classmethod
+    def release(cls, key_ids):
+        """
+        Move sold keys back to the available pool, e.g. when an order fails.
+        They keep the time they were first added to the pool.
+        """
+        with transaction.atomic():
+            keys = list(cls.objects.select_for_update().filter(id__in=key_ids))
+            DigitalKey.objects.bulk_create([
+                DigitalKey(product_id=key.product_id, key_code=key.key_code, created_at=key.created_at)
+                for key in keys
+            ])
+            cls.objects.filter(id__in=[key.id for key in keys]).delete()
\ No newline at end of file
@@ -1,41 +1,148 @@
+from decimal import Decimal
+from operator import itemgetter
+from django.conf import settings
 from rest_framework import serializers
+from api.serializers import SparseFieldsetMixin
+from suppliers.stock import get_external_stock_many
+from .images import media_url, srcset, variant_srcset
 from .models import Category, Platform, Product, Supplier
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class ImageSrcsetField(serializers.Field):
+    """Read-only {format: srcset} map of an object's resized images."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return srcset(instance, self.context.get('request'))
+
+
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for product categories."""
+    image_srcset = ImageSrcsetField()
     
     class Meta:
         model = Category
-        fields = ['id', 'name', 'slug', 'description', 'image']
+        fields = ['id', 'name', 'slug', 'description', 'image', 'image_srcset']
 
 
-class PlatformSerializer(serializers.ModelSerializer):
+class PlatformSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for product platforms."""
+    image_srcset = ImageSrcsetField()
     
     class Meta:
         model = Platform
-        fields = ['id', 'name', 'slug', 'description', 'image']
+        fields = ['id', 'name', 'slug', 'description', 'image', 'image_srcset']
 
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for product list view (limited fields)."""
     category_name = serializers.CharField(source='category.name', read_only=True)
     platform_name = serializers.CharField(source='platform.name', read_only=True)
     discount_percentage = serializers.IntegerField(read_only=True)
     current_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     in_stock = serializers.BooleanField(read_only=True)
+    image_srcset = ImageSrcsetField()
     
     class Meta:
         model = Product
         fields = [
-            'id', 'name', 'slug', 'short_description', 'image', 
+            'id', 'name', 'slug', 'short_description', 'image', 'image_srcset',
             'category_name', 'platform_name', 'price', 'sale_price',
             'current_price', 'discount_percentage', 'in_stock', 'region'
         ]
 
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+# Columns each ProductListSerializer field is built from by serialize_product_list()
+PRODUCT_LIST_COLUMNS = {
+    'id': ('id',),
+    'name': ('name',),
+    'slug': ('slug',),
+    'short_description': ('short_description',),
+    'image': ('image',),
+    'image_srcset': ('image', 'image_variants'),
+    'category_name': ('category__name',),
+    'platform_name': ('platform__name',),
+    'price': ('price',),
+    'sale_price': ('sale_price',),
+    'current_price': ('price', 'sale_price'),
+    'discount_percentage': ('price', 'sale_price'),
+    'in_stock': ('id', 'is_external', 'has_available_keys'),
+    'region': ('region',),
+}
+
+CENT = Decimal('0.01')
+
+
+def format_price(value):
+    """A price as DRF's DecimalField(decimal_places=2) renders it."""
+    return '{:f}'.format(value.quantize(CENT))
+
+
+def product_list_values(queryset, fields=None):
+    """
+    Rows for serialize_product_list() with only the columns `fields` are
+    built from (all of ProductListSerializer's by default). in_stock
+    needs a queryset annotated with with_availability().
+    """
+    columns = dict.fromkeys(
+        column for field in (fields or PRODUCT_LIST_COLUMNS) for column in PRODUCT_LIST_COLUMNS[field]
+    )
+    return queryset.values(*columns)
+
+
+def serialize_product_list(rows, request=None, fields=None):
+    """
+    Read-only fast path producing the same output as
+    ProductListSerializer(many=True), or its sparse fieldset `fields`,
+    from product_list_values() rows instead of model instances and
+    without running DRF fields per value.
+    Keep it in step with ProductListSerializer.
+    """
+    rows = list(rows)
+    names = [name for name in PRODUCT_LIST_COLUMNS if fields is None or name in fields]
+    url = media_url(Product._meta.get_field('image').storage, request)
+    
+    external_stock = {}
+    if 'in_stock' in names:
+        external_ids = [row['id'] for row in rows if row['is_external']]
+        if external_ids:
+            external_stock = get_external_stock_many(external_ids)
+    
+    def in_stock(row):
+        if row['is_external']:
+            # Same fallback as Product.available_keys_count
+            return external_stock.get(row['id'], 999) > 0
+        return bool(row['has_available_keys'])
+    
+    def discount_percentage(row):
+        price, sale_price = row['price'], row['sale_price']
+        return round((1 - (sale_price / price)) * 100) if sale_price and price > 0 else 0
+    
+    getters = {
+        'id': itemgetter('id'),
+        'name': itemgetter('name'),
+        'slug': itemgetter('slug'),
+        'short_description': itemgetter('short_description'),
+        'image': lambda row: url(row['image']) if row['image'] else None,
+        'image_srcset': lambda row: variant_srcset(row['image'], row['image_variants'], url),
+        'category_name': itemgetter('category__name'),
+        'platform_name': itemgetter('platform__name'),
+        'price': lambda row: format_price(row['price']),
+        'sale_price': lambda row: format_price(row['sale_price']) if row['sale_price'] is not None else None,
+        'current_price': lambda row: format_price(row['sale_price'] or row['price']),
+        'discount_percentage': discount_percentage,
+        'in_stock': in_stock,
+        'region': itemgetter('region'),
+    }
+    selected = [(name, getters[name]) for name in names]
+    return [{name: get(row) for name, get in selected} for row in rows]
+
+
+class ProductDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for product detail view (all fields)."""
     category = CategorySerializer(read_only=True)
     platform = PlatformSerializer(read_only=True)
@@ -60,4 +167,114 @@ class AdminProductSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Product
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        read_only_fields = ['image_variants']
+
+class ProductBulkChangesSerializer(serializers.Serializer):
+    """Field changes applied to every product of a bulk update."""
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'), required=False)
+    sale_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal('0.01'), required=False, allow_null=True
+    )
+    is_active = serializers.BooleanField(required=False)
+    is_featured = serializers.BooleanField(required=False)
+    
+    change_fields = ('price', 'sale_price', 'is_active', 'is_featured')
+    
+    def validate(self, data):
+        if not any(field in data for field in self.change_fields):
+            raise serializers.ValidationError("No changes given.")
+        return data
+
+
+class ProductBulkRowSerializer(ProductBulkChangesSerializer):
+    """Changes for a single product of a bulk update."""
+    id = serializers.IntegerField()
+
+
+class ProductBulkFilterSerializer(serializers.Serializer):
+    """Selects the products of a bulk update by their attributes."""
+    category = serializers.SlugField(required=False)
+    platform = serializers.SlugField(required=False)
+    supplier = serializers.IntegerField(required=False)
+    region = serializers.ChoiceField(choices=Product.REGION_CHOICES, required=False)
+    is_active = serializers.BooleanField(required=False)
+    is_featured = serializers.BooleanField(required=False)
+    is_external = serializers.BooleanField(required=False)
+    
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError("An empty filter would match every product.")
+        return data
+
+
+class ProductBulkUpdateSerializer(serializers.Serializer):
+    """
+    Bulk update request: either the same `changes` for the products in
+    `ids` or matching `filter`, or per-product `items`.
+    Items are validated one by one later so errors can be reported per row.
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    filter = ProductBulkFilterSerializer(required=False)
+    changes = ProductBulkChangesSerializer(required=False)
+    items = serializers.ListField(child=serializers.DictField(), required=False, allow_empty=False)
+    
+    def validate(self, data):
+        selectors = [key for key in ('ids', 'filter', 'items') if key in data]
+        if len(selectors) != 1:
+            raise serializers.ValidationError("Give exactly one of ids, filter or items.")
+        if selectors[0] == 'items':
+            if 'changes' in data:
+                raise serializers.ValidationError("Items carry their own changes.")
+        elif 'changes' not in data:
+            raise serializers.ValidationError({'changes': ["This field is required."]})
+        
+        max_rows = settings.PRODUCT_BULK_MAX_ROWS
+        if len(data.get('ids') or data.get('items') or []) > max_rows:
+            raise serializers.ValidationError(f"At most {max_rows} products can be changed at once.")
+        return data
+
+
+class ProductBatchSerializer(serializers.Serializer):
+    """Products to look up by `ids` or `slugs`, in the order given."""
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    slugs = serializers.ListField(child=serializers.SlugField(max_length=255), required=False, allow_empty=False)
+    
+    def validate(self, data):
+        if len(data) != 1:
+            raise serializers.ValidationError("Give exactly one of ids or slugs.")
+        max_items = settings.PRODUCT_BATCH_MAX_ITEMS
+        if len(data.get('ids') or data.get('slugs')) > max_items:
+            raise serializers.ValidationError(f"At most {max_items} products can be looked up at once.")
+        return data
+
+
+class ProductBulkCreateSerializer(serializers.ModelSerializer):
+    """
+    A single product of a bulk create. Relations and slug uniqueness are
+    checked for the whole batch at once instead of with a query per row.
+    """
+    slug = serializers.SlugField(max_length=255, required=False)
+    category = serializers.IntegerField()
+    platform = serializers.IntegerField()
+    supplier = serializers.IntegerField(required=False, allow_null=True)
+    
+    class Meta:
+        model = Product
+        fields = [
+            'name', 'slug', 'description', 'short_description',
+            'category', 'platform', 'price', 'sale_price',
+            'is_active', 'is_featured', 'is_external', 'supplier',
+            'external_id', 'key_buffer_size', 'region'
+        ]
+
+
+class ProductBulkCreateRequestSerializer(serializers.Serializer):
+    """Bulk create request, validated row by row later."""
+    items = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+    
+    def validate_items(self, items):
+        max_rows = settings.PRODUCT_BULK_MAX_ROWS
+        if len(items) > max_rows:
+            raise serializers.ValidationError(f"At most {max_rows} products can be created at once.")
+        return items
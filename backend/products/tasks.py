@@ -0,0 +1,25 @@
+from celery import shared_task
+from django.apps import apps
+from .cache import invalidate_catalog
+from .images import build_variants
+
+
+@shared_task(autoretry_for=(OSError,), retry_backoff=True, max_retries=3)
+def generate_image_variants(model_label, pk):
+    """
+    Write the resized copies of a product, category or platform image
+    and record them on the row.
+    """
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).only('image', 'image_variants').first()
+    if instance is None or not instance.image:
+        return "Nothing to do"
+
+    variants = build_variants(instance.image.name, previous=instance.image_variants)
+    if variants == instance.image_variants:
+        return "Variants up to date"
+
+    # Only record them if the image was not replaced in the meantime
+    model.objects.filter(pk=pk, image=variants['source']).update(image_variants=variants)
+    invalidate_catalog()
+    return f"Generated {len(variants['widths'])} widths for {model_label} {pk}"
@@ -0,0 +1,484 @@
+import io
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from orders.benchmarks import create_user
+from suppliers.stock import set_external_stock_many
+from . import images, tasks
+from .cache import invalidate_catalog
+from .benchmarks import create_catalog
+from .images import build_variants, media_url, variant_srcset
+from .models import Category, DigitalKey, Product, SoldKey, Supplier
+from .serializers import ProductListSerializer, product_list_values, serialize_product_list
+from .tasks import generate_image_variants
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SparseFieldsetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.products = create_catalog(10, keys_per_product=2)
+        self.client = APIClient()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_list_is_two_queries_for_a_page(self):
+        with self.assertNumQueries(2):
+            results = self.get('/api/products/')['results']
+
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(product['in_stock'] for product in results))
+
+    def test_list_omits_fields_and_what_loads_them(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.get('/api/products/?omit=category_name,platform_name,in_stock')['results']
+
+        self.assertEqual(len(queries), 2)
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('EXISTS', sql)
+        self.assertNotIn('in_stock', results[0])
+        self.assertNotIn('category_name', results[0])
+        self.assertIn('current_price', results[0])
+
+    def test_omit_applies_after_fields(self):
+        results = self.get('/api/products/?fields=id,name,price&omit=price')['results']
+
+        self.assertEqual(set(results[0]), {'id', 'name'})
+
+    def test_cached_lists_are_kept_per_fieldset(self):
+        self.assertIn('in_stock', self.get('/api/products/on_sale/')[0])
+        self.assertNotIn('in_stock', self.get('/api/products/on_sale/?omit=in_stock')[0])
+
+    def test_retrieve_is_one_query(self):
+        url = f'/api/products/{self.products[0].slug}/'
+        with self.assertNumQueries(1):
+            product = self.get(url)
+        self.assertEqual(product['available_keys_count'], 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            product = self.get(url + '?omit=category,platform,in_stock,available_keys_count')
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('JOIN', queries.captured_queries[0]['sql'])
+        self.assertNotIn('category', product)
+
+
+class KeyExportTests(TestCase):
+
+    def setUp(self):
+        self.product = create_catalog(1, keys_per_product=0)[0]
+        self.key = DigitalKey.objects.create(product=self.product, key_code='ABCD-SECRET-WXYZ')
+        staff = create_user()
+        staff.is_staff = True
+        staff.save()
+        staff.user_permissions.add(Permission.objects.get(codename='view_digitalkey'))
+        self.client.force_login(staff)
+
+    def test_export_masks_key_codes(self):
+        response = self.client.post(
+            reverse('admin:products_digitalkey_changelist'),
+            {'action': 'export', '_selected_action': [self.key.pk]},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('ABCD…WXYZ', content)
+        self.assertNotIn('SECRET', content)
+
+
+class KeyPoolTests(TestCase):
+
+    def setUp(self):
+        self.product = create_catalog(1, keys_per_product=0)[0]
+        self.added_at = timezone.now() - timedelta(days=30)
+        for n, code in enumerate(('FIRST', 'SECOND')):
+            DigitalKey.objects.create(product=self.product, key_code=code, created_at=self.added_at + timedelta(days=n))
+
+    def test_released_keys_keep_their_place_in_the_pool(self):
+        sold = DigitalKey.allocate(self.product, 1)
+        self.assertEqual([key.key_code for key in sold], ['FIRST'])
+        DigitalKey.objects.create(product=self.product, key_code='NEW')
+
+        SoldKey.release([key.id for key in sold])
+
+        released = DigitalKey.objects.get(key_code='FIRST')
+        self.assertEqual(released.created_at, self.added_at)
+        self.assertFalse(SoldKey.objects.exists())
+        # Oldest first, although the released key has the newest id
+        self.assertEqual([key.key_code for key in DigitalKey.allocate(self.product, 3)], ['FIRST', 'SECOND', 'NEW'])
+
+
+def png(width, height, color=(0, 0, 0, 0)):
+    buffer = io.BytesIO()
+    Image.new('RGBA', (width, height), color).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, IMAGE_VARIANT_WIDTHS=[160, 320, 640])
+class ImageVariantTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patch = override_settings(MEDIA_ROOT=directory.name)
+        patch.enable()
+        self.addCleanup(patch.disable)
+        self.storage = FileSystemStorage(location=directory.name)
+
+    def test_widths_above_the_original_are_skipped(self):
+        variants = build_variants(self.storage.save('products/cover.png', png(400, 200)), self.storage)
+
+        self.assertEqual(variants['widths'], [160, 320])
+        self.assertEqual(set(variants['webp']), {'160', '320'})
+        with self.storage.open(variants['jpeg']['320']) as f:
+            self.assertEqual(Image.open(f).size, (320, 160))
+
+        small = build_variants(self.storage.save('products/icon.png', png(100, 100)), self.storage)
+        self.assertEqual(small['widths'], [100])
+
+    def test_transparent_images_are_flattened_onto_white_for_jpeg(self):
+        variants = build_variants(self.storage.save('products/cover.png', png(200, 200)), self.storage)
+
+        with self.storage.open(variants['jpeg']['160']) as f:
+            image = Image.open(f)
+            self.assertEqual((image.mode, image.getpixel((80, 80))), ('RGB', (255, 255, 255)))
+
+    def test_unchanged_content_returns_the_previous_variants(self):
+        name = self.storage.save('products/cover.png', png(400, 200))
+        previous = build_variants(name, self.storage)
+
+        with mock.patch.object(images, '_encode') as encode:
+            self.assertIs(build_variants(name, self.storage, previous=previous), previous)
+        encode.assert_not_called()
+
+        # Other content under the same name is rebuilt
+        self.storage.delete(name)
+        self.storage.save(name, png(400, 200, color=(255, 0, 0, 255)))
+        self.assertNotEqual(build_variants(name, self.storage, previous=previous)['hash'], previous['hash'])
+
+    def test_task_records_variants_unless_the_image_was_replaced(self):
+        category = Category.objects.create(name="Action", slug='action', image=self.storage.save('categories/a.png', png(400, 200)))
+
+        generate_image_variants('products.category', category.pk)
+        category.refresh_from_db()
+        self.assertEqual(category.image_variants['source'], category.image.name)
+
+        replaced = Category.objects.create(name="RPG", slug='rpg', image=self.storage.save('categories/b.png', png(400, 200)))
+        build = images.build_variants
+
+        def build_then_replace(name, **kwargs):
+            variants = build(name, **kwargs)
+            Category.objects.filter(pk=replaced.pk).update(image='categories/c.png')
+            return variants
+
+        with mock.patch.object(tasks, 'build_variants', side_effect=build_then_replace):
+            generate_image_variants('products.category', replaced.pk)
+        self.assertEqual(Category.objects.get(pk=replaced.pk).image_variants, {})
+
+    def test_srcset_is_empty_for_stale_variants(self):
+        variants = build_variants(self.storage.save('products/cover.png', png(400, 200)), self.storage)
+        url = media_url(self.storage)
+
+        self.assertEqual(
+            variant_srcset(variants['source'], variants, url)['webp'],
+            f"{url(variants['webp']['160'])} 160w, {url(variants['webp']['320'])} 320w",
+        )
+        self.assertEqual(variant_srcset('products/new.png', variants, url), {})
+        self.assertEqual(variant_srcset(None, variants, url), {})
+
+    def test_command_generates_missing_variants(self):
+        category = Category.objects.create(name="Action", slug='action', image=self.storage.save('categories/a.png', png(400, 200)))
+
+        out = StringIO()
+        call_command('generate_image_variants', model=['categories'], workers=1, stdout=out, stderr=StringIO())
+        category.refresh_from_db()
+        self.assertEqual(category.image_variants['widths'], [160, 320])
+
+        call_command('generate_image_variants', model=['categories'], workers=1, stdout=out, stderr=StringIO())
+        self.assertIn("All images are up to date.", out.getvalue())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductListOutputTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        # Every third product is on sale; one is out of stock
+        create_catalog(3, keys_per_product=1)
+        create_catalog(1, keys_per_product=0)
+        supplier = Supplier.objects.create(name="Supplier", api_url='https://supplier.example.com')
+        external = create_catalog(2, keys_per_product=0, is_external=True, supplier=supplier)
+        set_external_stock_many({external[0].id: 0})
+        Product.objects.filter(pk=external[1].pk).update(
+            image='products/cover.png',
+            price=Decimal('0.00'),
+            sale_price=Decimal('1.00'),
+            image_variants={
+                'source': 'products/cover.png', 'hash': 'abc', 'widths': [160],
+                'webp': {'160': 'products/variants/cover.abc.160w.webp'},
+                'jpeg': {'160': 'products/variants/cover.abc.160w.jpg'},
+            },
+        )
+        Product.objects.filter(pk=external[0].pk).update(image='products/stale.png', image_variants={'source': 'products/old.png'})
+        self.request = RequestFactory().get('/api/products/')
+        self.queryset = Product.objects.select_related('category', 'platform').with_availability().order_by('id')
+
+    def assertSameOutput(self, fields=None):
+        expected = ProductListSerializer(self.queryset, many=True, fields=fields, context={'request': self.request}).data
+        rows = product_list_values(self.queryset, fields)
+
+        self.assertEqual(
+            JSONRenderer().render(serialize_product_list(rows, self.request, fields)),
+            JSONRenderer().render(expected),
+        )
+
+    def test_matches_the_serializer(self):
+        self.assertSameOutput()
+
+    def test_matches_the_serializer_for_sparse_fieldsets(self):
+        for fields in (['id', 'in_stock'], ['image', 'image_srcset'], ['price', 'sale_price', 'current_price', 'discount_percentage']):
+            with self.subTest(fields=fields):
+                self.assertSameOutput(fields)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PRODUCT_BULK_MAX_ROWS=3, PRODUCT_BULK_CHUNK_SIZE=2)
+class BulkProductTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.products = create_catalog(3, keys_per_product=0)
+        staff = create_user()
+        staff.is_staff = True
+        staff.save()
+        self.client = APIClient()
+        self.client.force_authenticate(staff)
+
+    def post(self, action, data):
+        return self.client.post(f'/api/admin/products/{action}/', data, format='json')
+
+    def test_update_by_ids_reports_the_rows_it_skipped(self):
+        ids = [product.id for product in self.products]
+        response = self.post('bulk_update', {'ids': ids + [0], 'changes': {'sale_price': '19.99'}})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.post('bulk_update', {'ids': [ids[0], 0], 'changes': {'price': '29.99'}})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['requested'], response.data['updated']), (2, 1))
+        self.assertEqual(response.data['errors'], [{'index': 1, 'errors': {'id': ["Product not found."]}, 'id': 0}])
+        self.assertEqual(Product.objects.get(pk=ids[0]).price, Decimal('29.99'))
+
+    def test_update_items_checks_sale_prices_against_new_prices(self):
+        first, second = self.products[1], self.products[2]
+        response = self.post('bulk_update', {'items': [
+            {'id': first.id, 'price': '9.99', 'sale_price': '4.99'},
+            {'id': second.id, 'sale_price': '25.00'},
+            {'id': second.id},
+        ]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertEqual(Product.objects.get(pk=first.pk).sale_price, Decimal('4.99'))
+        self.assertIsNone(Product.objects.get(pk=second.pk).sale_price)
+
+    def test_every_way_of_selecting_products_is_capped(self):
+        create_catalog(1, keys_per_product=0)
+        changes = {'is_featured': True}
+
+        for data in (
+            {'ids': list(Product.objects.values_list('id', flat=True)), 'changes': changes},
+            {'items': [{'id': product.id, **changes} for product in Product.objects.all()]},
+            {'filter': {'category': 'benchmark'}, 'changes': changes},
+        ):
+            with self.subTest(selector=next(iter(data))):
+                response = self.post('bulk_update', data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("At most 3 products", str(response.data))
+
+        self.assertFalse(Product.objects.filter(is_featured=True).exists())
+        response = self.post('bulk_create', {'items': [{'name': f"New {n}"} for n in range(4)]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_update_by_filter(self):
+        Product.objects.filter(pk=self.products[0].pk).update(is_active=False)
+
+        response = self.post('bulk_update', {'filter': {'is_active': True}, 'changes': {'is_featured': True}})
+
+        self.assertEqual(response.data['updated'], 2)
+        self.assertCountEqual(
+            Product.objects.filter(is_featured=True).values_list('id', flat=True),
+            [product.id for product in self.products[1:]],
+        )
+
+    def test_create_skips_invalid_rows(self):
+        product = self.products[0]
+        row = {'name': "New game", 'category': product.category_id, 'platform': product.platform_id, 'price': '9.99'}
+
+        response = self.post('bulk_create', {'items': [
+            row,
+            {**row, 'slug': product.slug},
+            {**row, 'name': "Other game", 'category': 0},
+        ]})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([set(error['errors']) for error in response.data['errors']], [{'slug'}, {'category'}])
+        self.assertEqual(Product.objects.get(pk=response.data['ids'][0]).slug, 'new-game')
+
+    def test_staff_only(self):
+        self.client.force_authenticate(create_user())
+
+        response = self.post('bulk_update', {'ids': [self.products[0].id], 'changes': {'is_featured': True}})
+
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncProductViewTests(TestCase):
+    """The async views under gamekeys.asgi_urls return what the viewsets do."""
+
+    def setUp(self):
+        cache.clear()
+        supplier = Supplier.objects.create(name="Supplier", api_url='https://supplier.example.com')
+        # More than a page of products, some featured or on sale
+        self.products = create_catalog(20, keys_per_product=1)
+        Product.objects.filter(pk__in=[product.pk for product in self.products[:5]]).update(is_featured=True)
+        external = create_catalog(1, keys_per_product=0, is_external=True, supplier=supplier)[0]
+        set_external_stock_many({external.id: 0})
+        self.async_client = AsyncClient()
+
+    async def assertSameResponse(self, url):
+        expected = await sync_to_async(self.client.get)(url)
+        with override_settings(ROOT_URLCONF='gamekeys.asgi_urls'):
+            response = await self.async_client.get(url)
+
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.json(), expected.json())
+        return response
+
+    async def test_list_pages(self):
+        for url in ('/api/products/', '/api/products/?page=2', '/api/products/?page=last&omit=in_stock',
+                    '/api/products/?ordering=price&search=product'):
+            with self.subTest(url=url):
+                await self.assertSameResponse(url)
+
+        response = await self.assertSameResponse('/api/products/?page=3')
+        self.assertEqual(response.json(), {'detail': 'Invalid page.'})
+
+    async def test_detail(self):
+        await self.assertSameResponse(f'/api/products/{self.products[0].slug}/')
+        await self.assertSameResponse(f'/api/products/{self.products[0].slug}/?fields=id,in_stock')
+        await self.assertSameResponse('/api/products/missing/')
+
+    async def test_cached_lists(self):
+        for url in ('/api/products/featured/', '/api/products/on_sale/', '/api/products/featured/?fields=id'):
+            with self.subTest(url=url):
+                with override_settings(ROOT_URLCONF='gamekeys.asgi_urls'):
+                    cached = (await self.async_client.get(url)).json()
+                    # Served from the cache until the catalog is invalidated
+                    await Product.objects.filter(is_featured=True).aupdate(name="Renamed")
+                    await Product.objects.filter(sale_price__isnull=False).aupdate(name="Renamed")
+                    self.assertEqual((await self.async_client.get(url)).json(), cached)
+
+                await sync_to_async(invalidate_catalog)()
+                await self.assertSameResponse(url)
+
+    async def test_other_methods_are_not_allowed(self):
+        with override_settings(ROOT_URLCONF='gamekeys.asgi_urls'):
+            response = await self.async_client.delete('/api/products/featured/')
+
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response['Allow'], 'GET, HEAD, OPTIONS')
+        self.assertEqual(response.json(), {'detail': 'Method "DELETE" not allowed.'})
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PRODUCT_BATCH_MAX_ITEMS=3)
+class ProductBatchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.products = create_catalog(3, keys_per_product=1)
+        self.client = APIClient()
+
+    def batch(self, query='', data=None):
+        if data is not None:
+            return self.client.post('/api/products/batch/' + query, data, format='json')
+        return self.client.get('/api/products/batch/' + query)
+
+    def test_missing_products_do_not_fail_the_batch(self):
+        first, second, _ = self.products
+        response = self.batch(data={'ids': [second.id, 999999, first.id]})
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([result['id'] for result in results], [second.id, 999999, first.id])
+        self.assertEqual(results[1], {'id': 999999, 'not_found': True})
+        self.assertEqual(results[2]['current_price'], '14.99')
+        self.assertTrue(results[2]['in_stock'])
+
+        response = self.batch(f'?slugs={first.slug},missing&fields=name')
+        self.assertEqual(response.data['results'], [{'name': first.name}, {'slug': 'missing', 'not_found': True}])
+
+    def test_inactive_products_are_not_found_for_anyone(self):
+        product = self.products[0]
+        self.assertNotIn('not_found', self.batch(f'?ids={product.id}').data['results'][0])
+
+        product.is_active = False
+        product.save()
+        staff = create_user()
+        staff.is_staff = True
+        staff.save()
+        self.client.force_authenticate(staff)
+
+        self.assertEqual(self.batch(f'?ids={product.id}').data['results'], [{'id': product.id, 'not_found': True}])
+
+    def test_results_and_misses_are_cached(self):
+        ids = ','.join(str(product.id) for product in self.products[:2]) + ',999999'
+        self.batch(f'?ids={ids}')
+
+        with self.assertNumQueries(0):
+            response = self.batch(f'?ids={ids}')
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_size_limit(self):
+        ids = [product.id for product in self.products]
+        self.assertEqual(self.batch(data={'ids': ids}).status_code, 200)
+
+        for response in (
+            self.batch(data={'ids': ids + [999999]}),
+            self.batch('?ids=' + ','.join(str(value) for value in ids + [999999])),
+        ):
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("At most 3 products", str(response.data))
+
+    def test_one_lookup_is_required(self):
+        for response in (
+            self.batch(),
+            self.batch(data={'ids': [1], 'slugs': ['a']}),
+            self.batch('?ids=a'),
+        ):
+            self.assertEqual(response.status_code, 400)
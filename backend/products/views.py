@@ -1,13 +1,20 @@
 from rest_framework import viewsets, generics, filters, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
+from api.serializers import omitted_spec, requested_spec
 from .models import Category, Platform, Product
 from .serializers import (
     CategorySerializer, PlatformSerializer,
-    ProductListSerializer, ProductDetailSerializer, AdminProductSerializer
+    ProductListSerializer, ProductDetailSerializer, AdminProductSerializer,
+    ProductBulkUpdateSerializer, ProductBulkCreateRequestSerializer, ProductBatchSerializer,
+    product_list_values, serialize_product_list
 )
+from .bulk import validate_rows, bulk_update_products, bulk_create_products
+from .cache import get_cached_catalog, get_cached_catalog_many
 
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -42,28 +49,117 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     ordering = ['-created_at']
     lookup_field = 'slug'
     
+    def get_queryset(self):
+        # Load only what the requested fields need (see SparseFieldsetMixin)
+        fields = self.requested_fields()
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            related = [name for name in ('category', 'platform') if name in fields]
+            if related:
+                queryset = queryset.select_related(*related)
+        # Annotate stock so serializing in_stock needs no query per product
+        if 'in_stock' in fields or 'available_keys_count' in fields:
+            queryset = queryset.with_availability(count='available_keys_count' in fields)
+        return queryset
+    
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return ProductDetailSerializer
         return ProductListSerializer
     
+    def requested_fields(self):
+        if not hasattr(self, '_requested_fields'):
+            self._requested_fields = self.get_serializer_class().requested_fields(self.request)
+        return self._requested_fields
+    
+    def list_values(self, queryset):
+        return product_list_values(queryset, self.requested_fields())
+    
+    def serialize_list(self, rows):
+        # Same output as ProductListSerializer, from list_values() rows
+        return serialize_product_list(rows, self.request, self.requested_fields())
+    
+    def catalog_cache_name(self, name):
+        # Image URLs are absolute, so cache per host, and per sparse fieldset
+        name = f"{name}:{self.request.build_absolute_uri('/')}"
+        if requested_spec(self.request) is not None or omitted_spec(self.request) is not None:
+            name += ':' + ','.join(self.requested_fields())
+        return name
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.list_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.serialize_list(page))
+        return Response(self.serialize_list(queryset))
+    
     @action(detail=False, methods=['get'])
     def featured(self, request):
         """
         Return featured products.
         """
-        featured = self.get_queryset().filter(is_featured=True)[:10]
-        serializer = self.get_serializer(featured, many=True)
-        return Response(serializer.data)
+        def build():
+            featured = self.get_queryset().filter(is_featured=True)[:10]
+            return self.serialize_list(self.list_values(featured))
+        
+        return Response(get_cached_catalog(self.catalog_cache_name('featured'), build))
     
     @action(detail=False, methods=['get'])
     def on_sale(self, request):
         """
         Return products that are on sale.
         """
-        on_sale = self.get_queryset().filter(sale_price__isnull=False)[:10]
-        serializer = self.get_serializer(on_sale, many=True)
-        return Response(serializer.data)
+        def build():
+            on_sale = self.get_queryset().filter(sale_price__isnull=False)[:10]
+            return self.serialize_list(self.list_values(on_sale))
+        
+        return Response(get_cached_catalog(self.catalog_cache_name('on_sale'), build))
+    
+    @action(detail=False, methods=['get', 'post'])
+    def batch(self, request):
+        """
+        Return list fields, including current price and stock, for up to
+        PRODUCT_BATCH_MAX_ITEMS products by `ids` or `slugs` (comma
+        separated on GET, lists on POST), in the order requested. Missing
+        and inactive products are returned as {"id" or "slug": ..., "not_found": true}.
+        """
+        if request.method == 'GET':
+            data = {
+                key: [value for value in request.query_params[key].split(',') if value]
+                for key in ('ids', 'slugs') if key in request.query_params
+            }
+        else:
+            data = request.data
+        serializer = ProductBatchSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        lookup, values = next(iter(serializer.validated_data.items()))
+        field = 'id' if lookup == 'ids' else 'slug'
+        
+        # Each product is cached whole and per host, like the other catalog responses
+        host = request.build_absolute_uri('/')
+        names = {value: f"product:{field}:{value}:{host}" for value in values}
+        
+        def build(missing):
+            wanted = [value for value, name in names.items() if name in missing]
+            products = Product.objects.filter(is_active=True, **{f'{field}__in': wanted}).with_availability()
+            rows = list(product_list_values(products))
+            # False caches the miss, so unknown products cost no query either
+            built = dict.fromkeys(missing, False)
+            built.update(
+                (names[row[field]], product) for row, product in zip(rows, serialize_product_list(rows, request))
+            )
+            return built
+        
+        cached = get_cached_catalog_many(list(names.values()), build)
+        fields = self.requested_fields()
+        results = []
+        for value in values:
+            product = cached.get(names[value])
+            if not product:
+                results.append({field: value, 'not_found': True})
+            else:
+                results.append({name: product[name] for name in fields})
+        return Response({'results': results})
     
     @action(detail=False, methods=['get'])
     def by_category(self, request, category_slug=None):
@@ -78,8 +174,7 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
             )
         
         products = self.get_queryset().filter(category__slug=category_slug)
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        return Response(self.serialize_list(self.list_values(products)))
     
     @action(detail=False, methods=['get'])
     def by_platform(self, request):
@@ -94,8 +189,7 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
             )
         
         products = self.get_queryset().filter(platform__slug=platform_slug)
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        return Response(self.serialize_list(self.list_values(products)))
 
 
 class AdminProductViewSet(viewsets.ModelViewSet):
@@ -105,4 +199,66 @@ class AdminProductViewSet(viewsets.ModelViewSet):
     """
     queryset = Product.objects.all()
     serializer_class = AdminProductSerializer
-    permission_classes = [IsAuthenticated, IsAdminUser]
\ No newline at end of file
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    
+    @action(detail=False, methods=['post'])
+    def bulk_update(self, request):
+        """
+        Update price, sale_price, is_active and is_featured of many products.
+        Send `changes` with a list of `ids` or a `filter`, or per-product `items`.
+        """
+        serializer = ProductBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        if 'items' in data:
+            requested = len(data['items'])
+            rows, errors = validate_rows(data['items'])
+        else:
+            if 'ids' in data:
+                product_ids = data['ids']
+            else:
+                # Capped like ids and items, without loading every match
+                max_rows = settings.PRODUCT_BULK_MAX_ROWS
+                product_ids = list(self._filter_products(data['filter']).values_list('id', flat=True)[:max_rows + 1])
+                if len(product_ids) > max_rows:
+                    raise ValidationError({'filter': [f"At most {max_rows} products can be changed at once."]})
+            requested = len(product_ids)
+            rows = [(index, product_id, data['changes']) for index, product_id in enumerate(product_ids)]
+            errors = []
+        
+        updated, update_errors = bulk_update_products(rows)
+        errors = sorted(errors + update_errors, key=lambda error: error['index'])
+        
+        return Response(
+            {'requested': requested, 'updated': updated, 'errors': errors},
+            status=status.HTTP_400_BAD_REQUEST if errors and not updated else status.HTTP_200_OK
+        )
+    
+    @action(detail=False, methods=['post'])
+    def bulk_create(self, request):
+        """
+        Create many products at once from a list of `items`.
+        """
+        serializer = ProductBulkCreateRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        created, errors = bulk_create_products(serializer.validated_data['items'])
+        
+        return Response(
+            {'created': len(created), 'ids': [product.id for product in created], 'errors': errors},
+            status=status.HTTP_400_BAD_REQUEST if errors and not created else status.HTTP_201_CREATED
+        )
+    
+    def _filter_products(self, filters):
+        """
+        Products matching a bulk update filter.
+        """
+        lookups = {
+            'category': 'category__slug',
+            'platform': 'platform__slug',
+            'supplier': 'supplier_id',
+        }
+        return Product.objects.filter(**{
+            lookups.get(field, field): value for field, value in filters.items()
+        })
\ No newline at end of file
@@ -0,0 +1,126 @@
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+
+
+class SupplierError(Exception):
+    """Raised when a supplier API call fails."""
+
+
+class SupplierUnavailable(SupplierError):
+    """Raised when calls to a supplier are short-circuited by its breaker."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for calls to a single supplier.
+    State is kept in the cache so every worker process shares it.
+    """
+
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.SUPPLIER_CIRCUIT_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or settings.SUPPLIER_CIRCUIT_RESET_TIMEOUT
+        self.failures_key = f'circuit:{name}:failures'
+        self.opened_key = f'circuit:{name}:opened_until'
+        self.trial_key = f'circuit:{name}:trial'
+
+    def allow_request(self):
+        """Return True if a call may go through to the supplier."""
+        opened_until = cache.get(self.opened_key)
+        if opened_until is None:
+            return True
+
+        if time.time() < opened_until:
+            return False
+
+        # Half-open: let a single trial call through to probe the supplier
+        return cache.add(self.trial_key, True, timeout=self.reset_timeout)
+
+    def record_success(self):
+        cache.delete_many([self.failures_key, self.opened_key, self.trial_key])
+
+    def record_failure(self):
+        cache.add(self.failures_key, 0, timeout=self.reset_timeout * 10)
+        failures = cache.incr(self.failures_key)
+
+        if failures >= self.failure_threshold:
+            cache.set(self.opened_key, time.time() + self.reset_timeout, timeout=None)
+            cache.delete(self.trial_key)
+
+    def call(self, func, *args, **kwargs):
+        """Call func through the breaker, raising SupplierUnavailable when open."""
+        if not self.allow_request():
+            raise SupplierUnavailable(f"Circuit for {self.name} is open")
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+
+        self.record_success()
+        return result
+
+
+class SupplierClient:
+    """
+    Client for an external key supplier API.
+    """
+
+    def __init__(self, supplier):
+        self.supplier = supplier
+        self.breaker = CircuitBreaker(f'supplier:{supplier.pk}')
+
+    def purchase_keys(self, external_id, quantity):
+        """
+        Purchase up to `quantity` keys for a product in as few calls as the
+        supplier batch size allows. Stops early if a batch comes back short,
+        which means the supplier has run out. Returns a list of key codes.
+        """
+        key_codes = []
+        batch_size = max(1, self.supplier.batch_size)
+
+        while len(key_codes) < quantity:
+            count = min(batch_size, quantity - len(key_codes))
+            batch = self.breaker.call(self._purchase_batch, external_id, count)
+            key_codes.extend(batch)
+            if len(batch) < count:
+                break
+
+        return key_codes
+
+    def _purchase_batch(self, external_id, count):
+        """
+        Purchase a single batch of keys from the supplier.
+        This is a placeholder - in a real app, you'd call the API.
+        """
+        # Placeholder for external API call
+        # In a real implementation, you would:
+        # 1. POST a purchase request for `count` keys to self.supplier.api_url
+        # 2. Authenticate with self.supplier.api_key / api_secret
+        # 3. Return the key codes from the response
+
+        # For now, just generate dummy keys
+        return [
+            f"EXTERNAL-DEMO-KEY-{external_id}-{uuid.uuid4().hex[:16].upper()}"
+            for _ in range(count)
+        ]
+
+    def fetch_stock(self, external_ids):
+        """
+        Get current stock and prices for the given products.
+        Returns {external_id: {'stock': ..., 'price': ..., 'sale_price': ...}}.
+        """
+        return self.breaker.call(self._fetch_stock, list(external_ids))
+
+    def _fetch_stock(self, external_ids):
+        """
+        Fetch stock levels from the supplier.
+        This is a placeholder - in a real app, you'd call the API.
+        """
+        # Placeholder for external API call
+        # In a real implementation, you would query the supplier's
+        # stock endpoint for the given products
+        return {}
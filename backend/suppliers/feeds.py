@@ -0,0 +1,255 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from products.cache import invalidate_catalog
+from products.models import Category, Platform, Product
+
+
+# Product fields a supplier feed is allowed to update
+FEED_FIELDS = ('name', 'short_description', 'description', 'price', 'sale_price', 'is_active', 'region')
+
+READ_SIZE = 64 * 1024
+
+
+class FeedError(Exception):
+    """Raised when a feed file or mapping cannot be processed."""
+
+
+def open_feed(path):
+    """
+    Open a feed file for reading as text, decompressing it transparently
+    if it is gzipped.
+    """
+    raw = open(path, 'rb')
+    if raw.peek(2)[:2] == b'\x1f\x8b':
+        raw = gzip.GzipFile(fileobj=raw)
+    return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+
+
+def detect_format(path):
+    """Guess the feed format from the file name."""
+    name = path.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.json', '.ndjson', '.jsonl')):
+        return 'json'
+    raise FeedError(f"Cannot detect feed format of {path}")
+
+
+def iter_csv_records(stream):
+    """Yield feed rows from a CSV stream as dicts."""
+    yield from csv.DictReader(stream)
+
+
+def iter_json_records(stream):
+    """
+    Yield objects from a JSON array or newline-delimited JSON stream,
+    decoding one record at a time so memory stays constant.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    while True:
+        # Skip whitespace and the array punctuation between records
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            position += 1
+
+        if position < len(buffer):
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise FeedError(f"Invalid JSON record near: {buffer[position:position + 80]!r}")
+            else:
+                position = end
+                yield record
+                continue
+        elif eof:
+            return
+
+        chunk = stream.read(READ_SIZE)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def parse_boolean(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y', 'on')
+
+
+def parse_price(value):
+    if value is None or value == '':
+        return None
+    try:
+        return Decimal(str(value)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise FeedError(f"Invalid price: {value!r}")
+
+
+class FeedImporter:
+    """
+    Apply a supplier feed to the supplier's products in chunks.
+
+    Rows are matched to products by `external_id`. Each mapped row is hashed
+    and rows whose hash matches Product.feed_hash are skipped. New products are
+    only created when the mapping provides `defaults` for category and platform.
+    """
+
+    def __init__(self, supplier, chunk_size=5000, dry_run=False):
+        self.supplier = supplier
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+
+        mapping = supplier.feed_mapping or {}
+        self.fields = mapping.get('fields', {})
+        if 'external_id' not in self.fields:
+            raise FeedError(f"Feed mapping for {supplier} has no external_id column")
+
+        unknown = set(self.fields) - set(FEED_FIELDS) - {'external_id'}
+        if unknown:
+            raise FeedError(f"Feed mapping for {supplier} has unknown fields: {', '.join(sorted(unknown))}")
+
+        self.update_fields = [field for field in FEED_FIELDS if field in self.fields]
+
+        defaults = mapping.get('defaults', {})
+        self.category = self.platform = None
+        if defaults.get('category') and defaults.get('platform'):
+            self.category = Category.objects.get(slug=defaults['category'])
+            self.platform = Platform.objects.get(slug=defaults['platform'])
+
+        self.stats = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'unknown': 0, 'invalid': 0}
+
+    def map_row(self, row):
+        """
+        Map a raw feed row to (external_id, values, content hash). Raises
+        FeedError for a row that cannot be used.
+        """
+        raw = {field: row.get(column) for field, column in self.fields.items()}
+        if raw['external_id'] is None or raw['external_id'] == '':
+            raise FeedError("Row has no external_id")
+        content_hash = hashlib.sha1(
+            json.dumps(raw, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+
+        values = {}
+        for field in self.update_fields:
+            value = raw[field]
+            if field in ('price', 'sale_price'):
+                value = parse_price(value)
+            elif field == 'is_active':
+                value = parse_boolean(value)
+            elif value is None:
+                value = ''
+            else:
+                value = str(value)
+            values[field] = value
+
+        return str(raw['external_id']), values, content_hash
+
+    def run(self, records, progress=None):
+        """
+        Consume an iterable of feed rows. `progress` is called with the
+        running stats after every chunk. Rows that cannot be used are
+        skipped and counted as invalid, so one bad row does not stop the
+        rest of the feed.
+        """
+        chunk = {}
+        for row in records:
+            self.stats['rows'] += 1
+            try:
+                external_id, values, content_hash = self.map_row(row)
+            except FeedError:
+                self.stats['invalid'] += 1
+                continue
+            # Later rows for the same product win within a chunk
+            chunk[external_id] = (values, content_hash)
+
+            if len(chunk) >= self.chunk_size:
+                self.apply_chunk(chunk)
+                chunk = {}
+                if progress:
+                    progress(self.stats)
+
+        if chunk:
+            self.apply_chunk(chunk)
+            if progress:
+                progress(self.stats)
+
+        if not self.dry_run and (self.stats['updated'] or self.stats['created']):
+            invalidate_catalog()
+
+        return self.stats
+
+    def apply_chunk(self, chunk):
+        """Write one chunk of mapped rows with bulk updates and inserts."""
+        existing = Product.objects.filter(
+            supplier=self.supplier,
+            external_id__in=list(chunk),
+        ).only('id', 'external_id', 'feed_hash')
+
+        now = timezone.now()
+        to_update = []
+        for product in existing:
+            if product.external_id not in chunk:
+                # Duplicate external_id for this supplier, already handled
+                continue
+
+            values, content_hash = chunk.pop(product.external_id)
+            if 'price' in values and values['price'] is None:
+                # Every product has a price; a blank one would fail the whole chunk
+                self.stats['invalid'] += 1
+                continue
+            if product.feed_hash == content_hash:
+                self.stats['unchanged'] += 1
+                continue
+
+            for field, value in values.items():
+                setattr(product, field, value)
+            product.feed_hash = content_hash
+            product.updated_at = now
+            to_update.append(product)
+
+        to_create = []
+        if self.category and self.platform:
+            for external_id, (values, content_hash) in chunk.items():
+                if not values.get('name') or values.get('price') is None:
+                    self.stats['unknown'] += 1
+                    continue
+                to_create.append(Product(
+                    slug=slugify(f"{values['name']}-{self.supplier.pk}-{external_id}")[:255],
+                    category=self.category,
+                    platform=self.platform,
+                    supplier=self.supplier,
+                    external_id=external_id,
+                    is_external=True,
+                    feed_hash=content_hash,
+                    **values,
+                ))
+        else:
+            self.stats['unknown'] += len(chunk)
+
+        self.stats['updated'] += len(to_update)
+        self.stats['created'] += len(to_create)
+
+        if self.dry_run:
+            return
+
+        with transaction.atomic():
+            if to_update:
+                Product.objects.bulk_update(
+                    to_update, self.update_fields + ['feed_hash', 'updated_at'], batch_size=1000
+                )
+            if to_create:
+                Product.objects.bulk_create(to_create, batch_size=1000)
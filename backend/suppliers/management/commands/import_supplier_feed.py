@@ -0,0 +1,66 @@
+import resource
+import time
+from django.core.management.base import BaseCommand, CommandError
+from products.models import Supplier
+from suppliers.feeds import (
+    FeedError, FeedImporter, detect_format, open_feed,
+    iter_csv_records, iter_json_records,
+)
+
+
+class Command(BaseCommand):
+    help = "Stream a supplier price/stock feed file (CSV or JSON, optionally gzipped) into products."
+
+    def add_arguments(self, parser):
+        parser.add_argument('supplier_id', type=int)
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'json'], help="Feed format (detected from the file name by default).")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--progress-interval', type=float, default=5.0, help="Seconds between progress lines.")
+        parser.add_argument('--dry-run', action='store_true', help="Report changes without writing them.")
+
+    def handle(self, *args, **options):
+        try:
+            supplier = Supplier.objects.get(id=options['supplier_id'])
+        except Supplier.DoesNotExist:
+            raise CommandError(f"Supplier {options['supplier_id']} does not exist.")
+
+        try:
+            feed_format = options['format'] or supplier.feed_mapping.get('format') or detect_format(options['path'])
+            importer = FeedImporter(supplier, chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        except FeedError as e:
+            raise CommandError(str(e))
+
+        started = time.monotonic()
+        last_report = [started]
+
+        def progress(stats):
+            now = time.monotonic()
+            if now - last_report[0] < options['progress_interval']:
+                return
+            last_report[0] = now
+            elapsed = now - started
+            rate = stats['rows'] / elapsed if elapsed else 0
+            # ru_maxrss is reported in kilobytes on Linux
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            self.stdout.write(
+                f"{stats['rows']} rows ({rate:.0f} rows/s) - "
+                f"{stats['updated']} updated, {stats['created']} created, "
+                f"{stats['unchanged']} unchanged, {stats['unknown']} unknown, {stats['invalid']} invalid - "
+                f"peak RSS {peak_rss:.0f} MB"
+            )
+
+        with open_feed(options['path']) as stream:
+            records = iter_csv_records(stream) if feed_format == 'csv' else iter_json_records(stream)
+            try:
+                stats = importer.run(records, progress=progress)
+            except FeedError as e:
+                raise CommandError(str(e))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['rows']} rows in {elapsed:.1f}s: "
+            f"{stats['updated']} updated, {stats['created']} created, "
+            f"{stats['unchanged']} unchanged, {stats['unknown']} unknown, {stats['invalid']} invalid"
+            + (" (dry run)" if options['dry_run'] else "")
+        ))
@@ -0,0 +1,22 @@
+from django.db import models
+
+
+class SupplierStockUpdate(models.Model):
+    """
+    Stock/price delta pushed by a supplier, waiting to be applied.
+    Updates are coalesced per product when the pending batch is applied.
+    """
+    supplier = models.ForeignKey(
+        'products.Supplier',
+        on_delete=models.CASCADE,
+        related_name='stock_updates'
+    )
+    external_id = models.CharField(max_length=255)
+    changes = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.supplier.name} - {self.external_id}"
@@ -0,0 +1,161 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+from products.models import DigitalKey, SoldKey
+from .clients import SupplierClient, SupplierError
+
+
+class ProcurementError(SupplierError):
+    """
+    Keys for an order could not all be procured. `key_codes` holds the keys
+    that were bought, {product_id: [key_code]}.
+    """
+
+    def __init__(self, message, key_codes):
+        super().__init__(message)
+        self.key_codes = key_codes
+
+
+def purchase_keys(requests):
+    """
+    Purchase keys for several external products at once.
+
+    `requests` is a list of (product, quantity) tuples. Keys are requested in
+    batches per supplier, and different suppliers are called in parallel.
+    Returns a tuple of ({product_id: [key_code, ...]}, {supplier: error}).
+    """
+    by_supplier = defaultdict(list)
+    for product, quantity in requests:
+        if quantity > 0:
+            by_supplier[product.supplier].append((product, quantity))
+
+    if not by_supplier:
+        return {}, {}
+
+    def purchase_from_supplier(supplier, supplier_requests):
+        purchased = {}
+        try:
+            if supplier is None:
+                raise SupplierError("Product has no supplier")
+            client = SupplierClient(supplier)
+            for product, quantity in supplier_requests:
+                purchased[product.id] = client.purchase_keys(product.external_id, quantity)
+                if len(purchased[product.id]) < quantity:
+                    raise SupplierError(
+                        f"Got {len(purchased[product.id])} of {quantity} keys for {product.external_id}"
+                    )
+        except Exception as e:
+            return purchased, e
+        return purchased, None
+
+    key_codes = {}
+    errors = {}
+    max_workers = min(len(by_supplier), settings.SUPPLIER_MAX_PARALLEL_REQUESTS)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            supplier: executor.submit(purchase_from_supplier, supplier, supplier_requests)
+            for supplier, supplier_requests in by_supplier.items()
+        }
+        for supplier, future in futures.items():
+            purchased, error = future.result()
+            key_codes.update(purchased)
+            if error is not None:
+                errors[supplier] = error
+
+    return key_codes, errors
+
+
+def _sold_counts(order, items):
+    return dict(
+        SoldKey.objects.filter(order=order, product_id__in=[item.product_id for item in items])
+        .values('product_id')
+        .annotate(count=Count('id'))
+        .values_list('product_id', 'count')
+    )
+
+
+def buy_missing_keys(order, items):
+    """
+    Buy the keys the external items of an order need beyond what their
+    buffers hold, and record them as sold to the order straight away.
+
+    Called before the order is locked, so no transaction is held open
+    while suppliers are called. Keys already sold to the order by an
+    earlier, partly failed attempt count towards each item. If a supplier
+    fails it raises ProcurementError, once the keys bought from the others
+    are recorded.
+    """
+    already_sold = _sold_counts(order, items)
+    buffered = dict(
+        DigitalKey.objects.filter(product_id__in=[item.product_id for item in items if item.product.key_buffer_size > 0])
+        .values('product_id')
+        .annotate(count=Count('id'))
+        .values_list('product_id', 'count')
+    )
+
+    shortfall = []
+    for item in items:
+        needed = item.quantity - already_sold.get(item.product_id, 0) - buffered.get(item.product_id, 0)
+        if needed > 0:
+            shortfall.append((item.product, needed))
+
+    key_codes, errors = purchase_keys(shortfall)
+    sell_purchased_keys(order, key_codes)
+
+    if errors:
+        raise ProcurementError(
+            "Could not purchase keys from suppliers: "
+            + ", ".join(f"{supplier}: {error}" for supplier, error in errors.items()),
+            key_codes,
+        )
+
+
+def procure_external_keys(order, items):
+    """
+    Assign keys for the external items of an order, after buy_missing_keys().
+
+    Keys already sold to the order count towards each item, and the rest
+    are taken from each product's pre-purchased buffer. Returns the ids of
+    products whose buffer was drawn from, so the caller can schedule a
+    top-up.
+
+    Runs inside the caller's transaction and makes no supplier calls. If a
+    buffer was drained since the keys were bought, it raises
+    ProcurementError; a retry buys what is missing.
+    """
+    drawn_products = []
+    already_sold = _sold_counts(order, items)
+
+    for item in items:
+        product = item.product
+        needed = item.quantity - already_sold.get(product.id, 0)
+        if needed <= 0:
+            continue
+
+        if product.key_buffer_size > 0:
+            buffered = DigitalKey.allocate(product, needed, order, partial=True)
+            if buffered:
+                drawn_products.append(product.id)
+            needed -= len(buffered)
+
+        if needed > 0:
+            raise ProcurementError(f"{needed} keys for {product.name} are missing", {})
+
+    return drawn_products
+
+
+def sell_purchased_keys(order, key_codes):
+    """
+    Record keys bought for an order as sold to it. They are paid for even
+    if the order is not fulfilled this time, and products without a buffer
+    never draw from the pool, so a retry of the order uses them instead.
+    """
+    now = timezone.now()
+    SoldKey.objects.bulk_create([
+        SoldKey(product_id=product_id, key_code=key_code, order=order, sold_at=now, created_at=now)
+        for product_id, codes in key_codes.items()
+        for key_code in codes
+    ])
@@ -0,0 +1,17 @@
+from decimal import Decimal
+from rest_framework import serializers
+
+
+class StockDeltaSerializer(serializers.Serializer):
+    """A single product stock/price change pushed by a supplier."""
+    external_id = serializers.CharField(max_length=255)
+    stock = serializers.IntegerField(min_value=0, required=False)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'), required=False)
+    sale_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal('0.01'), required=False, allow_null=True
+    )
+
+
+class SupplierStockWebhookSerializer(serializers.Serializer):
+    """Payload of a supplier stock webhook notification."""
+    updates = serializers.ListField(child=StockDeltaSerializer(), allow_empty=False, max_length=10000)
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _stock_key(product_id):
+    return f'external-stock:{product_id}'
+
+
+def get_external_stock(product_id):
+    """Return the cached supplier stock for a product, or None if unknown."""
+    return cache.get(_stock_key(product_id))
+
+
+def get_external_stock_many(product_ids):
+    """Return {product_id: stock} for the products with cached stock."""
+    keys = {_stock_key(product_id): product_id for product_id in product_ids}
+    return {keys[key]: stock for key, stock in cache.get_many(list(keys)).items()}
+
+
+def set_external_stock_many(stock_by_product):
+    """Store supplier stock levels for several products at once."""
+    cache.set_many(
+        {_stock_key(product_id): stock for product_id, stock in stock_by_product.items()},
+        timeout=settings.EXTERNAL_STOCK_CACHE_TIMEOUT,
+    )
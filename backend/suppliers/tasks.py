@@ -0,0 +1,173 @@
+from decimal import Decimal
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from products.cache import invalidate_catalog
+from products.models import Product, DigitalKey, Supplier
+from .clients import SupplierClient
+from .models import SupplierStockUpdate
+from .procurement import purchase_keys
+from .stock import set_external_stock_many
+
+
+# Held while a product's buffer is counted and topped up, so the periodic
+# run and a refill queued after fulfillment cannot buy the same shortfall
+KEY_BUFFER_LOCK_TIMEOUT = 10 * 60
+
+
+def _key_buffer_lock(product_id):
+    return f'key-buffer-refill:{product_id}'
+
+
+@shared_task
+def refill_key_buffers(product_ids=None):
+    """
+    Top up the pre-purchased key buffer of external products.
+    Runs periodically, and after fulfillment draws keys from a buffer.
+    Products another run is already refilling are skipped.
+    """
+    products = Product.objects.filter(
+        is_active=True,
+        is_external=True,
+        key_buffer_size__gt=0,
+        supplier__active=True,
+    )
+
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+
+    locked = [
+        product_id for product_id in products.values_list('id', flat=True)
+        if cache.add(_key_buffer_lock(product_id), True, timeout=KEY_BUFFER_LOCK_TIMEOUT)
+    ]
+    if not locked:
+        return "Refilled 0 buffered keys (0 supplier errors)"
+
+    try:
+        # Counted only once locked, so keys added by a previous run are seen
+        products = Product.objects.filter(id__in=locked).select_related('supplier').annotate(
+            buffered_keys=Count('keys')
+        )
+        requests = [
+            (product, product.key_buffer_size - product.buffered_keys)
+            for product in products
+            if product.buffered_keys < product.key_buffer_size
+        ]
+
+        key_codes, errors = purchase_keys(requests)
+
+        DigitalKey.objects.bulk_create([
+            DigitalKey(product_id=product_id, key_code=key_code)
+            for product_id, codes in key_codes.items()
+            for key_code in codes
+        ])
+    finally:
+        cache.delete_many([_key_buffer_lock(product_id) for product_id in locked])
+
+    refilled = sum(len(codes) for codes in key_codes.values())
+    return f"Refilled {refilled} buffered keys ({len(errors)} supplier errors)"
+
+
+def apply_stock_changes(supplier, changes_by_external_id):
+    """
+    Apply coalesced {external_id: {field: value}} changes to the supplier's
+    products: prices are written with one bulk update and stock levels go
+    to the external stock cache.
+    """
+    products = Product.objects.filter(
+        supplier=supplier,
+        external_id__in=list(changes_by_external_id),
+    ).only('id', 'external_id', 'price', 'sale_price')
+
+    now = timezone.now()
+    stock = {}
+    to_update = []
+    for product in products:
+        changes = changes_by_external_id[product.external_id]
+
+        if 'stock' in changes:
+            stock[product.id] = changes['stock']
+
+        changed = False
+        for field in ('price', 'sale_price'):
+            if field in changes:
+                value = Decimal(changes[field]) if changes[field] is not None else None
+                if getattr(product, field) != value:
+                    setattr(product, field, value)
+                    changed = True
+        if changed:
+            product.updated_at = now
+            to_update.append(product)
+
+    if to_update:
+        Product.objects.bulk_update(to_update, ['price', 'sale_price', 'updated_at'], batch_size=1000)
+        invalidate_catalog()
+    if stock:
+        set_external_stock_many(stock)
+
+    return len(to_update), len(stock)
+
+
+@shared_task
+def apply_supplier_stock_updates(supplier_id):
+    """
+    Apply the stock/price deltas pushed by a supplier since the last run,
+    keeping only the latest value of each field per product.
+    """
+    supplier = Supplier.objects.get(id=supplier_id)
+
+    with transaction.atomic():
+        pending = list(
+            SupplierStockUpdate.objects.select_for_update()
+            .filter(supplier=supplier)
+            .values_list('id', 'external_id', 'changes')
+        )
+        if not pending:
+            return "No pending stock updates"
+
+        coalesced = {}
+        for _, external_id, changes in pending:
+            coalesced.setdefault(external_id, {}).update(changes)
+
+        updated, stocked = apply_stock_changes(supplier, coalesced)
+        # Only the rows read above: one with a lower id may have committed
+        # since, and is left for the next run
+        SupplierStockUpdate.objects.filter(id__in=[row[0] for row in pending]).delete()
+
+    # Deltas that arrived while this run was applying go in the next window
+    window = settings.SUPPLIER_PUSH_COALESCE_WINDOW
+    if SupplierStockUpdate.objects.filter(supplier=supplier).exists():
+        if cache.add(f'supplier-stock-apply:{supplier.id}', True, timeout=window):
+            apply_supplier_stock_updates.apply_async((supplier.id,), countdown=window)
+
+    return f"Applied {len(pending)} updates: {updated} prices, {stocked} stock levels"
+
+
+@shared_task
+def sync_supplier_stock(supplier_id, batch_size=500):
+    """
+    Poll a supplier for the stock and prices of all of its products.
+    """
+    supplier = Supplier.objects.get(id=supplier_id)
+    client = SupplierClient(supplier)
+
+    external_ids = (
+        Product.objects.filter(supplier=supplier, is_active=True, external_id__isnull=False)
+        .values_list('external_id', flat=True)
+        .iterator()
+    )
+
+    batch = []
+    synced = 0
+    for external_id in external_ids:
+        batch.append(external_id)
+        if len(batch) >= batch_size:
+            synced += apply_stock_changes(supplier, client.fetch_stock(batch))[1]
+            batch = []
+    if batch:
+        synced += apply_stock_changes(supplier, client.fetch_stock(batch))[1]
+
+    return f"Synced stock for {synced} products from {supplier.name}"
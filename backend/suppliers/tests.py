@@ -0,0 +1,332 @@
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import time
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from orders.benchmarks import create_order, create_user
+from orders.fulfillment import fulfill_order
+from orders.models import Order
+from orders.tasks import send_order_confirmation_email
+from products.benchmarks import create_catalog
+from products.models import DigitalKey, Product, SoldKey, Supplier
+from . import clients, tasks
+from .clients import CircuitBreaker, SupplierClient, SupplierError, SupplierUnavailable
+from .feeds import FeedImporter
+from .models import SupplierStockUpdate
+from .procurement import ProcurementError, buy_missing_keys, procure_external_keys, purchase_keys, sell_purchased_keys
+from .stock import get_external_stock
+from .tasks import _key_buffer_lock, apply_supplier_stock_updates, refill_key_buffers
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProcurementTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.working = Supplier.objects.create(name="Working", api_url='https://working.example.com')
+        self.failing = Supplier.objects.create(name="Failing", api_url='https://failing.example.com')
+        self.bought = create_catalog(1, keys_per_product=0, is_external=True, supplier=self.working)[0]
+        self.missing = create_catalog(1, keys_per_product=0, is_external=True, supplier=self.failing)[0]
+        self.order = create_order(create_user(), [self.bought, self.missing], quantity=2)
+        self.items = list(self.order.items.select_related('product__supplier'))
+
+    def purchase(self, supplier_client, external_id, quantity):
+        if supplier_client.supplier == self.failing:
+            raise SupplierError("Supplier is down")
+        return [f'{external_id}-{n}' for n in range(quantity)]
+
+    def fail_once(self):
+        with mock.patch.object(SupplierClient, 'purchase_keys', autospec=True, side_effect=self.purchase):
+            with self.assertRaises(ProcurementError) as raised:
+                buy_missing_keys(self.order, self.items)
+        return raised.exception
+
+    def test_failure_records_the_keys_already_bought(self):
+        error = self.fail_once()
+
+        codes = [f'{self.bought.external_id}-0', f'{self.bought.external_id}-1']
+        self.assertEqual(error.key_codes, {self.bought.id: codes})
+        self.assertCountEqual(SoldKey.objects.filter(order=self.order).values_list('key_code', flat=True), codes)
+        # Nothing goes to the pool of a product without a buffer
+        self.assertFalse(DigitalKey.objects.filter(product=self.bought).exists())
+
+    def test_retry_only_buys_what_is_still_missing(self):
+        self.fail_once()
+
+        with mock.patch.object(SupplierClient, 'purchase_keys', autospec=True, return_value=['KEY-1', 'KEY-2']) as purchase:
+            buy_missing_keys(self.order, self.items)
+            procure_external_keys(self.order, self.items)
+
+        purchase.assert_called_once()
+        self.assertEqual(purchase.call_args.args[2], 2)
+        self.assertEqual(SoldKey.objects.filter(order=self.order).count(), 4)
+
+    def test_buffered_keys_are_not_bought(self):
+        Product.objects.filter(pk=self.missing.pk).update(key_buffer_size=5)
+        DigitalKey.objects.create(product=self.missing, key_code='BUFFERED-1')
+        items = list(self.order.items.select_related('product__supplier'))
+
+        with mock.patch.object(SupplierClient, 'purchase_keys', autospec=True, side_effect=self.purchase) as purchase:
+            with self.assertRaises(ProcurementError):
+                buy_missing_keys(self.order, items)
+        self.assertEqual(purchase.call_args.args[1:], (self.missing.external_id, 1))
+
+    def test_keys_drawn_from_a_buffer_since_buying_are_reported(self):
+        Product.objects.filter(pk=self.missing.pk).update(key_buffer_size=5)
+        items = list(self.order.items.select_related('product__supplier'))
+        sell_purchased_keys(self.order, {self.bought.id: ['KEY-1', 'KEY-2'], self.missing.id: ['KEY-3']})
+
+        with self.assertRaises(ProcurementError):
+            procure_external_keys(self.order, items)
+
+    def test_short_batch_is_a_supplier_error(self):
+        with mock.patch.object(SupplierClient, '_purchase_batch', return_value=[]) as purchase:
+            key_codes, errors = purchase_keys([(self.bought, 2)])
+
+        purchase.assert_called_once()
+        self.assertEqual(key_codes, {self.bought.id: []})
+        self.assertIsInstance(errors[self.working], SupplierError)
+
+    def test_fulfillment_calls_suppliers_before_locking_the_order(self):
+        Order.objects.filter(pk=self.order.pk).update(status='PAID')
+        # Suppliers are called from worker threads; this is the caller's connection
+        caller = connections['default']
+        depth = len(caller.atomic_blocks)
+        depths = []
+
+        def purchase(supplier_client, external_id, quantity):
+            depths.append(len(caller.atomic_blocks))
+            return [f'{external_id}-{n}' for n in range(quantity)]
+
+        with mock.patch.object(SupplierClient, 'purchase_keys', autospec=True, side_effect=purchase), \
+                mock.patch.object(send_order_confirmation_email, 'delay'):
+            self.assertTrue(fulfill_order(self.order, raise_errors=True))
+
+        self.assertEqual(depths, [depth, depth])
+        self.assertEqual(SoldKey.objects.filter(order=self.order).count(), 4)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SUPPLIER_CIRCUIT_FAILURE_THRESHOLD=2, SUPPLIER_CIRCUIT_RESET_TIMEOUT=60)
+class CircuitBreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker('test')
+        patch = mock.patch.object(clients.time, 'time', return_value=1000.0)
+        self.clock = patch.start()
+        self.addCleanup(patch.stop)
+
+    def fail(self):
+        with self.assertRaises(SupplierError):
+            self.breaker.call(mock.Mock(side_effect=SupplierError))
+
+    def test_opens_after_the_failure_threshold(self):
+        self.fail()
+        self.assertTrue(self.breaker.allow_request())
+        self.fail()
+
+        call = mock.Mock()
+        with self.assertRaises(SupplierUnavailable):
+            self.breaker.call(call)
+        call.assert_not_called()
+
+    def test_half_open_lets_one_trial_through(self):
+        self.fail()
+        self.fail()
+        self.clock.return_value += 60
+
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_failed_trial_opens_the_circuit_again(self):
+        self.fail()
+        self.fail()
+        self.clock.return_value += 60
+        self.fail()
+
+        self.clock.return_value += 30
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_success_closes_the_circuit(self):
+        self.fail()
+        self.fail()
+        self.clock.return_value += 60
+
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+        self.fail()
+        self.assertTrue(self.breaker.allow_request())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RefillKeyBuffersTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        supplier = Supplier.objects.create(name="Supplier", api_url='https://supplier.example.com')
+        self.product = create_catalog(1, keys_per_product=1, is_external=True, supplier=supplier, key_buffer_size=3)[0]
+
+    def test_tops_up_the_shortfall(self):
+        with mock.patch.object(SupplierClient, 'purchase_keys', return_value=['KEY-1', 'KEY-2']) as purchase:
+            refill_key_buffers([self.product.id])
+
+        purchase.assert_called_once_with(self.product.external_id, 2)
+        self.assertEqual(DigitalKey.objects.filter(product=self.product).count(), 3)
+        self.assertTrue(cache.add(_key_buffer_lock(self.product.id), True))
+
+    def test_skips_products_another_run_is_refilling(self):
+        cache.add(_key_buffer_lock(self.product.id), True)
+        with mock.patch.object(SupplierClient, 'purchase_keys') as purchase:
+            refill_key_buffers([self.product.id])
+
+        purchase.assert_not_called()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SupplierStockWebhookTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.supplier = Supplier.objects.create(
+            name="Supplier", api_url='https://supplier.example.com', api_secret='secret'
+        )
+        self.product = create_catalog(1, keys_per_product=0, is_external=True, supplier=self.supplier, external_id='EXT-1')[0]
+        self.client = APIClient()
+        patch = mock.patch.object(apply_supplier_stock_updates, 'apply_async')
+        self.schedule = patch.start()
+        self.addCleanup(patch.stop)
+
+    def post(self, updates, secret='secret', timestamp=None):
+        body = json.dumps({'updates': updates}).encode()
+        timestamp = str(int(time.time()) if timestamp is None else timestamp)
+        signature = hmac.new(secret.encode(), timestamp.encode() + b'.' + body, hashlib.sha256).hexdigest()
+        return self.client.generic(
+            'POST', f'/api/webhooks/suppliers/{self.supplier.id}/stock/', body,
+            content_type='application/json',
+            HTTP_X_SUPPLIER_TIMESTAMP=timestamp, HTTP_X_SUPPLIER_SIGNATURE=signature,
+        )
+
+    def test_signed_updates_are_stored_and_applied_once(self):
+        for stock in (5, 6):
+            self.assertEqual(self.post([{'external_id': self.product.external_id, 'stock': stock}]).status_code, 202)
+
+        self.assertEqual(SupplierStockUpdate.objects.count(), 2)
+        self.schedule.assert_called_once_with((self.supplier.id,), countdown=settings.SUPPLIER_PUSH_COALESCE_WINDOW)
+
+    def test_bad_signatures_are_rejected(self):
+        update = [{'external_id': self.product.external_id, 'stock': 5}]
+        for response in (
+            self.post(update, secret='wrong'),
+            self.post(update, timestamp=int(time.time()) - settings.SUPPLIER_WEBHOOK_TOLERANCE - 1),
+        ):
+            self.assertEqual(response.status_code, 403)
+
+        Supplier.objects.filter(pk=self.supplier.pk).update(api_secret='')
+        self.assertEqual(self.post(update, secret='').status_code, 403)
+        self.assertFalse(SupplierStockUpdate.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ApplySupplierStockUpdatesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.supplier = Supplier.objects.create(name="Supplier", api_url='https://supplier.example.com')
+        self.product = create_catalog(1, keys_per_product=0, is_external=True, supplier=self.supplier, external_id='EXT-1')[0]
+
+    def push(self, changes, **fields):
+        return SupplierStockUpdate.objects.create(
+            supplier=self.supplier, external_id=self.product.external_id, changes=changes, **fields
+        )
+
+    def test_last_value_of_each_field_wins(self):
+        self.push({'stock': 5, 'price': '10.00'})
+        self.push({'stock': 3, 'sale_price': '8.00'})
+        self.push({'price': '12.00'})
+
+        apply_supplier_stock_updates(self.supplier.id)
+
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.price, product.sale_price), (Decimal('12.00'), Decimal('8.00')))
+        self.assertEqual(get_external_stock(self.product.id), 3)
+        self.assertFalse(SupplierStockUpdate.objects.exists())
+
+    def test_update_committed_during_a_run_is_kept(self):
+        self.push({'stock': 5}, id=10)
+        self.push({'stock': 6}, id=20)
+
+        def apply(supplier, changes):
+            # Took an id before the run read the table, but committed after
+            self.push({'stock': 7}, id=15)
+            return 0, 1
+
+        with mock.patch.object(tasks, 'apply_stock_changes', side_effect=apply), \
+                mock.patch.object(apply_supplier_stock_updates, 'apply_async'):
+            apply_supplier_stock_updates(self.supplier.id)
+
+        self.assertEqual(list(SupplierStockUpdate.objects.values_list('id', flat=True)), [15])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FeedImporterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.supplier = Supplier.objects.create(
+            name="Feed", api_url='https://feed.example.com',
+            feed_mapping={
+                'fields': {'external_id': 'sku', 'name': 'title', 'price': 'price'},
+                'defaults': {'category': 'benchmark', 'platform': 'benchmark'},
+            },
+        )
+        self.product = create_catalog(1, is_external=True, supplier=self.supplier, external_id='SKU-1')[0]
+
+    def test_malformed_rows_are_skipped_and_counted(self):
+        stats = FeedImporter(self.supplier).run([
+            {'sku': 'SKU-1', 'title': "Updated", 'price': '9.99'},
+            {'sku': 'SKU-2', 'title': "Bad price", 'price': 'n/a'},
+            {'sku': '', 'title': "No sku", 'price': '1.00'},
+            {'sku': 'SKU-3', 'title': "New", 'price': '4.50'},
+        ])
+
+        self.assertEqual((stats['rows'], stats['invalid'], stats['updated'], stats['created']), (4, 2, 1, 1))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.price), ("Updated", Decimal('9.99')))
+        self.assertEqual(
+            set(Product.objects.filter(supplier=self.supplier).values_list('external_id', flat=True)),
+            {'SKU-1', 'SKU-3'},
+        )
+
+    def test_blank_price_does_not_fail_the_chunk(self):
+        create_catalog(1, is_external=True, supplier=self.supplier, external_id='SKU-2')
+        stats = FeedImporter(self.supplier).run([
+            {'sku': 'SKU-1', 'title': "No price", 'price': ''},
+            {'sku': 'SKU-2', 'title': "Updated", 'price': '9.99'},
+        ])
+
+        self.assertEqual((stats['invalid'], stats['updated']), (1, 1))
+        self.assertEqual(Product.objects.get(pk=self.product.pk).price, self.product.price)
+        self.assertEqual(Product.objects.get(external_id='SKU-2').name, "Updated")
+
+    def test_command_reports_invalid_rows(self):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w') as feed:
+            feed.write("sku,title,price\nSKU-1,Updated,9.99\nSKU-2,Bad price,n/a\n")
+        out = StringIO()
+
+        call_command('import_supplier_feed', self.supplier.id, path, stdout=out)
+
+        self.assertIn("1 updated, 0 created, 0 unchanged, 0 unknown, 1 invalid", out.getvalue())
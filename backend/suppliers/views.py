@@ -0,0 +1,85 @@
+import hashlib
+import hmac
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework import generics, status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from products.models import Supplier
+from .models import SupplierStockUpdate
+from .serializers import SupplierStockWebhookSerializer
+from .tasks import apply_supplier_stock_updates
+
+
+class SupplierStockWebhookView(generics.GenericAPIView):
+    """
+    Endpoint for supplier stock/price webhooks.
+    
+    Requests are signed with the supplier's API secret: the
+    X-Supplier-Signature header holds the hex HMAC-SHA256 of
+    "<X-Supplier-Timestamp>.<raw body>".
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    serializer_class = SupplierStockWebhookSerializer
+    
+    def post(self, request, supplier_id, *args, **kwargs):
+        try:
+            supplier = Supplier.objects.get(id=supplier_id, active=True)
+        except Supplier.DoesNotExist:
+            return Response(
+                {"error": "Unknown supplier"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        if not self._verify_signature(request, supplier):
+            return Response(
+                {"error": "Invalid signature"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        # Store the deltas; they are coalesced per product when applied
+        SupplierStockUpdate.objects.bulk_create([
+            SupplierStockUpdate(
+                supplier=supplier,
+                external_id=update.pop('external_id'),
+                changes={
+                    field: str(value) if value is not None and field != 'stock' else value
+                    for field, value in update.items()
+                },
+            )
+            for update in serializer.validated_data['updates']
+        ])
+        
+        Supplier.objects.filter(id=supplier.id).update(last_push_at=timezone.now())
+        
+        # Schedule one apply run per supplier per coalescing window
+        window = settings.SUPPLIER_PUSH_COALESCE_WINDOW
+        if cache.add(f'supplier-stock-apply:{supplier.id}', True, timeout=window):
+            apply_supplier_stock_updates.apply_async((supplier.id,), countdown=window)
+        
+        return Response(status=status.HTTP_202_ACCEPTED)
+    
+    def _verify_signature(self, request, supplier):
+        """Check the request HMAC and reject stale timestamps."""
+        signature = request.META.get('HTTP_X_SUPPLIER_SIGNATURE', '')
+        timestamp = request.META.get('HTTP_X_SUPPLIER_TIMESTAMP', '')
+        
+        if not supplier.api_secret or not signature or not timestamp.isdigit():
+            return False
+        
+        if abs(time.time() - int(timestamp)) > settings.SUPPLIER_WEBHOOK_TOLERANCE:
+            return False
+        
+        expected = hmac.new(
+            supplier.api_secret.encode('utf-8'),
+            timestamp.encode('utf-8') + b'.' + request.body,
+            hashlib.sha256
+        ).hexdigest()
+        
+        return hmac.compare_digest(expected, signature)
@@ -0,0 +1,58 @@
+from django.contrib import admin
+from django.contrib.auth import forms as auth_forms
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from api.admin_utils import LargeTableAdmin, export_as_csv
+from .models import User, CashbackTransaction
+
+
+class UserCreationForm(auth_forms.UserCreationForm):
+    
+    class Meta(auth_forms.UserCreationForm.Meta):
+        model = User
+        fields = ('email', 'username')
+
+
+class UserChangeForm(auth_forms.UserChangeForm):
+    
+    class Meta(auth_forms.UserChangeForm.Meta):
+        model = User
+
+
+@admin.register(User)
+class UserAdmin(BaseUserAdmin):
+    form = UserChangeForm
+    add_form = UserCreationForm
+    add_fieldsets = (
+        (None, {
+            'classes': ('wide',),
+            'fields': ('email', 'username', 'password1', 'password2'),
+        }),
+    )
+    list_display = ['email', 'username', 'cashback_balance', 'is_staff', 'is_active', 'date_joined']
+    list_filter = ['is_staff', 'is_superuser', 'is_active']
+    search_fields = ['=email', 'username']
+    ordering = ['-date_joined']
+    fieldsets = BaseUserAdmin.fieldsets + (
+        ('Cashback', {'fields': ('cashback_balance',)}),
+    )
+    paginator = LargeTableAdmin.paginator
+    show_full_result_count = False
+
+
+@admin.register(CashbackTransaction)
+class CashbackTransactionAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'transaction_type', 'amount', 'description', 'timestamp']
+    list_select_related = ['user']
+    list_filter = ['transaction_type']
+    search_fields = ['=user__email']
+    raw_id_fields = ['user']
+    actions = [
+        export_as_csv([
+            ('id', 'ID'),
+            ('user__email', 'User'),
+            ('transaction_type', 'Type'),
+            ('amount', 'Amount'),
+            ('description', 'Description'),
+            ('timestamp', 'Timestamp'),
+        ], 'cashback-transactions.csv'),
+    ]
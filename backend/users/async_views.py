@@ -0,0 +1,19 @@
+from asgiref.sync import sync_to_async
+from rest_framework import exceptions
+from api.async_views import AsyncAPIView
+from .authentication import JWTAuthentication
+from .serializers import UserSerializer
+
+
+class AsyncUserMeView(AsyncAPIView):
+    """
+    Async API endpoint for the current user's profile.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        user = await JWTAuthentication().aauthenticate(request)
+        if user is None:
+            raise exceptions.NotAuthenticated()
+
+        data = await sync_to_async(lambda: UserSerializer(user).data)()
+        return self.render(data)
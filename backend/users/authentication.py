@@ -0,0 +1,133 @@
+import secrets
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user as get_session_user
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def _user_version_key(user_id):
+    return f'auth-user-version:{user_id}'
+
+
+def _user_cache_key(user_id, version, validated_token):
+    # Tokens issued before a password change look up their own entry
+    password_hash = validated_token.get(api_settings.REVOKE_TOKEN_CLAIM, '')
+    return f'auth-user:{user_id}:{version}:{password_hash}'
+
+
+def _get_user_version(user_id):
+    version = cache.get(_user_version_key(user_id))
+    if version is None:
+        cache.add(_user_version_key(user_id), secrets.token_hex(8), timeout=None)
+        version = cache.get(_user_version_key(user_id))
+    return version
+
+
+async def _aget_user_version(user_id):
+    version = await cache.aget(_user_version_key(user_id))
+    if version is None:
+        await cache.aadd(_user_version_key(user_id), secrets.token_hex(8), timeout=None)
+        version = await cache.aget(_user_version_key(user_id))
+    return version
+
+
+def _bump_user_version(user_id):
+    cache.set(_user_version_key(user_id), secrets.token_hex(8), timeout=None)
+
+
+def invalidate_cached_user(user_id):
+    """
+    Drop a user from the authentication cache by moving it to a new
+    version. A request that loaded the old row before the change caches
+    it under the old version, where nothing looks it up. Inside a
+    transaction the old row stays visible until commit, so the version
+    moves again then.
+    """
+    _bump_user_version(user_id)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump_user_version(user_id))
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """
+    JWT authentication that resolves users from a short-lived cache instead
+    of loading the user row on every request, with an async entry point
+    for the ASGI views.
+
+    Cached users are keyed by a version that changes whenever the user is
+    saved (see User.save), and by the hash of the password the token
+    carries (CHECK_REVOKE_TOKEN), which is also checked against the user,
+    so password changes revoke existing tokens. Tokens without the hash
+    predate the setting and are accepted for the rest of their lifetime.
+    """
+
+    def get_user(self, validated_token):
+        user_id = self._get_user_id(validated_token)
+        cache_key = _user_cache_key(user_id, _get_user_version(user_id), validated_token)
+
+        user = cache.get(cache_key)
+        if user is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed("User not found", code="user_not_found")
+            cache.set(cache_key, user, timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+
+        self._check_user(user, validated_token)
+        return user
+
+    async def aauthenticate(self, request):
+        """
+        Async version of authenticate(), falling back to the session user
+        like the SessionAuthentication class configured after this one.
+        Returns the user, or None for anonymous requests.
+        """
+        header = self.get_header(request)
+        raw_token = self.get_raw_token(header) if header is not None else None
+
+        if raw_token is not None:
+            validated_token = self.get_validated_token(raw_token)
+            return await self.aget_user(validated_token)
+
+        user = await sync_to_async(get_session_user)(request)
+        return user if user.is_authenticated and user.is_active else None
+
+    async def aget_user(self, validated_token):
+        """Async version of get_user(), using the async ORM."""
+        user_id = self._get_user_id(validated_token)
+        cache_key = _user_cache_key(user_id, await _aget_user_version(user_id), validated_token)
+
+        user = await cache.aget(cache_key)
+        if user is None:
+            try:
+                user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed("User not found", code="user_not_found")
+            await cache.aset(cache_key, user, timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+
+        self._check_user(user, validated_token)
+        return user
+
+    def _get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+    def _check_user(self, user, validated_token):
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+
+        # Tokens issued before they carried the password hash are accepted
+        # until they expire; TokenRefreshSerializer does not rotate them
+        password_hash = validated_token.get(api_settings.REVOKE_TOKEN_CLAIM)
+        if api_settings.CHECK_REVOKE_TOKEN and password_hash is not None:
+            if password_hash != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    "The user's password has been changed.", code="password_changed"
+                )
@@ -12,7 +12,7 @@ class User(AbstractUser):
     cashback_balance = models.DecimalField(
         max_digits=10, 
         decimal_places=2, 
-        default=0.00,
+        default=Decimal('0.00'),
         validators=[MinValueValidator(Decimal('0.00'))]
     )
     
@@ -27,6 +27,17 @@ class User(AbstractUser):
     def __str__(self):
         return self.email
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Password, active and staff changes must reach authentication at once
+        from .authentication import invalidate_cached_user
+        invalidate_cached_user(self.pk)
+    
+    def delete(self, *args, **kwargs):
+        from .authentication import invalidate_cached_user
+        invalidate_cached_user(self.pk)
+        return super().delete(*args, **kwargs)
+    
     def add_cashback(self, amount):
         """
         Add cashback to user's balance.
@@ -95,6 +106,39 @@ class CashbackTransaction(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp']),
+        ]
+    
+    def __str__(self):
+        return f"{self.transaction_type} - {self.amount} - {self.user.email}"
+
+
+class ArchivedCashbackTransaction(models.Model):
+    """
+    Old cashback transaction moved out of the live table by the
+    archive_orders command. Columns match CashbackTransaction so both
+    tables can be listed together with a UNION.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_cashback_transactions'
+    )
+    timestamp = models.DateTimeField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    transaction_type = models.CharField(
+        max_length=10,
+        choices=CashbackTransaction.TRANSACTION_TYPES
+    )
+    description = models.CharField(max_length=255)
+    
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['user', 'timestamp']),
+        ]
     
     def __str__(self):
         return f"{self.transaction_type} - {self.amount} - {self.user.email}"
\ No newline at end of file
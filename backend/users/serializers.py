@@ -1,5 +1,10 @@
 from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
 from .models import User, CashbackTransaction
+from .tokens import RefreshToken, is_token_blacklisted
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -9,6 +14,13 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'email', 'username', 'first_name', 'last_name', 'cashback_balance']
         read_only_fields = ['id', 'email', 'cashback_balance']
+    
+    def update(self, instance, validated_data):
+        """Save only the submitted fields, so a stale copy of the user cannot overwrite its balance."""
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -86,4 +98,30 @@ class CashbackTransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = CashbackTransaction
         fields = ['id', 'timestamp', 'amount', 'transaction_type', 'description']
-        read_only_fields = fields
\ No newline at end of file
+        read_only_fields = fields
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    """
+    Token refresh that blacklists rotated refresh tokens in the cache.
+    Refresh tokens issued before tokens carried the password hash still
+    get access tokens, but are not rotated, so they run out within one
+    refresh lifetime.
+    """
+    token_class = RefreshToken
+    
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if api_settings.CHECK_REVOKE_TOKEN and api_settings.REVOKE_TOKEN_CLAIM not in refresh:
+            return {'access': str(refresh.access_token)}
+        return super().validate(attrs)
+
+
+class TokenVerifySerializer(jwt_serializers.TokenVerifySerializer):
+    """Token verification that also rejects blacklisted tokens."""
+    
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        if is_token_blacklisted(UntypedToken(attrs['token'])):
+            raise serializers.ValidationError("Token is blacklisted")
+        return data
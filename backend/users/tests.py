@@ -0,0 +1,93 @@
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from orders.benchmarks import create_user
+from .authentication import JWTAuthentication
+from .models import User
+from .tokens import RefreshToken
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class JWTAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.token = RefreshToken.for_user(self.user).access_token
+        self.authentication = JWTAuthentication()
+
+    def test_cached_user_is_reused_until_saved(self):
+        self.authentication.get_user(self.token)
+        with self.assertNumQueries(0):
+            self.authentication.get_user(self.token)
+
+        self.user.add_cashback(Decimal('5.00'))
+        self.assertEqual(self.authentication.get_user(self.token).cashback_balance, Decimal('5.00'))
+
+    def test_save_during_a_cache_miss_does_not_leave_the_old_row_cached(self):
+        load = User.objects.get
+
+        def load_then_saved_elsewhere(**lookup):
+            user = load(**lookup)
+            load(pk=user.pk).add_cashback(Decimal('5.00'))
+            return user
+
+        with mock.patch.object(User.objects, 'get', side_effect=load_then_saved_elsewhere):
+            self.assertEqual(self.authentication.get_user(self.token).cashback_balance, Decimal('0.00'))
+
+        self.assertEqual(self.authentication.get_user(self.token).cashback_balance, Decimal('5.00'))
+
+    def test_password_change_revokes_tokens_of_a_cached_user(self):
+        self.authentication.get_user(self.token)
+        self.user.set_password('changed')
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(self.token)
+        self.authentication.get_user(RefreshToken.for_user(self.user).access_token)
+
+    def test_tokens_without_the_password_hash_last_until_they_expire(self):
+        refresh = RefreshToken.for_user(self.user)
+        del refresh[api_settings.REVOKE_TOKEN_CLAIM]
+        self.assertEqual(self.authentication.get_user(refresh.access_token), self.user)
+
+        response = APIClient().post('/api/token/refresh/', {'refresh': str(refresh)}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('refresh', response.data)
+        access = self.authentication.get_validated_token(response.data['access'])
+        self.assertNotIn(api_settings.REVOKE_TOKEN_CLAIM, access)
+        self.assertEqual(self.authentication.get_user(access), self.user)
+
+        # Tokens with the hash are still rotated
+        response = APIClient().post('/api/token/refresh/', {'refresh': str(RefreshToken.for_user(self.user))}, format='json')
+        self.assertIn('refresh', response.data)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class UpdateProfileTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def test_update_keeps_a_balance_changed_since_authentication(self):
+        # Cache the user as authenticated, then change the balance under it
+        self.client.get('/api/users/me/')
+        User.objects.filter(pk=self.user.pk).update(cashback_balance=Decimal('5.00'))
+
+        response = self.client.patch('/api/users/update_profile/', {'first_name': 'New'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['cashback_balance'], '5.00')
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual((user.first_name, user.cashback_balance), ('New', Decimal('5.00')))
@@ -0,0 +1,36 @@
+import time
+from django.core.cache import cache
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+
+def _blacklist_key(jti):
+    return f'jwt-blacklist:{jti}'
+
+
+def blacklist_token(token):
+    """Blacklist a token until it expires, using its jti as the cache key."""
+    ttl = int(token.payload.get('exp', 0) - time.time())
+    if ttl > 0:
+        cache.set(_blacklist_key(token.payload[api_settings.JTI_CLAIM]), True, timeout=ttl)
+
+
+def is_token_blacklisted(token):
+    jti = token.payload.get(api_settings.JTI_CLAIM)
+    return jti is not None and cache.get(_blacklist_key(jti)) is not None
+
+
+class RefreshToken(tokens.RefreshToken):
+    """
+    Refresh token blacklisted through the cache instead of the
+    token_blacklist app's tables.
+    """
+
+    def verify(self, *args, **kwargs):
+        super().verify(*args, **kwargs)
+        if is_token_blacklisted(self):
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self):
+        blacklist_token(self)
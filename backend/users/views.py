@@ -2,8 +2,12 @@ from rest_framework import viewsets, generics, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework_simplejwt.tokens import RefreshToken
-from .models import User, CashbackTransaction
+from rest_framework_simplejwt import views as jwt_views
+from api.throttling import RegistrationThrottle, TokenObtainThrottle
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from .models import User, CashbackTransaction, ArchivedCashbackTransaction
+from .tokens import RefreshToken
 from .serializers import (
     UserSerializer, UserRegistrationSerializer,
     PasswordChangeSerializer, CashbackTransactionSerializer
@@ -30,7 +34,7 @@ class UserViewSet(viewsets.GenericViewSet):
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
     
-    @action(detail=False, methods=['post'])
+    @action(detail=False, methods=['post'], throttle_classes=[RegistrationThrottle])
     def register(self, request):
         """
         Register a new user.
@@ -62,7 +66,9 @@ class UserViewSet(viewsets.GenericViewSet):
         """
         Update current user profile.
         """
-        serializer = UserSerializer(request.user, data=request.data, partial=True)
+        # request.user may come from the authentication cache; answer with the current row
+        user = User.objects.get(pk=request.user.pk)
+        serializer = UserSerializer(user, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response(serializer.data)
@@ -74,8 +80,16 @@ class UserViewSet(viewsets.GenericViewSet):
         """
         serializer = self.get_serializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response({'message': 'Password changed successfully'})
+        user = serializer.save()
+        
+        # Existing tokens are revoked by the password change, so issue new ones
+        refresh = RefreshToken.for_user(user)
+        
+        return Response({
+            'message': 'Password changed successfully',
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+        })
 
 
 class CashbackTransactionViewSet(viewsets.ReadOnlyModelViewSet):
@@ -89,4 +103,23 @@ class CashbackTransactionViewSet(viewsets.ReadOnlyModelViewSet):
         """
         Only return transactions for the current user.
         """
-        return CashbackTransaction.objects.filter(user=self.request.user)
\ No newline at end of file
+        transactions = CashbackTransaction.objects.filter(user=self.request.user)
+        if self.action == 'list':
+            # Archived transactions have the same columns, so list them together
+            archived = ArchivedCashbackTransaction.objects.filter(user=self.request.user)
+            return transactions.order_by().union(archived.order_by(), all=True).order_by('-timestamp')
+        return transactions
+    
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            archived = ArchivedCashbackTransaction.objects.filter(user=self.request.user)
+            return get_object_or_404(archived, pk=self.kwargs['pk'])
+
+
+class TokenObtainPairView(jwt_views.TokenObtainPairView):
+    """
+    Obtain a JWT pair, throttled per IP and email before the password is checked.
+    """
+    throttle_classes = [TokenObtainThrottle]
\ No newline at end of file